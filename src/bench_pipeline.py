@@ -0,0 +1,251 @@
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from fake_services import FakeGoogleAPIs, FakePexels, FakeProfile, FakeSMTP, keyword_document, service_account_info
+
+# Scripts del pipeline que se ejecutan en cada corrida, en orden
+SCRIPTS = ['main.py', 'generate_video_archives.py']
+
+
+def parse_variant(spec):
+    """
+    'nombre:CLAVE=VALOR,CLAVE=VALOR' -> (nombre, {CLAVE: VALOR}).
+    """
+    name, _, assignments = spec.partition(':')
+    env = {}
+    for item in filter(None, assignments.split(',')):
+        key, _, value = item.partition('=')
+        env[key.strip()] = value.strip()
+    return name, env
+
+
+# Corre el script como __main__ y, al salir, escribe su propio pico de memoria. VmHWM es
+# del proceso ya reemplazado por exec; ru_maxrss de os.wait4 incluiría lo heredado del
+# fork desde el benchmark, que aloja los servidores simulados.
+_RSS_RUNNER = """
+import atexit, os, runpy, sys
+script, rss_path = sys.argv[1], sys.argv[2]
+
+def report_peak_rss():
+    peak = None
+    try:
+        with open('/proc/self/status', encoding='utf-8') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    peak = int(line.split()[1]) * 1024
+    except OSError:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    with open(rss_path, 'w', encoding='utf-8') as f:
+        f.write(str(peak))
+
+atexit.register(report_peak_rss)
+sys.argv = [script]
+sys.path.insert(0, os.path.dirname(script))
+runpy.run_path(script, run_name='__main__')
+"""
+
+
+def run_script(script, workdir, env, log_path):
+    """
+    Ejecuta 'script' en un proceso nuevo y retorna (código, segundos, pico_de_memoria_en_bytes).
+    El pico de memoria (RSS) lo informa el propio proceso al salir (VmHWM; en macOS,
+    getrusage), así no incluye la memoria del benchmark desde el que se lanzó.
+    """
+    src_dir = os.path.dirname(os.path.abspath(__file__))
+    rss_path = os.path.join(workdir, f".peak_rss_{os.path.splitext(script)[0]}")
+    if os.path.exists(rss_path):
+        os.remove(rss_path)
+    with open(log_path, 'ab') as log:
+        start = time.perf_counter()
+        code = subprocess.call([sys.executable, '-c', _RSS_RUNNER, os.path.join(src_dir, script), rss_path],
+                               cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+        elapsed = time.perf_counter() - start
+    peak_rss = 0
+    if os.path.exists(rss_path):
+        with open(rss_path, 'r', encoding='utf-8') as f:
+            peak_rss = int(f.read() or 0)
+    return code, elapsed, peak_rss
+
+
+class Bench:
+    """
+    Levanta Pexels, las APIs de Google y SMTP simulados y corre el pipeline contra ellos.
+    Cada corrida parte de un directorio de trabajo y un Drive simulado nuevos (salvo
+    'reuse_state'), con los mismos documentos y la misma semilla, para que las
+    variantes se comparen en igualdad de condiciones.
+    """
+
+    def __init__(self, profile, keywords, docs, scripts=SCRIPTS, reuse_state=False, keep=False):
+        self.profile = profile
+        self.keywords = keywords
+        self.docs = docs
+        self.scripts = scripts
+        self.reuse_state = reuse_state
+        self.keep = keep
+        self.pexels = FakePexels(profile).start()
+        self.google = FakeGoogleAPIs(profile).start()
+        self.smtp = FakeSMTP().start()
+        self.credentials = json.dumps(service_account_info(f"{self.google.url}/token"))
+        self.workdir = None
+
+    def close(self):
+        for server in (self.pexels, self.google, self.smtp):
+            server.stop()
+        if self.workdir and not self.keep:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def _seed_drive(self):
+        self.google.reset_store()
+        self.docs_folder = self.google.add_folder('docs')
+        self.videos_folder = self.google.add_folder('videos')
+        per_doc = max(1, self.keywords // self.docs)
+        for i in range(self.docs):
+            self.google.add_document(self.docs_folder, f"guion_{i + 1:02d}", keyword_document(per_doc, i * per_doc))
+
+    def _environment(self, workdir, overrides):
+        smtp_host, smtp_port = self.smtp.address
+        env = dict(os.environ)
+        env.update({
+            'DOCS_FOLDER_ID': self.docs_folder,
+            'VIDEOS_FOLDER_ID': self.videos_folder,
+            'RECIPIENT_EMAIL': 'bench@example.com',
+            'PEXELS_API_KEY': 'bench',
+            'PEXELS_API_URL': self.pexels.url,
+            'GCP_CREDENTIALS': self.credentials,
+            'GOOGLE_API_URL': self.google.url,
+            'GMAIL_USER': 'bench@example.com',
+            'GMAIL_APP_PASSWORD': 'bench',
+            'SMTP_HOST': smtp_host,
+            'SMTP_PORT': str(smtp_port),
+            'SMTP_SSL': '0',
+            'CACHE_DIR': os.path.join(workdir, '.cache'),
+            'METRICS_DIR': os.path.join(workdir, 'metrics'),
+            'DOCS_BATCH_MODE': '1' if self.docs > 1 else '',
+        })
+        env.update(overrides)
+        return env
+
+    def run(self, overrides, seed):
+        """
+        Corre los scripts una vez y retorna el resultado de cada uno.
+        """
+        if self.workdir is None or not self.reuse_state:
+            if self.workdir and not self.keep:
+                shutil.rmtree(self.workdir, ignore_errors=True)
+            self.workdir = tempfile.mkdtemp(prefix='bench_pipeline_')
+            self._seed_drive()
+            if self.docs > 1:
+                # Checkpoint anterior a todos los documentos: el modo lote los procesa todos
+                os.makedirs(os.path.join(self.workdir, '.cache'))
+                with open(os.path.join(self.workdir, '.cache', 'docs_checkpoint.json'), 'w', encoding='utf-8') as f:
+                    json.dump({'modified_time': '1970-01-01T00:00:00.000Z'}, f)
+                # Y anterior a todo el historial: generate_video_archives arma un ZIP por documento
+                with open(os.path.join(self.workdir, '.cache', 'archive_checkpoint.json'), 'w', encoding='utf-8') as f:
+                    json.dump({'ts': 0}, f)
+        env = self._environment(self.workdir, overrides)
+
+        results = []
+        for script in self.scripts:
+            for server in (self.pexels, self.google, self.smtp):
+                server.reset(seed)
+            code, elapsed, peak_rss = run_script(script, self.workdir, env, os.path.join(self.workdir, 'bench.log'))
+            metrics_path = os.path.join(self.workdir, 'metrics', f"{os.path.splitext(script)[0]}.json")
+            stages = {}
+            if os.path.exists(metrics_path):
+                with open(metrics_path, 'r', encoding='utf-8') as f:
+                    stages = json.load(f).get('stages', {})
+            results.append({
+                'script': script,
+                'exit_code': code,
+                'wall_seconds': elapsed,
+                'peak_rss_bytes': peak_rss,
+                'pexels': self.pexels.counters.snapshot(),
+                'google': self.google.counters.snapshot(),
+                'smtp': self.smtp.counters.snapshot(),
+                'stages': stages,
+            })
+        return results
+
+
+def bytes_moved(result):
+    return sum(result[server]['bytes_in'] + result[server]['bytes_out'] for server in ('pexels', 'google'))
+
+
+def print_summary(name, runs):
+    for index, script in enumerate(runs[0]):
+        rows = [run[index] for run in runs]
+        walls = [r['wall_seconds'] for r in rows]
+        rss = [r['peak_rss_bytes'] / (1024 * 1024) for r in rows]
+        moved = [bytes_moved(r) / (1024 * 1024) for r in rows]
+        failed = sum(1 for r in rows if r['exit_code'] != 0)
+        print(f"{name:<12} {script['script']:<28} tiempo mediana {statistics.median(walls):7.2f}s "
+              f"(mín {min(walls):.2f}s)  RSS pico {max(rss):7.1f} MiB  "
+              f"transferido {statistics.median(moved):8.1f} MiB"
+              + (f"  [{failed} corridas con error]" if failed else ""))
+        last = rows[-1]
+        print(f"{'':<12} {'':<28} pexels {last['pexels']['requests']} peticiones, "
+              f"google {last['google']['requests']} peticiones, "
+              f"errores inyectados {last['pexels']['errors_injected'] + last['google']['errors_injected']}, "
+              f"correos {last['smtp'].get('messages', 0)}")
+        for stage, entry in sorted(last['stages'].items()):
+            throughput = f", {entry['mb_per_sec']:.1f} MB/s" if 'mb_per_sec' in entry else ""
+            print(f"{'':<14}- {stage}: {entry['count']} x, {entry['seconds']:.2f}s{throughput}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark sin red del pipeline contra servidores locales de Pexels, Drive/Docs y SMTP."
+    )
+    parser.add_argument('--runs', type=int, default=3, help="corridas por variante")
+    parser.add_argument('--keywords', type=int, default=6, help="palabras clave en total entre los documentos")
+    parser.add_argument('--docs', type=int, default=1, help="documentos (más de uno activa DOCS_BATCH_MODE)")
+    parser.add_argument('--video-mb', type=float, default=4, help="tamaño de cada video 1080p en MiB")
+    parser.add_argument('--latency-ms', type=float, default=20, help="latencia por petición")
+    parser.add_argument('--bandwidth-mbps', type=float, default=0, help="MiB/s por conexión (0 = sin límite)")
+    parser.add_argument('--error-rate', type=float, default=0, help="probabilidad de 429/503 transitorio")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--variant', action='append', default=[],
+                        help="'nombre:CLAVE=VALOR,...' variables de entorno de una variante (repetible)")
+    parser.add_argument('--scripts', nargs='+', default=SCRIPTS)
+    parser.add_argument('--reuse-state', action='store_true',
+                        help="conservar .cache y el Drive simulado entre corridas (mide corridas en caliente)")
+    parser.add_argument('--keep', action='store_true', help="no borrar el directorio de trabajo")
+    parser.add_argument('--json', help="ruta donde guardar los resultados completos")
+    args = parser.parse_args()
+
+    profile = FakeProfile(
+        latency=args.latency_ms / 1000,
+        bandwidth=args.bandwidth_mbps * 1024 * 1024,
+        video_size=int(args.video_mb * 1024 * 1024),
+        error_rate=args.error_rate,
+        seed=args.seed,
+    )
+    variants = [parse_variant(spec) for spec in args.variant] or [('base', {})]
+
+    report = {'profile': vars(profile), 'keywords': args.keywords, 'docs': args.docs, 'variants': {}}
+    for name, overrides in variants:
+        bench = Bench(profile, args.keywords, args.docs, args.scripts, args.reuse_state, args.keep)
+        try:
+            runs = [bench.run(overrides, args.seed + run) for run in range(args.runs)]
+        finally:
+            bench.close()
+        if args.keep:
+            print(f"{name}: directorio de trabajo {bench.workdir}")
+        report['variants'][name] = {'env': overrides, 'runs': runs}
+        print_summary(name, runs)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
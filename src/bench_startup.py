@@ -0,0 +1,62 @@
+import argparse
+import statistics
+import subprocess
+import sys
+import os
+
+# Módulos de entrada cuyo tiempo de importación se mide
+MODULES = ['main', 'generate_video_archives']
+
+
+def measure_import(module, runs):
+    """
+    Importa 'module' en 'runs' procesos nuevos de Python y retorna los tiempos en segundos.
+    Cada medición usa un intérprete limpio para no aprovechar módulos ya cargados.
+    """
+    code = (
+        "import time; t = time.perf_counter(); "
+        f"import {module}; "
+        "print(time.perf_counter() - t)"
+    )
+    src_dir = os.path.dirname(os.path.abspath(__file__))
+    times = []
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, '-c', code], cwd=src_dir,
+                                capture_output=True, text=True, check=True)
+        times.append(float(result.stdout.strip().splitlines()[-1]))
+    return times
+
+
+def heaviest_imports(module, top):
+    """
+    Retorna los 'top' módulos con mayor tiempo acumulado según 'python -X importtime'.
+    """
+    src_dir = os.path.dirname(os.path.abspath(__file__))
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=src_dir, capture_output=True, text=True, check=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        parts = line.split('|')
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        rows.append((int(parts[1]), parts[2].strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mide el tiempo de arranque (importación) de los scripts.")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=5, help="módulos más pesados a listar")
+    parser.add_argument('modules', nargs='*', default=MODULES)
+    args = parser.parse_args()
+
+    for module in args.modules:
+        times = measure_import(module, args.runs)
+        print(f"{module}: mediana {statistics.median(times) * 1000:.1f} ms, "
+              f"mín {min(times) * 1000:.1f} ms ({args.runs} corridas)")
+        for cumulative_us, name in heaviest_imports(module, args.top):
+            print(f"    {cumulative_us / 1000:8.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import logging
+import sqlite3
+import threading
+import time
+
+from file_utils import cache_path
+
+logger = logging.getLogger()
+
+DEDUP_FILE = 'dedup.sqlite'
+
+
+class DedupStore:
+    """
+    Registro local de los videos ya obtenidos, por ID de Pexels y por hash SHA-256
+    del contenido, junto con el archivo de Drive donde quedó subido.
+    Los mismos datos se guardan en los appProperties del archivo en Drive
+    ('pexels_id', 'sha256'), por lo que el índice local de la carpeta puede
+    reconstruirlos si esta caché se pierde.
+    """
+
+    def __init__(self, db_path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS assets (
+                file_name TEXT PRIMARY KEY,
+                pexels_id TEXT,
+                sha256 TEXT,
+                drive_file_id TEXT,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS assets_pexels_id ON assets (pexels_id);
+            CREATE INDEX IF NOT EXISTS assets_sha256 ON assets (sha256);
+        """)
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+    def record_download(self, file_name, pexels_id, sha256):
+        with self._lock:
+            self._conn.execute(
+                """INSERT INTO assets (file_name, pexels_id, sha256, updated_at) VALUES (?, ?, ?, ?)
+                   ON CONFLICT(file_name) DO UPDATE SET pexels_id = excluded.pexels_id,
+                       sha256 = excluded.sha256, updated_at = excluded.updated_at""",
+                (file_name, str(pexels_id) if pexels_id is not None else None, sha256, time.time())
+            )
+            self._conn.commit()
+
+    def record_upload(self, file_name, drive_file_id):
+        with self._lock:
+            self._conn.execute(
+                """INSERT INTO assets (file_name, drive_file_id, updated_at) VALUES (?, ?, ?)
+                   ON CONFLICT(file_name) DO UPDATE SET drive_file_id = excluded.drive_file_id,
+                       updated_at = excluded.updated_at""",
+                (file_name, drive_file_id, time.time())
+            )
+            self._conn.commit()
+
+    def find_uploaded(self, pexels_id=None, sha256=None):
+        """
+        Retorna {'id', 'name', 'updated_at'} del archivo en Drive con ese pexels_id o sha256, o None.
+        """
+        with self._lock:
+            for column, value in (('pexels_id', pexels_id), ('sha256', sha256)):
+                if value is None:
+                    continue
+                row = self._conn.execute(
+                    f"""SELECT drive_file_id, file_name, updated_at FROM assets
+                        WHERE {column} = ? AND drive_file_id IS NOT NULL LIMIT 1""",
+                    (str(value),)
+                ).fetchone()
+                if row:
+                    return {'id': row[0], 'name': row[1], 'updated_at': row[2]}
+        return None
+
+    def forget_upload(self, drive_file_id):
+        """
+        Olvida el archivo de Drive de los registros que apuntan a él (p. ej. porque se borró),
+        conservando el pexels_id y el sha256.
+        """
+        with self._lock:
+            self._conn.execute(
+                "UPDATE assets SET drive_file_id = NULL, updated_at = ? WHERE drive_file_id = ?",
+                (time.time(), drive_file_id)
+            )
+            self._conn.commit()
+
+    def app_properties(self, file_name):
+        """
+        appProperties a guardar en Drive para el archivo (vacío si no se conoce).
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT pexels_id, sha256 FROM assets WHERE file_name = ?", (file_name,)
+            ).fetchone()
+        if not row:
+            return {}
+        return {key: value for key, value in (('pexels_id', row[0]), ('sha256', row[1])) if value}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_dedup_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = DedupStore(cache_path(DEDUP_FILE))
+        return _store
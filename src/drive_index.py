@@ -0,0 +1,203 @@
+import logging
+import sqlite3
+import threading
+import time
+
+from metrics import metrics
+
+logger = logging.getLogger()
+
+_FILE_FIELDS = "id, name, size, modifiedTime, mimeType, appProperties, shortcutDetails(targetId)"
+_CHANGE_FIELDS = f"nextPageToken, newStartPageToken, changes(fileId, removed, file({_FILE_FIELDS}, parents, trashed))"
+# Columnas agregadas después de la primera versión del índice (se migran al abrirlo)
+_EXTRA_COLUMNS = {'target_id': 'TEXT', 'pexels_id': 'TEXT', 'sha256': 'TEXT'}
+
+
+class DriveFolderIndex:
+    """
+    Índice local (SQLite) de los archivos de una carpeta de Drive.
+    - La primera vez se construye con un listado completo de la carpeta.
+    - Las siguientes veces se actualiza con la Changes API a partir del último
+      start page token guardado, por lo que el costo depende de lo que cambió
+      y no del tamaño de la carpeta.
+    También guarda los appProperties 'pexels_id'/'sha256' de cada archivo y el
+    destino de los accesos directos, para deduplicar sin consultar a Drive.
+    """
+
+    def __init__(self, db_path, folder_id):
+        self.db_path = db_path
+        self.folder_id = folder_id
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS files (
+                id TEXT PRIMARY KEY,
+                folder_id TEXT NOT NULL,
+                name TEXT NOT NULL,
+                size INTEGER,
+                modified_time TEXT
+            );
+            CREATE INDEX IF NOT EXISTS files_folder_name ON files (folder_id, name);
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+        """)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(files)")}
+        missing = [c for c in _EXTRA_COLUMNS if c not in columns]
+        for column in missing:
+            self._conn.execute(f"ALTER TABLE files ADD COLUMN {column} {_EXTRA_COLUMNS[column]}")
+        if missing and columns:
+            # Índice creado por una versión anterior: forzar un listado completo para poblar las columnas nuevas
+            self._conn.execute("DELETE FROM meta WHERE key LIKE 'page_token:%'")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS files_pexels_id ON files (pexels_id)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS files_sha256 ON files (sha256)")
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+    def _get_meta(self, key):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key, value):
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    @property
+    def _token_key(self):
+        return f"page_token:{self.folder_id}"
+
+    @property
+    def _synced_key(self):
+        return f"synced_at:{self.folder_id}"
+
+    def _upsert(self, file):
+        props = file.get('appProperties') or {}
+        self._conn.execute(
+            """INSERT OR REPLACE INTO files (id, folder_id, name, size, modified_time, target_id, pexels_id, sha256)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+            (file['id'], self.folder_id, file['name'], int(file['size']) if file.get('size') else None,
+             file.get('modifiedTime'), (file.get('shortcutDetails') or {}).get('targetId'),
+             props.get('pexels_id'), props.get('sha256'))
+        )
+
+    def _rebuild(self, service):
+        logger.info(f"Construyendo índice local de la carpeta {self.folder_id} con un listado completo.")
+        # Pedir el token antes de listar para no perder cambios ocurridos durante el listado
+        start_token = metrics.api_call('drive', 'start_page_token',
+                                       service.changes().getStartPageToken().execute)['startPageToken']
+        self._conn.execute("DELETE FROM files WHERE folder_id = ?", (self.folder_id,))
+        page_token = None
+        total = 0
+        while True:
+            response = metrics.api_call('drive', 'list', service.files().list(
+                q=f"'{self.folder_id}' in parents and trashed=false",
+                fields=f"nextPageToken, files({_FILE_FIELDS})",
+                pageSize=1000,
+                pageToken=page_token
+            ).execute)
+            for file in response.get('files', []):
+                self._upsert(file)
+                total += 1
+            page_token = response.get('nextPageToken')
+            if page_token is None:
+                break
+        self._set_meta(self._token_key, start_token)
+        self._conn.commit()
+        logger.info(f"Índice construido con {total} archivos.")
+
+    def _apply_changes(self, service, page_token):
+        applied = 0
+        while page_token:
+            response = metrics.api_call('drive', 'changes', service.changes().list(
+                pageToken=page_token,
+                fields=_CHANGE_FIELDS,
+                includeRemoved=True,
+                spaces='drive',
+                pageSize=1000
+            ).execute)
+            for change in response.get('changes', []):
+                file = change.get('file')
+                in_folder = (file is not None and not file.get('trashed')
+                             and self.folder_id in file.get('parents', []))
+                if change.get('removed') or not in_folder:
+                    self._conn.execute("DELETE FROM files WHERE id = ? AND folder_id = ?",
+                                       (change['fileId'], self.folder_id))
+                else:
+                    self._upsert(file)
+                applied += 1
+            if 'newStartPageToken' in response:
+                self._set_meta(self._token_key, response['newStartPageToken'])
+            page_token = response.get('nextPageToken')
+        self._conn.commit()
+        logger.info(f"Índice local actualizado con {applied} cambios de Drive.")
+
+    def sync(self, service):
+        """
+        Sincroniza el índice con Drive: listado completo si no hay token guardado,
+        o solo los cambios ocurridos desde la última sincronización.
+        """
+        with self._lock:
+            page_token = self._get_meta(self._token_key)
+            # Se guarda la hora de inicio: lo que cambie durante la sincronización puede no quedar reflejado
+            self._set_meta(self._synced_key, repr(time.time()))
+            if page_token is None:
+                self._rebuild(service)
+            else:
+                self._apply_changes(service, page_token)
+
+    def synced_at(self):
+        """
+        Hora (epoch) de la última sincronización con Drive, o None si nunca se sincronizó.
+        """
+        with self._lock:
+            value = self._get_meta(self._synced_key)
+        return float(value) if value is not None else None
+
+    def has_file(self, file_id):
+        """
+        True si el archivo sigue en la carpeta (no se borró ni está en la papelera)
+        según la última sincronización.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM files WHERE folder_id = ? AND id = ? LIMIT 1", (self.folder_id, file_id)
+            ).fetchone()
+            return row is not None
+
+    def names(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT name FROM files WHERE folder_id = ?", (self.folder_id,))
+            return {row[0] for row in rows}
+
+    def files(self):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, name, size, target_id FROM files WHERE folder_id = ? ORDER BY name", (self.folder_id,)
+            )
+            return [{'id': row[0], 'name': row[1], 'size': row[2], 'target_id': row[3]} for row in rows]
+
+    def find_asset(self, pexels_id=None, sha256=None):
+        """
+        Busca un archivo real (no acceso directo) de la carpeta por su pexels_id o su sha256.
+        Retorna {'id', 'name'} o None.
+        """
+        with self._lock:
+            for column, value in (('pexels_id', pexels_id), ('sha256', sha256)):
+                if value is None:
+                    continue
+                row = self._conn.execute(
+                    f"SELECT id, name FROM files WHERE folder_id = ? AND {column} = ? AND target_id IS NULL LIMIT 1",
+                    (self.folder_id, str(value))
+                ).fetchone()
+                if row:
+                    return {'id': row[0], 'name': row[1]}
+        return None
+
+    def contains(self, name):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM files WHERE folder_id = ? AND name = ? LIMIT 1", (self.folder_id, name)
+            ).fetchone()
+            return row is not None
@@ -5,6 +5,11 @@ import logging
 
 logger = logging.getLogger()
 
+# Servidor SMTP (Gmail por defecto); SMTP_SSL=0 usa SMTP sin TLS, p. ej. contra un servidor local
+SMTP_HOST = os.environ.get("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.environ.get("SMTP_PORT", "465"))
+SMTP_SSL = os.environ.get("SMTP_SSL", "1").lower() in ("1", "true", "yes")
+
 def send_email(to_email, subject, body):
     sender_email = os.environ.get("GMAIL_USER")
     password = os.environ.get("GMAIL_APP_PASSWORD")
@@ -19,7 +24,8 @@ def send_email(to_email, subject, body):
     msg['To'] = to_email
 
     try:
-        with smtplib.SMTP_SSL('smtp.gmail.com', 465) as server:
+        smtp_class = smtplib.SMTP_SSL if SMTP_SSL else smtplib.SMTP
+        with smtp_class(SMTP_HOST, SMTP_PORT) as server:
             server.login(sender_email, password)
             server.send_message(msg)
         logger.info(f"Correo enviado a {to_email} con asunto '{subject}'.")
@@ -0,0 +1,143 @@
+import asyncio
+import logging
+import os
+from urllib.parse import urlparse
+
+from google_drive import upload_file_to_drive, UPLOAD_CHUNK_SIZE, UPLOAD_MAX_RETRIES, UPLOAD_WORKERS
+from dedup_store import get_dedup_store
+from run_journal import VIDEO_DOWNLOADED, VIDEO_UPLOADED
+from video_downloads import (obtener_videos, plan_downloads, download_video_file, StreamUploadError,
+                             DOWNLOAD_WORKERS, DOWNLOAD_RATE_PER_SEC, DOWNLOAD_RATE_BURST, STREAM_TO_DRIVE,
+                             VIDEOS_FOLDER_ID, GCP_CREDENTIALS_ENV)
+from rate_limit import AsyncTokenBucket
+
+logger = logging.getLogger()
+
+# Límites del motor asíncrono
+ASYNC_MAX_CONCURRENCY = int(os.environ.get("ASYNC_MAX_CONCURRENCY", "16"))
+SEARCH_CONCURRENCY = int(os.environ.get("SEARCH_CONCURRENCY", "4"))
+PEXELS_API_RATE_PER_SEC = float(os.environ.get("PEXELS_API_RATE_PER_SEC", "1"))
+DRIVE_RATE_PER_SEC = float(os.environ.get("DRIVE_RATE_PER_SEC", "5"))
+
+
+class AsyncPipeline:
+    """
+    Motor asíncrono para la etapa de búsqueda, descarga y subida.
+    - Las búsquedas de todas las palabras clave corren en paralelo.
+    - Cada video se descarga en cuanto termina la búsqueda de su palabra clave
+      y se sube a Drive en cuanto termina su descarga.
+    - Un semáforo global limita el total de operaciones en curso y cada etapa
+      tiene su propio límite y su propio limitador de tasa por servicio.
+    Las llamadas a las librerías síncronas (requests, googleapiclient)
+    se ejecutan en hilos con asyncio.to_thread.
+    """
+
+    def __init__(self, py_pexel, videos_en_drive, stream_to_drive=None, journal=None):
+        self.py_pexel = py_pexel
+        self.videos_en_drive = videos_en_drive
+        self.stream_to_drive = STREAM_TO_DRIVE if stream_to_drive is None else stream_to_drive
+        self.global_sem = asyncio.Semaphore(ASYNC_MAX_CONCURRENCY)
+        self.search_sem = asyncio.Semaphore(SEARCH_CONCURRENCY)
+        self.download_sem = asyncio.Semaphore(DOWNLOAD_WORKERS)
+        self.upload_sem = asyncio.Semaphore(UPLOAD_WORKERS)
+        self.pexels_limiter = AsyncTokenBucket(PEXELS_API_RATE_PER_SEC, SEARCH_CONCURRENCY)
+        self.drive_limiter = AsyncTokenBucket(DRIVE_RATE_PER_SEC, UPLOAD_WORKERS)
+        self.host_limiters = {}
+        self.upload_errors = []
+        self.journal = journal
+
+    def _host_limiter(self, url):
+        host = urlparse(url).netloc
+        if host not in self.host_limiters:
+            self.host_limiters[host] = AsyncTokenBucket(DOWNLOAD_RATE_PER_SEC, DOWNLOAD_RATE_BURST)
+        return self.host_limiters[host]
+
+    def _mark(self, nombre_archivo, state, query):
+        if self.journal is not None and state:
+            self.journal.mark_video(nombre_archivo, state, query)
+
+    async def _upload(self, file_path, nombre_archivo, query=None):
+        async with self.upload_sem, self.global_sem:
+            await self.drive_limiter.acquire()
+            store = get_dedup_store()
+            try:
+                file_id, _ = await asyncio.to_thread(
+                    upload_file_to_drive, file_path, VIDEOS_FOLDER_ID, GCP_CREDENTIALS_ENV,
+                    UPLOAD_CHUNK_SIZE, UPLOAD_MAX_RETRIES, store.app_properties(nombre_archivo)
+                )
+                store.record_upload(nombre_archivo, file_id)
+                self._mark(nombre_archivo, VIDEO_UPLOADED, query)
+                logger.info(f"Subido {nombre_archivo} a Google Drive.")
+            except Exception as e:
+                logger.error(f"No se pudo subir {nombre_archivo}: {e}")
+                self.upload_errors.append(nombre_archivo)
+
+    async def _download_and_upload(self, query, data_url, file_path, nombre_archivo, pexels_id=None):
+        resumed = (self.journal is not None and not self.stream_to_drive
+                   and self.journal.video_state(query, nombre_archivo) == VIDEO_DOWNLOADED
+                   and os.path.exists(file_path))
+        if resumed:
+            # Descargado en una corrida anterior: solo falta subirlo
+            state = VIDEO_DOWNLOADED
+        else:
+            async with self.download_sem, self.global_sem:
+                await self._host_limiter(data_url).acquire()
+                try:
+                    state = await asyncio.to_thread(
+                        download_video_file, data_url, file_path, nombre_archivo, pexels_id,
+                        stream_to_drive=self.stream_to_drive, rate_limited=False
+                    )
+                except StreamUploadError as e:
+                    logger.error(str(e))
+                    self.upload_errors.append(nombre_archivo)
+                    return False
+                except Exception as e:
+                    logger.warning(f"No se pudo descargar {nombre_archivo}: {e}")
+                    return False
+            self._mark(nombre_archivo, state, query)
+        # Solo se sube lo que quedó en disco (no lo transferido en streaming ni los accesos directos)
+        if state == VIDEO_DOWNLOADED:
+            await self._upload(file_path, nombre_archivo, query)
+        return bool(state)
+
+    async def _process_query(self, query):
+        try:
+            pendientes = self.journal.planned(query) if self.journal is not None else None
+            if pendientes is None:
+                async with self.search_sem, self.global_sem:
+                    await self.pexels_limiter.acquire()
+                    logger.info(f"Buscando videos con la palabra clave: {query}")
+                    search_videos_page = await asyncio.to_thread(obtener_videos, self.py_pexel, query)
+                if search_videos_page is None:
+                    logger.info(f"No se encontraron videos para '{query}' tras reintentos.")
+                    if self.journal is not None:
+                        self.journal.record_plan(query, None)
+                    return False
+                _, pendientes = plan_downloads(search_videos_page, self.videos_en_drive, query,
+                                               stream_to_drive=self.stream_to_drive)
+                if self.journal is not None:
+                    self.journal.record_plan(query, pendientes)
+            else:
+                logger.info(f"Se retoma '{query}' con {len(pendientes)} videos pendientes.")
+            results = await asyncio.gather(*(self._download_and_upload(query, *p) for p in pendientes))
+            return any(results)
+        except Exception as e:
+            logger.error(f"Se obtuvo un error con la palabra clave: {query}, con el error {e}")
+            return False
+
+    async def run(self, queries):
+        """
+        Procesa todas las palabras clave.
+        Retorna (palabras_con_descargas, nueva_info, archivos_no_subidos).
+        """
+        results = await asyncio.gather(*(self._process_query(q) for q in queries))
+        used = [q for q, ok in zip(queries, results) if ok]
+        return used, bool(used), list(self.upload_errors)
+
+
+def run_keywords_async(py_pexel, videos_en_drive, queries, stream_to_drive=None, journal=None):
+    """
+    Punto de entrada síncrono del motor asíncrono para usar desde main.main().
+    """
+    pipeline = AsyncPipeline(py_pexel, videos_en_drive, stream_to_drive, journal)
+    return asyncio.run(pipeline.run(queries))
@@ -0,0 +1,628 @@
+import email.parser
+import hashlib
+import itertools
+import json
+import logging
+import random
+import re
+import socketserver
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+logger = logging.getLogger()
+
+DOC_MIME_TYPE = 'application/vnd.google-apps.document'
+SHORTCUT_MIME_TYPE = 'application/vnd.google-apps.shortcut'
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+
+# Palabras de los documentos de prueba (se agregan sufijos si se piden más)
+SAMPLE_KEYWORDS = ['montaña', 'playa', 'ciudad', 'bosque', 'río', 'nieve', 'desierto', 'océano',
+                   'atardecer', 'lluvia', 'volcán', 'selva', 'puente', 'mercado', 'estrellas', 'lago']
+
+_BLOCK_SIZE = 64 * 1024
+
+
+@dataclass
+class FakeProfile:
+    """
+    Comportamiento de los servidores simulados.
+    - 'latency': segundos de espera antes de responder cada petición.
+    - 'bandwidth': bytes por segundo por conexión para los cuerpos grandes (0 = sin límite).
+    - 'video_size': tamaño en bytes de la versión 1080p de cada video (las demás escalan).
+    - 'error_rate': probabilidad de fallo transitorio (429/503) en las rutas con reintentos:
+      búsquedas de Pexels, descargas de videos, bloques de subida, descargas de Drive
+      y cada operación dentro de un lote (batch) de Drive.
+    """
+    latency: float = 0.0
+    bandwidth: float = 0.0
+    video_size: int = 4 * 1024 * 1024
+    error_rate: float = 0.0
+    seed: int = 0
+
+
+def content_block(key):
+    # Bloque determinista por archivo: videos distintos tienen hashes distintos
+    seed = hashlib.sha256(str(key).encode('utf-8')).digest()
+    return (seed * (_BLOCK_SIZE // len(seed) + 1))[:_BLOCK_SIZE]
+
+
+def parse_range(header, size):
+    match = re.match(r'bytes=(\d+)-(\d*)$', header or '')
+    if not match:
+        return None
+    start = int(match.group(1))
+    end = int(match.group(2)) if match.group(2) else size - 1
+    return start, min(end, size - 1)
+
+
+class _Counters:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.values = {'requests': 0, 'bytes_in': 0, 'bytes_out': 0, 'errors_injected': 0}
+
+    def add(self, key, value=1):
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.values)
+
+
+class _FakeHandler(BaseHTTPRequestHandler):
+    """
+    Base de los manejadores: conexiones persistentes (HTTP/1.1), latencia,
+    ancho de banda limitado, errores inyectados y conteo de bytes.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def fake(self):
+        return self.server.fake
+
+    def _begin(self):
+        self.fake.counters.add('requests')
+        if self.fake.profile.latency:
+            time.sleep(self.fake.profile.latency)
+        parsed = urlparse(self.path)
+        return parsed.path, {k: v[-1] for k, v in parse_qs(parsed.query).items()}
+
+    def _inject_error(self):
+        return self.fake.profile.error_rate and self.fake.random() < self.fake.profile.error_rate
+
+    def _throttle(self, nbytes, started):
+        bandwidth = self.fake.profile.bandwidth
+        if bandwidth:
+            ahead = nbytes / bandwidth - (time.monotonic() - started)
+            if ahead > 0:
+                time.sleep(ahead)
+
+    def read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        started = time.monotonic()
+        received = bytearray()
+        while len(received) < length:
+            chunk = self.rfile.read(min(_BLOCK_SIZE, length - len(received)))
+            if not chunk:
+                break
+            received.extend(chunk)
+            self._throttle(len(received), started)
+        self.fake.counters.add('bytes_in', len(received))
+        return bytes(received)
+
+    def send_bytes(self, status, body, content_type='application/octet-stream', headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+            self.fake.counters.add('bytes_out', len(body))
+
+    def send_json(self, status, payload, headers=None):
+        self.send_bytes(status, json.dumps(payload).encode('utf-8'), 'application/json; charset=UTF-8', headers)
+
+    def send_error_status(self, status, headers=None):
+        self.fake.counters.add('errors_injected')
+        self.send_json(status, {'error': {'code': status, 'message': 'Error simulado'}}, headers)
+
+    def send_content(self, key, size, content_type='video/mp4'):
+        """
+        Envía 'size' bytes deterministas de 'key', respetando Range y el ancho de banda.
+        """
+        byte_range = parse_range(self.headers.get('Range'), size)
+        start, end = byte_range or (0, size - 1)
+        self.send_response(206 if byte_range else 200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(end - start + 1))
+        if byte_range:
+            self.send_header('Content-Range', f"bytes {start}-{end}/{size}")
+        self.end_headers()
+
+        block = content_block(key)
+        started = time.monotonic()
+        sent = 0
+        position = start
+        while position <= end:
+            offset = position % _BLOCK_SIZE
+            piece = block[offset:offset + min(_BLOCK_SIZE - offset, end - position + 1)]
+            self.wfile.write(piece)
+            position += len(piece)
+            sent += len(piece)
+            self._throttle(sent, started)
+        self.fake.counters.add('bytes_out', sent)
+
+
+class _FakeServer:
+    def __init__(self, handler, profile, host='127.0.0.1', port=0):
+        self.profile = profile
+        self.counters = _Counters()
+        self._random = random.Random(profile.seed)
+        self._random_lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.httpd.fake = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def random(self):
+        with self._random_lock:
+            return self._random.random()
+
+    def reset(self, seed=None):
+        self.counters.reset()
+        self._random = random.Random(self.profile.seed if seed is None else seed)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class _PexelsHandler(_FakeHandler):
+    def do_GET(self):
+        path, params = self._begin()
+        if path == '/videos/search':
+            if self._inject_error():
+                return self.send_error_status(429, {'Retry-After': '1'})
+            return self.send_json(200, self.fake.search(params), self.fake.ratelimit_headers())
+        match = re.match(r'/video-files/(\d+)/(\d+)x(\d+)\.mp4$', path)
+        if match:
+            if self._inject_error():
+                return self.send_error_status(503)
+            return self.send_content(f"pexels-{match.group(1)}-{match.group(2)}x{match.group(3)}",
+                                     int(params.get('bytes', self.fake.profile.video_size)))
+        self.send_json(404, {'error': 'not found'})
+
+
+class FakePexels(_FakeServer):
+    """
+    API de videos de Pexels simulada: /videos/search responde páginas deterministas
+    por (query, page) y los links de cada versión descargan contenido sintético.
+    """
+
+    def __init__(self, profile, **kwargs):
+        super().__init__(_PexelsHandler, profile, **kwargs)
+        self._remaining = itertools.count(20000, -1)
+
+    def ratelimit_headers(self):
+        return {'X-Ratelimit-Limit': '20000', 'X-Ratelimit-Remaining': str(max(0, next(self._remaining))),
+                'X-Ratelimit-Reset': str(int(time.time()) + 3600), 'ETag': '"bench"'}
+
+    def search(self, params):
+        query = params.get('query', '')
+        page = int(params.get('page', 1))
+        per_page = int(params.get('per_page', 15))
+        size = self.profile.video_size
+        videos = []
+        for i in range(per_page):
+            digest = hashlib.sha256(f"{query}|{page}|{i}".encode('utf-8')).hexdigest()
+            video_id = int(digest[:8], 16)
+            renditions = [(1280, 720, size // 2), (1920, 1080, size), (3840, 2160, size * 4)]
+            videos.append({
+                'id': video_id,
+                'width': 1920,
+                'height': 1080,
+                'url': f"https://www.pexels.com/video/bench-{video_id}/",
+                'video_files': [{
+                    'id': video_id * 10 + n,
+                    'quality': 'hd',
+                    'file_type': 'video/mp4',
+                    'width': width,
+                    'height': height,
+                    'fps': 30,
+                    'size': nbytes,
+                    'link': f"{self.url}/video-files/{video_id}/{width}x{height}.mp4?bytes={nbytes}",
+                } for n, (width, height, nbytes) in enumerate(renditions)],
+            })
+        return {'page': page, 'per_page': per_page, 'total_results': per_page * 4, 'videos': videos}
+
+
+class _GoogleHandler(_FakeHandler):
+    def do_GET(self):
+        path, params = self._begin()
+        fake = self.fake
+        match = re.match(r'/drive/v3/files/([^/]+)$', path)
+        if match and params.get('alt') == 'media':
+            file = fake.get_file(match.group(1))
+            if file is None:
+                return self.send_json(404, {'error': {'code': 404, 'message': 'Archivo no encontrado'}})
+            if self._inject_error():
+                return self.send_error_status(503)
+            return self.send_content(file['id'], int(file.get('size') or 0))
+        self.send_json(*fake.call('GET', path, params))
+
+    def do_POST(self):
+        path, params = self._begin()
+        fake = self.fake
+        body = self.read_body()
+        if path == '/token':
+            return self.send_json(200, {'access_token': 'bench-token', 'expires_in': 3600, 'token_type': 'Bearer'})
+        if path == '/upload/drive/v3/files' and params.get('uploadType') == 'resumable':
+            session_id = fake.start_upload(json.loads(body or b'{}'))
+            return self.send_json(200, {}, {'Location': f"{fake.url}/upload/drive/v3/files?upload_id={session_id}"})
+        if path == '/batch/drive/v3':
+            boundary = 'bench_batch_boundary'
+            payload = fake.batch(self.headers.get('Content-Type', ''), body, boundary, self._inject_error)
+            return self.send_bytes(200, payload, f'multipart/mixed; boundary={boundary}')
+        self.send_json(*fake.call('POST', path, params, body))
+
+    def do_PATCH(self):
+        path, params = self._begin()
+        self.send_json(*self.fake.call('PATCH', path, params, self.read_body()))
+
+    def do_PUT(self):
+        path, params = self._begin()
+        fake = self.fake
+        session_id = params.get('upload_id')
+        if path != '/upload/drive/v3/files' or not fake.has_upload(session_id):
+            self.read_body()
+            return self.send_json(404, {'error': {'code': 404, 'message': 'Sesión de subida no encontrada'}})
+        if int(self.headers.get('Content-Length') or 0) and self._inject_error():
+            # Se descarta el bloque sin persistir nada; el cliente debe consultar y reenviar
+            self.read_body()
+            return self.send_error_status(503)
+        received = len(self.read_body())
+        file, confirmed = fake.put_upload_chunk(session_id, self.headers.get('Content-Range', ''), received)
+        if file is not None:
+            return self.send_json(200, fake.metadata(file))
+        headers = {'Range': f"bytes=0-{confirmed - 1}"} if confirmed else {}
+        self.send_bytes(308, b'', headers=headers)
+
+
+class FakeGoogleAPIs(_FakeServer):
+    """
+    Drive v3, Docs v1 y el endpoint de tokens OAuth simulados sobre un almacén en memoria.
+    Cubre lo que usan los scripts: files.list (consultas 'in parents', mimeType,
+    modifiedTime y 'name contains'), files.create (metadatos y subidas reanudables), files.update,
+    files.get con alt=media (con Range), la Changes API, documents.get y el
+    endpoint batch de Drive (/batch/drive/v3).
+    De los archivos subidos solo se guarda el tamaño; al descargarlos se entrega
+    contenido sintético de ese tamaño.
+    """
+
+    def __init__(self, profile, **kwargs):
+        super().__init__(_GoogleHandler, profile, **kwargs)
+        self._lock = threading.Lock()
+        self.reset_store()
+
+    def reset_store(self):
+        with self._lock:
+            self._files = {}
+            self._changes = []
+            self._uploads = {}
+            self._ids = itertools.count(1)
+            self._clock = time.time() - 86400
+
+    def _new_id(self, prefix):
+        return f"{prefix}{next(self._ids):06d}"
+
+    def _tick(self):
+        # modifiedTime estrictamente creciente para que los filtros por fecha sean deterministas
+        self._clock += 1
+        return time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(self._clock)) + '.000Z'
+
+    def _store(self, metadata, prefix='f'):
+        file = dict(metadata)
+        file['id'] = self._new_id(prefix)
+        file.setdefault('mimeType', 'application/octet-stream')
+        file['modifiedTime'] = self._tick()
+        self._files[file['id']] = file
+        self._changes.append(file['id'])
+        return file
+
+    def create_file(self, metadata):
+        with self._lock:
+            return self._store(metadata)
+
+    def update_file(self, file_id, changes):
+        # Como en Drive, los appProperties recibidos se combinan con los existentes
+        with self._lock:
+            file = self._files[file_id]
+            for key, value in changes.items():
+                if key == 'appProperties':
+                    file.setdefault('appProperties', {}).update(value)
+                else:
+                    file[key] = value
+            file['modifiedTime'] = self._tick()
+            self._changes.append(file_id)
+            return file
+
+    def add_folder(self, name):
+        with self._lock:
+            return self._store({'name': name, 'mimeType': FOLDER_MIME_TYPE}, prefix='folder')['id']
+
+    def add_document(self, folder_id, name, text):
+        with self._lock:
+            return self._store({'name': name, 'mimeType': DOC_MIME_TYPE, 'parents': [folder_id], 'text': text},
+                               prefix='doc')['id']
+
+    def get_file(self, file_id):
+        with self._lock:
+            return self._files.get(file_id)
+
+    def files_in(self, folder_id):
+        with self._lock:
+            return [self.metadata(f) for f in self._files.values() if folder_id in f.get('parents', [])]
+
+    @staticmethod
+    def metadata(file):
+        return {k: v for k, v in file.items() if k != 'text'}
+
+    @staticmethod
+    def document_body(doc):
+        elements = [{'textRun': {'content': line + '\n'}} for line in doc.get('text', '').split('\n')]
+        return {'documentId': doc['id'], 'body': {'content': [{'paragraph': {'elements': elements}}]}}
+
+    @staticmethod
+    def _matches(file, query):
+        for folder_id in re.findall(r"'([^']+)' in parents", query):
+            if folder_id not in file.get('parents', []):
+                return False
+        mime = re.search(r"mimeType\s*=\s*'([^']+)'", query)
+        if mime and file.get('mimeType') != mime.group(1):
+            return False
+        since = re.search(r"modifiedTime\s*>\s*'([^']+)'", query)
+        if since and not file['modifiedTime'] > since.group(1):
+            return False
+        contains = re.search(r"name contains '((?:[^'\\]|\\.)*)'", query)
+        if contains and re.sub(r"\\(.)", r"\1", contains.group(1)).lower() not in file['name'].lower():
+            return False
+        return not file.get('trashed')
+
+    def list_files(self, params):
+        query = params.get('q', '')
+        with self._lock:
+            files = [self.metadata(f) for f in self._files.values() if self._matches(f, query)]
+        order_by = params.get('orderBy', '')
+        if order_by.startswith('modifiedTime'):
+            files.sort(key=lambda f: f['modifiedTime'], reverse=order_by.endswith('desc'))
+        start = int(params.get('pageToken') or 0)
+        size = int(params.get('pageSize') or 100)
+        response = {'files': files[start:start + size]}
+        if start + size < len(files):
+            response['nextPageToken'] = str(start + size)
+        return response
+
+    def call(self, method, path, params, body=None):
+        """
+        Atiende una operación de metadatos (también las que llegan dentro de un lote).
+        Retorna (código, respuesta_json).
+        """
+        match = re.match(r'/v1/documents/([^/]+)$', path)
+        if method == 'GET' and match:
+            doc = self.get_file(match.group(1))
+            if doc is None:
+                return 404, {'error': {'code': 404, 'message': 'Documento no encontrado'}}
+            return 200, self.document_body(doc)
+        if path == '/drive/v3/files':
+            if method == 'POST':
+                return 200, self.metadata(self.create_file(json.loads(body or b'{}')))
+            return 200, self.list_files(params)
+        if method == 'GET' and path == '/drive/v3/changes/startPageToken':
+            return 200, {'startPageToken': self.start_page_token()}
+        if method == 'GET' and path == '/drive/v3/changes':
+            return 200, self.list_changes(params)
+        match = re.match(r'/drive/v3/files/([^/]+)$', path)
+        if method in ('GET', 'PATCH') and match:
+            file = self.get_file(match.group(1))
+            if file is None:
+                return 404, {'error': {'code': 404, 'message': 'Archivo no encontrado'}}
+            if method == 'PATCH':
+                file = self.update_file(file['id'], json.loads(body or b'{}'))
+            return 200, self.metadata(file)
+        return 404, {'error': {'code': 404, 'message': 'Ruta no encontrada'}}
+
+    def batch(self, content_type, body, boundary, inject_error):
+        """
+        Atiende una petición batch (multipart/mixed con una petición HTTP por parte)
+        y arma la respuesta multipart. 'inject_error' decide qué partes fallan con 503.
+        """
+        message = email.parser.BytesParser().parsebytes(f"Content-Type: {content_type}\r\n\r\n".encode() + body)
+        parts = []
+        for part in message.get_payload():
+            request = part.get_payload(decode=False)
+            request_line, _, rest = request.partition('\n')
+            method, target, _ = request_line.split(' ', 2)
+            inner = email.parser.Parser().parsestr(rest)
+            parsed = urlparse(target)
+            params = {k: v[-1] for k, v in parse_qs(parsed.query).items()}
+            if inject_error():
+                self.counters.add('errors_injected')
+                status, payload = 503, {'error': {'code': 503, 'message': 'Error simulado'}}
+            else:
+                status, payload = self.call(method, parsed.path, params, (inner.get_payload() or '').encode('utf-8'))
+            content_id = part['Content-ID'].strip('<>')
+            parts.append(f"--{boundary}\r\nContent-Type: application/http\r\n"
+                         f"Content-ID: <response-{content_id}>\r\n\r\n"
+                         f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                         f"Content-Type: application/json; charset=UTF-8\r\n\r\n"
+                         f"{json.dumps(payload)}\r\n")
+        return (''.join(parts) + f"--{boundary}--\r\n").encode('utf-8')
+
+    def start_page_token(self):
+        with self._lock:
+            return str(len(self._changes))
+
+    def list_changes(self, params):
+        start = int(params.get('pageToken') or 0)
+        with self._lock:
+            changes = [{'fileId': file_id, 'removed': False, 'file': self.metadata(self._files[file_id])}
+                       for file_id in self._changes[start:]]
+            return {'changes': changes, 'newStartPageToken': str(len(self._changes))}
+
+    def start_upload(self, metadata):
+        with self._lock:
+            session_id = self._new_id('upload')
+            self._uploads[session_id] = {'metadata': metadata, 'received': 0}
+            return session_id
+
+    def has_upload(self, session_id):
+        with self._lock:
+            return session_id in self._uploads
+
+    def put_upload_chunk(self, session_id, content_range, received):
+        """
+        Registra un bloque 'bytes a-b/total' (o una consulta 'bytes */total').
+        Retorna (archivo_creado, None) al completar o (None, bytes_confirmados).
+        """
+        match = re.match(r'bytes (?:(\d+)-(\d+)|\*)/(\d+|\*)', content_range)
+        with self._lock:
+            upload = self._uploads[session_id]
+            if match and match.group(1) is not None and int(match.group(1)) == upload['received']:
+                upload['received'] += received
+            total = match.group(3) if match else '*'
+            if total != '*' and upload['received'] >= int(total):
+                del self._uploads[session_id]
+                file = self._store(dict(upload['metadata'], size=str(upload['received'])))
+                return file, None
+            return None, upload['received']
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    """
+    Servidor SMTP mínimo (sin TLS): acepta AUTH PLAIN/LOGIN, MAIL, RCPT y DATA.
+    """
+
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode('ascii'))
+
+    def handle(self):
+        fake = self.server.fake
+        self.reply('220 localhost ESMTP bench')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            fake.counters.add('bytes_in', len(line))
+            command = line.decode('utf-8', 'replace').strip().upper()
+            if command.startswith(('EHLO', 'HELO')):
+                self.reply('250-localhost')
+                self.reply('250 AUTH PLAIN LOGIN')
+            elif command.startswith('AUTH LOGIN'):
+                for prompt in ('334 VXNlcm5hbWU6', '334 UGFzc3dvcmQ6'):
+                    self.reply(prompt)
+                    self.rfile.readline()
+                self.reply('235 Authentication successful')
+            elif command.startswith('AUTH'):
+                if len(command.split()) < 3:
+                    self.reply('334 ')
+                    self.rfile.readline()
+                self.reply('235 Authentication successful')
+            elif command == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                while True:
+                    data = self.rfile.readline()
+                    fake.counters.add('bytes_in', len(data))
+                    if not data or data in (b'.\r\n', b'.\n'):
+                        break
+                fake.counters.add('messages')
+                self.reply('250 OK')
+            elif command == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('250 OK')
+
+
+class _ThreadingTCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class FakeSMTP:
+    """
+    Servidor SMTP local que cuenta los correos recibidos.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self.counters = _Counters()
+        self.server = _ThreadingTCPServer((host, port), _SMTPHandler)
+        self.server.fake = self
+
+    @property
+    def address(self):
+        return self.server.server_address[:2]
+
+    def reset(self, seed=None):
+        self.counters.reset()
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def keyword_document(count, offset=0):
+    """
+    Texto de un documento de prueba: un párrafo de relleno y 'count' palabras clave
+    después de la línea KEYWORDS.
+    """
+    words = []
+    for i in range(offset, offset + count):
+        base = SAMPLE_KEYWORDS[i % len(SAMPLE_KEYWORDS)]
+        words.append(base if i < len(SAMPLE_KEYWORDS) else f"{base}{chr(ord('a') + i // len(SAMPLE_KEYWORDS) - 1)}")
+    filler = ' '.join(['texto de ejemplo del guion'] * 200)
+    return f"{filler}\nKEYWORDS\n{' '.join(words)}"
+
+
+def service_account_info(token_uri):
+    """
+    Credenciales de cuenta de servicio con una clave RSA recién generada y
+    'token_uri' apuntando al servidor simulado.
+    """
+    import rsa
+
+    _, private_key = rsa.newkeys(1024)
+    return {
+        'type': 'service_account',
+        'project_id': 'bench',
+        'private_key_id': 'bench',
+        'private_key': private_key.save_pkcs1().decode('ascii'),
+        'client_email': 'bench@bench.iam.gserviceaccount.com',
+        'client_id': '1',
+        'token_uri': token_uri,
+    }
@@ -0,0 +1,72 @@
+import os
+import stat
+import tempfile
+from contextlib import contextmanager
+
+# Tamaño de bloque por defecto para descargas en streaming (1 MiB)
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+# Carpeta para estado persistente entre corridas (índices, cachés); en CI se restaura con actions/cache
+CACHE_DIR = os.environ.get("CACHE_DIR", ".cache")
+
+# os.umask solo se puede leer cambiándola; se lee una vez al importar, antes de lanzar hilos
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def cache_path(file_name):
+    """
+    Retorna la ruta de 'file_name' dentro de CACHE_DIR, creando la carpeta si no existe.
+    """
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    return os.path.join(CACHE_DIR, file_name)
+
+
+def _target_mode(path):
+    """
+    Permisos del archivo existente en 'path' o, si no existe, los de un archivo
+    nuevo según la umask del proceso (0o666 & ~umask).
+    """
+    try:
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        return 0o666 & ~_UMASK
+
+
+@contextmanager
+def atomic_open(destination_path, mode='wb', encoding=None):
+    """
+    Abre un archivo temporal en la misma carpeta que 'destination_path' y,
+    al salir del bloque sin errores, lo renombra atómicamente al destino.
+    Si ocurre un error, el archivo temporal se elimina y el destino no se toca.
+    El resultado conserva los permisos del destino si ya existía (mkstemp crea con 0600).
+    """
+    folder = os.path.dirname(os.path.abspath(destination_path))
+    fd, tmp_path = tempfile.mkstemp(dir=folder, prefix='.', suffix='.part')
+    try:
+        with os.fdopen(fd, mode, encoding=encoding) as f:
+            yield f
+        os.chmod(tmp_path, _target_mode(destination_path))
+        os.replace(tmp_path, destination_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def stream_response_to_file(response, destination_path, chunk_size=DEFAULT_CHUNK_SIZE, hasher=None):
+    """
+    Escribe el cuerpo de una respuesta de requests (abierta con stream=True)
+    en bloques de 'chunk_size' bytes, sin cargarlo completo en memoria.
+    Si se pasa 'hasher' (p. ej. hashlib.sha256()), se actualiza con cada bloque.
+    Retorna el número de bytes escritos.
+    """
+    written = 0
+    with atomic_open(destination_path) as f:
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            if chunk:
+                f.write(chunk)
+                if hasher is not None:
+                    hasher.update(chunk)
+                written += len(chunk)
+    return written
@@ -1,44 +1,67 @@
 import os
+import atexit
 import json
 import logging
+import queue
+import re
 import shutil
+import threading
+import time
 import zipfile
-from googleapiclient.discovery import build
+from concurrent.futures import ThreadPoolExecutor
 from googleapiclient.http import MediaIoBaseDownload, MediaFileUpload
-from google.oauth2.service_account import Credentials
-from io import BytesIO
+from google_drive import (get_service, get_folder_index, clean_and_convert_words, execute_batch, is_transient_error,
+                          USE_DRIVE_INDEX)
+from file_utils import atomic_open, cache_path, DEFAULT_CHUNK_SIZE
+from metrics import metrics, write_run_metrics
+from keyword_store import KeywordHistory
 
-# Configuración de logging
 logger = logging.getLogger()
-logger.setLevel(logging.INFO)
-formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-console_handler = logging.StreamHandler()
-console_handler.setFormatter(formatter)
-logger.addHandler(console_handler)
+
+def setup_logging():
+    # Configuración de logging (solo al ejecutar el script, no al importar el módulo)
+    logger.setLevel(logging.INFO)
+    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(formatter)
+    logger.addHandler(console_handler)
 
 # Variables de entorno
 GCP_CREDENTIALS_ENV = os.environ.get("GCP_CREDENTIALS")
 VIDEOS_FOLDER_ID = os.environ.get("VIDEOS_FOLDER_ID")
+KEYWORDS_HISTORY_FILE = 'keywords_history.jsonl'
+# Modo lote (igual que en main.py): se archivan todos los documentos procesados desde el último ZIP
+DOCS_BATCH_MODE = os.environ.get("DOCS_BATCH_MODE", "").lower() in ("1", "true", "yes")
+ARCHIVE_CHECKPOINT_FILE = 'archive_checkpoint.json'
+DOWNLOAD_CHUNK_SIZE = int(os.environ.get("DOWNLOAD_CHUNK_SIZE", str(DEFAULT_CHUNK_SIZE)))
+# 'local': un solo listado de la carpeta y búsqueda local; 'remote': una consulta a Drive por palabra clave
+ARCHIVE_LOOKUP_MODE = os.environ.get("ARCHIVE_LOOKUP_MODE", "local").lower()
+MAX_VIDEOS_PER_KEYWORD = 4
 
-if not GCP_CREDENTIALS_ENV:
-    logger.error("La variable de entorno GCP_CREDENTIALS no está definida o está vacía.")
-    exit(1)
+# Descargas concurrentes hacia el ZIP: workers y bloques en memoria por archivo
+ARCHIVE_WORKERS = int(os.environ.get("ARCHIVE_WORKERS", "4"))
+ARCHIVE_QUEUE_CHUNKS = int(os.environ.get("ARCHIVE_QUEUE_CHUNKS", "16"))
+# Reanudaciones de una descarga desde el último bloque recibido, tras agotar los reintentos de cada bloque
+ARCHIVE_DOWNLOAD_RESUMES = int(os.environ.get("ARCHIVE_DOWNLOAD_RESUMES", "3"))
+# Formatos ya comprimidos: se guardan sin comprimir (ZIP_STORED)
+STORED_EXTENSIONS = {'.mp4', '.m4v', '.mov', '.webm', '.mkv', '.avi', '.zip',
+                     '.jpg', '.jpeg', '.png', '.gif', '.mp3', '.aac'}
 
-if not VIDEOS_FOLDER_ID:
-    logger.error("La variable de entorno VIDEOS_FOLDER_ID no está definida o está vacía.")
-    exit(1)
+def validate_environment():
+    if not GCP_CREDENTIALS_ENV:
+        logger.error("La variable de entorno GCP_CREDENTIALS no está definida o está vacía.")
+        exit(1)
+
+    if not VIDEOS_FOLDER_ID:
+        logger.error("La variable de entorno VIDEOS_FOLDER_ID no está definida o está vacía.")
+        exit(1)
 
 def get_drive_service(creds_env):
     """
     Inicializa y retorna el servicio de Google Drive.
     """
     try:
-        creds_info = json.loads(creds_env)
-        creds = Credentials.from_service_account_info(
-            creds_info,
-            scopes=["https://www.googleapis.com/auth/drive"]
-        )
-        service = build('drive', 'v3', credentials=creds)
+        service = get_service('drive', 'v3', creds_env)
         logger.info("Servicio de Google Drive inicializado correctamente.")
         return service
     except Exception as e:
@@ -53,13 +76,14 @@ def list_files_in_folder(service, folder_id):
     page_token = None
     try:
         while True:
-            response = service.files().list(
+            response = metrics.api_call('drive', 'list', service.files().list(
                 q=f"'{folder_id}' in parents and trashed=false",
-                fields="nextPageToken, files(id, name)",
+                fields="nextPageToken, files(id, name, size, shortcutDetails(targetId))",
                 pageToken=page_token
-            ).execute()
+            ).execute)
             for file in response.get('files', []):
-                files_in_folder.append({'id': file['id'], 'name': file['name']})
+                files_in_folder.append({'id': file['id'], 'name': file['name'], 'size': file.get('size'),
+                                        'target_id': (file.get('shortcutDetails') or {}).get('targetId')})
             page_token = response.get('nextPageToken', None)
             if page_token is None:
                 break
@@ -69,47 +93,113 @@ def list_files_in_folder(service, folder_id):
         logger.error(f"Error al listar archivos en la carpeta {folder_id}: {e}")
         return []
 
-def search_videos_by_keyword(service, folder_id, keyword, max_results=4):
+def _keyword_search_request(service, folder_id, keyword, max_results):
+    # Escapar comillas y barras invertidas según la sintaxis de consultas de Drive
+    escaped = keyword.replace('\\', '\\\\').replace("'", "\\'")
+    query = f"'{folder_id}' in parents and trashed=false and name contains '{escaped}'"
+    return service.files().list(
+        q=query,
+        fields="files(id, name, size, shortcutDetails(targetId))",
+        pageSize=max_results
+    )
+
+def _files_from_listing(result):
+    return [{'id': f['id'], 'name': f['name'], 'size': f.get('size'),
+             'target_id': (f.get('shortcutDetails') or {}).get('targetId')}
+            for f in result.get('files', [])]
+
+def search_videos_by_keywords(service, folder_id, keywords, max_results=MAX_VIDEOS_PER_KEYWORD):
     """
-    Busca archivos en Drive cuyo nombre contenga la palabra clave.
-    Retorna hasta max_results archivos.
+    Busca los videos de varias palabras clave: una consulta 'name contains' por palabra,
+    enviadas en lotes de hasta 100 (execute_batch) en vez de una petición por palabra.
+    Retorna {keyword: [archivos]}; si la consulta de una palabra falla, queda sin videos.
     """
+    requests = {keyword: _keyword_search_request(service, folder_id, keyword, max_results)
+                for keyword in dict.fromkeys(keywords)}
+    matches = {keyword: [] for keyword in requests}
+
+    def on_result(keyword, response, error):
+        if error is not None:
+            logger.error(f"Error al buscar videos con la palabra clave '{keyword}': {error}")
+            return
+        matches[keyword] = _files_from_listing(response)
+        logger.info(f"Encontrados {len(matches[keyword])} videos para la palabra clave: '{keyword}'.")
+
     try:
-        query = f"'{folder_id}' in parents and trashed=false and name contains '{keyword}'"
-        result = service.files().list(
-            q=query,
-            fields="files(id, name)",
-            pageSize=max_results
-        ).execute()
-        files = result.get('files', [])
-        logger.info(f"Encontrados {len(files)} videos para la palabra clave: '{keyword}'.")
-        return files
+        execute_batch(service, requests, on_result)
     except Exception as e:
-        logger.error(f"Error al buscar videos con la palabra clave '{keyword}': {e}")
-        return []
+        logger.error(f"Error al buscar videos por palabra clave en lote: {e}")
+    return matches
 
-def download_file(service, file_id, destination_path):
+def tokenize_file_name(file_name):
     """
-    Descarga un archivo de Drive a una ruta local.
+    Separa el nombre de un archivo (sin extensión) en tokens normalizados:
+    mayúsculas, sin acentos y cortando en '_' y cualquier carácter no alfanumérico.
     """
-    try:
-        request = service.files().get_media(fileId=file_id)
-        fh = BytesIO()
-        downloader = MediaIoBaseDownload(fh, request)
-        done = False
-        while not done:
-            status, done = downloader.next_chunk()
-            if status:
-                logger.info(f"Descargando {destination_path}: {int(status.progress() * 100)}%")
-        with open(destination_path, 'wb') as f:
-            f.write(fh.getbuffer())
-        logger.info(f"Archivo descargado en {destination_path}")
-    except Exception as e:
-        logger.error(f"Error al descargar el archivo {file_id}: {e}")
+    stem = os.path.splitext(file_name)[0]
+    return clean_and_convert_words(re.split(r'[\W_]+', stem))
+
+def build_token_index(files):
+    """
+    Construye un índice token -> archivos en una sola pasada sobre los nombres.
+    Los archivos se recorren ordenados por nombre para que el resultado sea determinista.
+    """
+    index = {}
+    for file in sorted(files, key=lambda f: f['name']):
+        if file['name'].lower().endswith('.zip'):
+            continue
+        for token in set(tokenize_file_name(file['name'])):
+            index.setdefault(token, []).append(file)
+    return index
+
+def match_keywords(files, keywords, max_results=MAX_VIDEOS_PER_KEYWORD):
+    """
+    Empareja todas las palabras clave contra los archivos de la carpeta localmente.
+    Un archivo coincide si contiene todos los tokens de la palabra clave como tokens
+    completos de su nombre (no como subcadenas).
+    Retorna {keyword: [archivos]} con hasta 'max_results' archivos por palabra clave.
+    """
+    index = build_token_index(files)
+    matches = {}
+    for keyword in keywords:
+        tokens = clean_and_convert_words(keyword.split())
+        if not tokens:
+            matches[keyword] = []
+            continue
+        candidates = index.get(tokens[0], [])
+        for token in tokens[1:]:
+            ids = {f['id'] for f in index.get(token, [])}
+            candidates = [f for f in candidates if f['id'] in ids]
+        matches[keyword] = candidates[:max_results]
+    return matches
+
+def lookup_videos_by_keywords(service, folder_id, keywords):
+    """
+    Busca los videos de todas las palabras clave.
+    - Modo 'local': lee el índice local de la carpeta (o la lista una sola vez) y
+      empareja todo localmente.
+    - Modo 'remote': una consulta 'name contains' por palabra clave, enviadas en lotes.
+    """
+    if ARCHIVE_LOOKUP_MODE == 'remote':
+        return search_videos_by_keywords(service, folder_id, keywords)
+
+    files = None
+    if USE_DRIVE_INDEX:
+        try:
+            files = get_folder_index(folder_id, GCP_CREDENTIALS_ENV).files()
+        except Exception as e:
+            logger.warning(f"No se pudo usar el índice local de Drive, se lista la carpeta: {e}")
+    if files is None:
+        files = list_files_in_folder(service, folder_id)
+    matches = match_keywords(files, keywords)
+    for keyword, found in matches.items():
+        logger.info(f"Encontrados {len(found)} videos para la palabra clave: '{keyword}'.")
+    return matches
 
 def upload_file(service, file_path, parent_id):
     """
     Sube un archivo local a una carpeta de Drive.
+    Retorna el ID del archivo subido, o None si falló (el error queda registrado).
     """
     try:
         file_name = os.path.basename(file_path)
@@ -118,98 +208,274 @@ def upload_file(service, file_path, parent_id):
             'parents': [parent_id]
         }
         media = MediaFileUpload(file_path, resumable=True)
-        uploaded_file = service.files().create(
+        uploaded_file = metrics.api_call('drive', 'upload', service.files().create(
             body=file_metadata,
             media_body=media,
             fields='id'
-        ).execute()
+        ).execute)
         logger.info(f"Archivo {file_name} subido a Drive con ID: {uploaded_file.get('id')}")
+        return uploaded_file.get('id')
     except Exception as e:
         logger.error(f"Error al subir el archivo {file_path} a Drive: {e}")
+        return None
+
+def compression_for(file_name):
+    """
+    Retorna el método de compresión para un archivo: ZIP_STORED para formatos
+    ya comprimidos (videos, imágenes, audio) y ZIP_DEFLATED para el resto.
+    """
+    if os.path.splitext(file_name)[1].lower() in STORED_EXTENSIONS:
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+_END = object()
+
+class _QueueWriter:
+    """
+    Objeto tipo archivo que entrega cada bloque escrito a una cola acotada.
+    MediaIoBaseDownload escribe aquí y el hilo que arma el ZIP consume la cola.
+    """
+
+    def __init__(self, chunk_queue, stop_event):
+        self.chunk_queue = chunk_queue
+        self.stop_event = stop_event
+
+    def put(self, item):
+        while not self.stop_event.is_set():
+            try:
+                self.chunk_queue.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+        raise RuntimeError("Descarga cancelada.")
+
+    def write(self, data):
+        self.put(bytes(data))
+        return len(data)
 
-def zip_folder(folder_path, zip_path):
+def _download_to_queue(file, ready_queue, stop_event):
     """
-    Comprime una carpeta en un archivo ZIP.
+    Descarga un archivo de Drive por bloques y los deja en su propia cola.
+    La cola se anuncia en 'ready_queue' al comenzar, para que el escritor del ZIP
+    pueda empezar a consumirla mientras la descarga sigue.
     """
+    writer = _QueueWriter(queue.Queue(maxsize=ARCHIVE_QUEUE_CHUNKS), stop_event)
+    ready_queue.put((file, writer.chunk_queue))
     try:
-        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for root, dirs, files in os.walk(folder_path):
-                for file in files:
-                    abs_path = os.path.join(root, file)
-                    rel_path = os.path.relpath(abs_path, folder_path)
-                    zipf.write(abs_path, rel_path)
-        logger.info(f"Carpeta {folder_path} comprimida en {zip_path}")
+        # Cada worker usa su propio cliente de Drive (no son seguros entre hilos)
+        service = get_service('drive', 'v3', GCP_CREDENTIALS_ENV)
+        # Los accesos directos (videos deduplicados) se descargan desde su archivo original
+        request = service.files().get_media(fileId=file.get('target_id') or file['id'])
+        downloader = MediaIoBaseDownload(writer, request, chunksize=DOWNLOAD_CHUNK_SIZE)
+        done = False
+        resumes = 0
+        while not done:
+            try:
+                _, done = metrics.api_call('drive', 'get_media', downloader.next_chunk, num_retries=3)
+            except Exception as e:
+                # El descargador solo avanza con bloques completos: reintentar la misma
+                # llamada reanuda desde el último byte escrito, sin cortar la entrada del ZIP
+                if resumes >= ARCHIVE_DOWNLOAD_RESUMES or not is_transient_error(e):
+                    raise
+                resumes += 1
+                logger.warning(f"Error transitorio descargando {file['name']} ({e}); "
+                               f"se reanuda ({resumes}/{ARCHIVE_DOWNLOAD_RESUMES}).")
+                time.sleep(min(2 ** resumes, 30))
+        writer.put(_END)
     except Exception as e:
-        logger.error(f"Error al comprimir la carpeta {folder_path}: {e}")
+        if not stop_event.is_set():
+            writer.put(e)
 
-def main():
-    # Cargar keywords_dict.json
-    KEYWORDS_DICT_FILE = 'keywords_dict.json'
-    if not os.path.exists(KEYWORDS_DICT_FILE):
-        logger.error("No se encontró keywords_dict.json.")
-        return
+def _rebuild_zip_without(zip_path, failed):
+    """
+    Reescribe el ZIP sin las entradas de las posiciones 'failed' (descargas
+    que fallaron a mitad de camino y quedaron truncadas).
+    """
+    with zipfile.ZipFile(zip_path) as source, atomic_open(zip_path) as fh, zipfile.ZipFile(fh, 'w') as target:
+        for position, info in enumerate(source.infolist()):
+            if position in failed:
+                continue
+            with source.open(info) as src, target.open(info, 'w', force_zip64=True) as dst:
+                shutil.copyfileobj(src, dst, DOWNLOAD_CHUNK_SIZE)
 
-    with open(KEYWORDS_DICT_FILE, 'r', encoding='utf-8') as f:
-        keywords_dict = json.load(f)
+def download_files_to_zip(files, zip_path, max_workers=None):
+    """
+    Descarga en paralelo los archivos de Drive y escribe sus bloques directamente
+    en el ZIP, sin archivos intermedios. Los formatos ya comprimidos se guardan
+    con ZIP_STORED.
+    Si una descarga falla después de empezar su entrada, el ZIP se reconstruye sin
+    ella al final para no subir videos truncados.
+    Retorna la cantidad de archivos escritos completos en el ZIP.
+    """
+    workers = max_workers or ARCHIVE_WORKERS
+    ready_queue = queue.Queue()
+    stop_event = threading.Event()
+    written = 0
+    failed = set()
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(files)))) as executor, \
+            zipfile.ZipFile(zip_path, 'w') as zipf:
+        try:
+            for file in files:
+                executor.submit(_download_to_queue, file, ready_queue, stop_event)
 
-    if not keywords_dict:
-        logger.info("keywords_dict.json está vacío. No hay acciones a realizar.")
-        return
+            for _ in range(len(files)):
+                file, chunk_queue = ready_queue.get()
+                first = chunk_queue.get()
+                if isinstance(first, Exception):
+                    logger.error(f"Error al descargar el archivo {file['id']}: {first}")
+                    continue
 
-    # Obtener el último key del diccionario
-    last_key = list(keywords_dict.keys())[-1]
-    last_word_list = keywords_dict[last_key]
-    logger.info(f"Procesando el último key: '{last_key}' con palabras clave: {last_word_list}")
+                zinfo = zipfile.ZipInfo(file['name'], date_time=time.localtime()[:6])
+                zinfo.compress_type = compression_for(file['name'])
+                if file.get('size'):
+                    zinfo.file_size = int(file['size'])
+                logger.info(f"Descargando video al ZIP: {file['name']}")
+                item = first
+                position = len(zipf.infolist())
+                with zipf.open(zinfo, 'w', force_zip64=not file.get('size')) as entry:
+                    while item is not _END and not isinstance(item, Exception):
+                        entry.write(item)
+                        item = chunk_queue.get()
+                if isinstance(item, Exception):
+                    logger.error(f"Error al descargar {file['name']}, se quitará del ZIP: {item}")
+                    failed.add(position)
+                else:
+                    written += 1
+        finally:
+            stop_event.set()
+    if failed:
+        _rebuild_zip_without(zip_path, failed)
+    logger.info(f"{written} archivos escritos en {zip_path}")
+    return written
 
-    service = get_drive_service(GCP_CREDENTIALS_ENV)
+def load_archive_checkpoint():
+    path = cache_path(ARCHIVE_CHECKPOINT_FILE)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f).get('ts')
+    except (OSError, ValueError) as e:
+        logger.warning(f"No se pudo leer el checkpoint de archivos: {e}")
+        return None
 
-    # Directorio temporal local
-    temp_base = './temp_archive'
-    if os.path.exists(temp_base):
-        shutil.rmtree(temp_base)
-    os.makedirs(temp_base, exist_ok=True)
+def save_archive_checkpoint(ts):
+    with atomic_open(cache_path(ARCHIVE_CHECKPOINT_FILE), 'w', encoding='utf-8') as f:
+        json.dump({'ts': ts}, f)
+    logger.info(f"Checkpoint de archivos actualizado a {ts}.")
 
-    # Crear carpeta temporal para el último key
-    doc_local_folder = os.path.join(temp_base, last_key)
-    os.makedirs(doc_local_folder, exist_ok=True)
-    logger.info(f"Carpeta temporal creada en {doc_local_folder}")
+def documents_to_archive(history):
+    """
+    Entradas del historial a archivar en esta corrida, de la más antigua a la más reciente.
+    - Modo normal: solo la más reciente.
+    - Modo lote (DOCS_BATCH_MODE): todas las agregadas después del checkpoint de
+      archivos, es decir, los documentos que main.py procesó desde el último ZIP.
+      Sin checkpoint (primera corrida) solo la más reciente.
+    Si un documento aparece varias veces, vale su última entrada.
+    """
+    since = load_archive_checkpoint() if DOCS_BATCH_MODE else None
+    if since is None:
+        latest = history.latest()
+        return [latest] if latest is not None else []
+    entries = {}
+    for entry in history.entries_since(since):
+        entries.pop(entry['doc'], None)
+        entries[entry['doc']] = entry
+    return list(entries.values())
 
-    # Por cada palabra en last_word_list, buscar y descargar hasta 4 videos
-    for keyword in last_word_list:
-        logger.info(f"Buscando videos con la palabra clave: '{keyword}'")
-        found_videos = search_videos_by_keyword(service, VIDEOS_FOLDER_ID, keyword)
+def archive_document(service, doc_name, words, videos_by_keyword, temp_base):
+    """
+    Arma el ZIP con los videos de las palabras clave del documento y lo sube a Drive.
+    Retorna False si falló la creación o la subida del ZIP (True también cuando no
+    hay videos que archivar).
+    """
+    logger.info(f"Procesando el key: '{doc_name}' con palabras clave: {words}")
+    to_download = {}
+    for keyword in words:
+        found_videos = videos_by_keyword.get(keyword)
         if not found_videos:
             logger.info(f"No se encontraron videos para la palabra clave: '{keyword}'")
             continue
         for vid in found_videos:
-            file_id = vid['id']
-            file_name = vid['name']
-            destination_path = os.path.join(doc_local_folder, file_name)
-            logger.info(f"Descargando video: {file_name}")
-            download_file(service, file_id, destination_path)
+            # Un mismo video puede coincidir con varias palabras; se descarga una vez
+            to_download.setdefault(vid['id'], vid)
 
-    # Verificar si se descargaron videos
-    if not os.listdir(doc_local_folder):
-        logger.info(f"No se descargaron videos para el key: '{last_key}'. No se creará un archivo ZIP.")
-        shutil.rmtree(doc_local_folder)
-        shutil.rmtree(temp_base)
-        return
+    if not to_download:
+        logger.info(f"No se descargaron videos para el key: '{doc_name}'. No se creará un archivo ZIP.")
+        return True
 
-    # Crear archivo ZIP de la carpeta temporal
-    zip_path = os.path.join(temp_base, f"{last_key}.zip")
+    # Descargar los videos directamente al archivo ZIP
+    zip_path = os.path.join(temp_base, f"{doc_name}.zip")
     logger.info(f"Creando archivo ZIP: {zip_path}")
-    zip_folder(doc_local_folder, zip_path)
+    start = time.perf_counter()
+    try:
+        written = download_files_to_zip(list(to_download.values()), zip_path)
+        metrics.observe('zip', time.perf_counter() - start, os.path.getsize(zip_path))
+    except Exception as e:
+        logger.error(f"Error al crear el archivo ZIP {zip_path}: {e}")
+        if os.path.exists(zip_path):
+            os.remove(zip_path)
+        return False
+
+    # Verificar si se descargaron videos
+    if not written:
+        logger.info(f"No se descargaron videos para el key: '{doc_name}'. No se creará un archivo ZIP.")
+        os.remove(zip_path)
+        return True
 
     # Subir el archivo ZIP a VIDEOS_FOLDER_ID
     logger.info(f"Subiendo el archivo ZIP a Drive en la carpeta ID: {VIDEOS_FOLDER_ID}")
-    upload_file(service, zip_path, VIDEOS_FOLDER_ID)
+    start = time.perf_counter()
+    uploaded = upload_file(service, zip_path, VIDEOS_FOLDER_ID)
+    metrics.observe('upload', time.perf_counter() - start, os.path.getsize(zip_path))
+
+    # Limpieza: eliminar el ZIP local
+    os.remove(zip_path)
+    if uploaded is None:
+        return False
+    logger.info(f"Proceso completado para el key: '{doc_name}'")
+    return True
+
+def main():
+    setup_logging()
+    validate_environment()
+    atexit.register(write_run_metrics, 'generate_video_archives')
+
+    # Documentos a archivar: el más reciente, o en modo lote todos los procesados desde el último ZIP
+    # (se lee solo el final del historial)
+    history = KeywordHistory(KEYWORDS_HISTORY_FILE)
+    entries = documents_to_archive(history)
+    if not entries:
+        if history.latest() is None:
+            logger.info("El historial de keywords está vacío o no existe. No hay acciones a realizar.")
+        else:
+            logger.info("No hay documentos nuevos en el historial desde el último archivo. No hay acciones a realizar.")
+        return
+
+    service = get_drive_service(GCP_CREDENTIALS_ENV)
+
+    # Directorio temporal local
+    temp_base = './temp_archive'
+    if os.path.exists(temp_base):
+        shutil.rmtree(temp_base)
+    os.makedirs(temp_base, exist_ok=True)
+
+    # Buscar de una vez los videos de las palabras de todos los documentos (hasta 4 por palabra)
+    all_words = list(dict.fromkeys(w for entry in entries for w in entry.get('words', [])))
+    with metrics.stage('drive_listing'):
+        videos_by_keyword = lookup_videos_by_keywords(service, VIDEOS_FOLDER_ID, all_words)
+
+    checkpoint_blocked = False
+    for entry in entries:
+        done = archive_document(service, entry['doc'], entry.get('words', []), videos_by_keyword, temp_base)
+        # El checkpoint avanza solo mientras no haya fallado ningún documento anterior,
+        # para que los fallidos se reintenten en la próxima corrida
+        if not done:
+            checkpoint_blocked = True
+        elif DOCS_BATCH_MODE and not checkpoint_blocked and entry.get('ts') is not None:
+            save_archive_checkpoint(entry['ts'])
 
-    # Limpieza: eliminar la carpeta temporal y el ZIP local
-    shutil.rmtree(doc_local_folder)
-    if os.path.exists(zip_path):
-        os.remove(zip_path)
     shutil.rmtree(temp_base)
-    logger.info(f"Proceso completado para el key: '{last_key}'")
 
 if __name__ == "__main__":
     main()
@@ -1,80 +1,530 @@
-from googleapiclient.discovery import build
+from googleapiclient.discovery import build, build_from_document
+from googleapiclient.discovery_cache import get_static_doc
 from google.oauth2 import service_account
 from googleapiclient.http import MediaFileUpload
+from googleapiclient.errors import HttpError
+from google.auth.transport.requests import AuthorizedSession
+from google_auth_httplib2 import AuthorizedHttp
+import httplib2
+import requests
 import os
-import io
 import json
 import logging
 import traceback
-import string
 import unicodedata
 import re
+import time
+import random
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from drive_index import DriveFolderIndex
+from file_utils import cache_path
+from metrics import metrics
+from rate_limit import get_concurrency_limit
 
 logger = logging.getLogger()
 
 logger = logging.getLogger()
 
-def get_drive_service(creds_env):
-    creds_dict = json.loads(creds_env)
-    # MODIFICACIÓN: Ajustar uso a service_account.Credentials (no se había definido Credentials antes)
-    creds = service_account.Credentials.from_service_account_info(
-        creds_dict, 
-        scopes=["https://www.googleapis.com/auth/drive"]
-    )
-    service = build('drive', 'v3', credentials=creds)
+# Raíz alternativa para las APIs de Google (Drive, Docs y sus subidas); vacío = endpoints reales.
+# La usa el benchmark (bench_pipeline.py) para apuntar a servidores locales.
+GOOGLE_API_URL = os.environ.get("GOOGLE_API_URL", "").rstrip('/')
+
+# Endpoint de subidas reanudables de Drive v3
+DRIVE_UPLOAD_URL = f"{GOOGLE_API_URL or 'https://www.googleapis.com'}/upload/drive/v3/files"
+# Drive exige que cada bloque (excepto el último) sea múltiplo de 256 KiB
+RESUMABLE_CHUNK_ALIGN = 256 * 1024
+
+# Subidas en paralelo: workers, tamaño de bloque y reintentos ante errores transitorios
+UPLOAD_WORKERS = int(os.environ.get("UPLOAD_WORKERS", "4"))
+UPLOAD_CHUNK_SIZE = int(os.environ.get("UPLOAD_CHUNK_SIZE", str(8 * 1024 * 1024)))
+UPLOAD_MAX_RETRIES = int(os.environ.get("UPLOAD_MAX_RETRIES", "5"))
+# Concurrencia adaptativa (AIMD): parte de UPLOAD_WORKERS y se ajusta hasta UPLOAD_MAX_WORKERS
+ADAPTIVE_CONCURRENCY = os.environ.get("ADAPTIVE_CONCURRENCY", "1").lower() in ("1", "true", "yes")
+UPLOAD_MAX_WORKERS = int(os.environ.get("UPLOAD_MAX_WORKERS", "16"))
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+# Operaciones de metadatos agrupadas con BatchHttpRequest (Drive admite hasta 100 por lote)
+DRIVE_BATCH_SIZE = min(int(os.environ.get("DRIVE_BATCH_SIZE", "100")), 100)
+DRIVE_BATCH_MAX_RETRIES = int(os.environ.get("DRIVE_BATCH_MAX_RETRIES", "3"))
+RATE_LIMIT_REASONS = ('rateLimitExceeded', 'userRateLimitExceeded')
+
+DRIVE_SCOPES = ["https://www.googleapis.com/auth/drive"]
+DOCS_SCOPES = ["https://www.googleapis.com/auth/drive", "https://www.googleapis.com/auth/documents.readonly"]
+HTTP_TIMEOUT = float(os.environ.get("GOOGLE_HTTP_TIMEOUT", "120"))
+
+# Extracción de palabras clave de Google Docs
+DOC_TEXT_FIELDS = "body(content(paragraph(elements(textRun(content)))))"
+KEYWORDS_MARKER = "KEYWORDS"
+KEYWORDS_SCAN_CHARS = int(os.environ.get("KEYWORDS_SCAN_CHARS", "200000"))   # 0 = todo el documento
+DOCS_WORKERS = int(os.environ.get("DOCS_WORKERS", "4"))
+
+# Índice local de carpetas de Drive sincronizado con la Changes API
+USE_DRIVE_INDEX = os.environ.get("USE_DRIVE_INDEX", "1").lower() in ("1", "true", "yes")
+DRIVE_INDEX_FILE = 'drive_index.sqlite'
+_folder_indexes = {}
+_folder_indexes_lock = threading.Lock()
+
+# Registro de clientes: credenciales compartidas por proceso, servicios y sesiones por hilo
+_credentials_cache = {}
+_credentials_lock = threading.Lock()
+_clients_local = threading.local()
+
+
+def get_credentials(creds_env, scopes=DRIVE_SCOPES):
+    """
+    Retorna las credenciales de la cuenta de servicio para 'scopes', parseando el JSON
+    una sola vez por proceso.
+    """
+    key = (creds_env, tuple(scopes))
+    with _credentials_lock:
+        creds = _credentials_cache.get(key)
+        if creds is None:
+            creds = service_account.Credentials.from_service_account_info(
+                json.loads(creds_env),
+                scopes=list(scopes)
+            )
+            _credentials_cache[key] = creds
+        return creds
+
+def get_service(api, version, creds_env, scopes=DRIVE_SCOPES):
+    """
+    Retorna un cliente de googleapiclient para (api, version) reutilizable en el hilo actual.
+    - Usa el documento de discovery incluido en la librería (sin petición de red).
+    - Cada hilo tiene su propia conexión HTTP persistente, ya que httplib2 no es
+      seguro entre hilos.
+    """
+    services = getattr(_clients_local, 'services', None)
+    if services is None:
+        services = _clients_local.services = {}
+    key = (api, version, creds_env, tuple(scopes))
+    service = services.get(key)
+    if service is None:
+        transport = httplib2.Http(timeout=HTTP_TIMEOUT)
+        # Igual que googleapiclient.http.build_http: el 308 de las subidas reanudables
+        # ("Resume Incomplete") no es una redirección
+        transport.redirect_codes = transport.redirect_codes - {308}
+        http = AuthorizedHttp(get_credentials(creds_env, scopes), http=transport)
+        if GOOGLE_API_URL:
+            # Mismo documento de discovery, con la raíz (API y subidas) apuntando a GOOGLE_API_URL
+            document = json.loads(get_static_doc(api, version))
+            document['rootUrl'] = f"{GOOGLE_API_URL}/"
+            service = build_from_document(document, http=http)
+        else:
+            service = build(api, version, http=http, cache_discovery=False, static_discovery=True)
+        services[key] = service
     return service
 
+def get_authorized_session(creds_env, scopes=DRIVE_SCOPES):
+    """
+    Retorna una sesión HTTP autenticada (requests) reutilizable en el hilo actual.
+    """
+    sessions = getattr(_clients_local, 'sessions', None)
+    if sessions is None:
+        sessions = _clients_local.sessions = {}
+    key = (creds_env, tuple(scopes))
+    session = sessions.get(key)
+    if session is None:
+        session = AuthorizedSession(get_credentials(creds_env, scopes))
+        sessions[key] = session
+    return session
+
+def get_drive_service(creds_env):
+    return get_service('drive', 'v3', creds_env, DRIVE_SCOPES)
+
+
+def upload_file_to_drive(file_path, drive_folder_id, creds_env, chunk_size, max_retries, app_properties=None):
+    """
+    Sube un archivo con una sesión reanudable avanzando bloque a bloque con next_chunk().
+    Ante errores transitorios (429/5xx o de red) espera con backoff exponencial y
+    reanuda desde el último byte confirmado por Drive.
+    Retorna (file_id, reintentos_realizados).
+    """
+    file_name = os.path.basename(file_path)
+    drive_service = get_drive_service(creds_env)
+    media = MediaFileUpload(file_path, chunksize=_align_chunk_size(chunk_size), resumable=True)
+    file_metadata = {
+        'name': file_name,
+        'parents': [drive_folder_id]
+    }
+    if app_properties:
+        file_metadata['appProperties'] = app_properties
+    request = drive_service.files().create(body=file_metadata, media_body=media, fields='id')
+
+    start = time.perf_counter()
+    response = None
+    retries = 0
+    total_retries = 0
+    while response is None:
+        try:
+            status, response = metrics.api_call('drive', 'upload', request.next_chunk)
+            if status:
+                logger.info(f"Subiendo {file_name}: {int(status.progress() * 100)}%")
+            retries = 0
+        except (HttpError, ConnectionError, socket.timeout) as e:
+            if isinstance(e, HttpError) and e.resp.status not in RETRYABLE_STATUS:
+                raise
+            retries += 1
+            total_retries += 1
+            metrics.count('retries', service='drive_upload')
+            if retries > max_retries:
+                raise
+            wait = min(2 ** retries, 64) + random.random()
+            logger.warning(f"Error transitorio subiendo {file_name} ({e}); reintento {retries}/{max_retries} en {wait:.1f}s.")
+            time.sleep(wait)
+    metrics.observe('upload', time.perf_counter() - start, os.path.getsize(file_path))
+    return response.get('id'), total_retries
 
-def upload_files_to_drive(local_path, drive_folder_id, creds_env):
+def _upload_with_limit(limit, file_path, *args):
+    """
+    Sube un archivo dentro de un lugar del límite adaptativo; los reintentos por
+    errores transitorios cuentan como señal para reducir la concurrencia.
+    """
+    with limit.slot() as slot:
+        file_id, retries = upload_file_to_drive(file_path, *args)
+        slot.nbytes = os.path.getsize(file_path)
+        slot.error = retries > 0
+    return file_id, retries
+
+def upload_files_to_drive(local_path, drive_folder_id, creds_env, max_workers=None, chunk_size=None,
+                          max_retries=None, skip_existing=True, app_properties_for=None, on_uploaded=None):
+    """
+    Sube en paralelo los archivos de 'local_path' a la carpeta de Drive indicada.
+    - Omite los archivos cuyo nombre ya existe en la carpeta (subidos en una corrida anterior).
+    - Un fallo en un archivo no detiene al resto.
+    - 'app_properties_for(nombre)' da los appProperties de cada archivo y
+      'on_uploaded(nombre, file_id)' se llama tras cada subida exitosa.
+    Retorna un reporte por archivo: [{'file', 'status', 'id', 'retries', 'error'}].
+    Si algún archivo no se pudo subir, lanza una excepción al terminar.
+    """
+    workers = max_workers or UPLOAD_WORKERS
+    chunk_size = chunk_size or UPLOAD_CHUNK_SIZE
+    max_retries = UPLOAD_MAX_RETRIES if max_retries is None else max_retries
     try:
-        creds_info = json.loads(creds_env)
-        creds = service_account.Credentials.from_service_account_info(
-            creds_info,
-            scopes=['https://www.googleapis.com/auth/drive']
-        )
-        drive_service = build('drive', 'v3', credentials=creds)
-
-        for file_name in os.listdir(local_path):
+        existing = list_files_in_folder(drive_folder_id, creds_env) if skip_existing else set()
+
+        report = []
+        pendientes = []
+        for file_name in sorted(os.listdir(local_path)):
             file_path = os.path.join(local_path, file_name)
-            if os.path.isfile(file_path):
-                media = MediaFileUpload(file_path, resumable=True)
-                file_metadata = {
-                    'name': file_name,
-                    'parents': [drive_folder_id]
+            # Ignorar archivos temporales de descargas incompletas
+            if not os.path.isfile(file_path) or file_name.startswith('.'):
+                continue
+            if file_name in existing:
+                logger.info(f"{file_name} ya existe en Drive, se omite la subida.")
+                report.append({'file': file_name, 'status': 'skipped', 'id': None, 'retries': 0, 'error': None})
+                continue
+            pendientes.append(file_path)
+
+        if pendientes:
+            limit = get_concurrency_limit('subidas', workers, UPLOAD_MAX_WORKERS, adaptive=ADAPTIVE_CONCURRENCY)
+            with ThreadPoolExecutor(max_workers=min(limit.maximum, len(pendientes))) as executor:
+                futures = {
+                    executor.submit(
+                        _upload_with_limit, limit, path, drive_folder_id, creds_env, chunk_size, max_retries,
+                        app_properties_for(os.path.basename(path)) if app_properties_for else None
+                    ): path
+                    for path in pendientes
                 }
-                drive_service.files().create(body=file_metadata, media_body=media, fields='id').execute()
-                logger.info(f"Subido {file_name} a Google Drive.")
+                for future in as_completed(futures):
+                    file_name = os.path.basename(futures[future])
+                    try:
+                        file_id, retries = future.result()
+                        logger.info(f"Subido {file_name} a Google Drive.")
+                        if on_uploaded:
+                            on_uploaded(file_name, file_id)
+                        report.append({'file': file_name, 'status': 'uploaded', 'id': file_id, 'retries': retries, 'error': None})
+                    except Exception as e:
+                        logger.error(f"No se pudo subir {file_name}: {e}")
+                        report.append({'file': file_name, 'status': 'failed', 'id': None, 'retries': None, 'error': str(e)})
     except Exception as e:
         logger.error(f"Error al subir archivos a Drive: {e}")
         traceback.print_exc()
         raise e
 
-# MODIFICACIÓN: Nueva función para listar archivos en la carpeta de Drive
-def list_files_in_folder(folder_id, creds_env):
-    logger.info(f"Listando archivos en la carpeta de Drive con ID: {folder_id}")
-    creds_info = json.loads(creds_env)
-    creds = service_account.Credentials.from_service_account_info(
-        creds_info, 
-        scopes=["https://www.googleapis.com/auth/drive"]
-    )
-    drive_service = build('drive', 'v3', credentials=creds)
+    uploaded = sum(1 for r in report if r['status'] == 'uploaded')
+    skipped = sum(1 for r in report if r['status'] == 'skipped')
+    failed = [r['file'] for r in report if r['status'] == 'failed']
+    logger.info(f"Resumen de subida: {uploaded} subidos, {skipped} omitidos, {len(failed)} fallidos.")
+    if failed:
+        raise RuntimeError(f"No se pudieron subir {len(failed)} archivos a Drive: {failed}")
+    return report
 
-    files_in_folder = []
-    page_token = None
+def _align_chunk_size(chunk_size):
+    return max(RESUMABLE_CHUNK_ALIGN, (chunk_size // RESUMABLE_CHUNK_ALIGN) * RESUMABLE_CHUNK_ALIGN)
+
+def _put_upload_chunk(session, upload_url, data, offset, total_size, max_retries=5):
+    """
+    Envía un bloque de una sesión reanudable. Si falla por un error transitorio,
+    consulta cuántos bytes confirmó Drive y reenvía solo el resto del bloque.
+    Retorna (respuesta, bytes_confirmados_tras_el_envío).
+    """
+    total = str(total_size) if total_size is not None else '*'
+    sent_from = offset
+    attempt = 0
     while True:
-        response = drive_service.files().list(
-            q=f"'{folder_id}' in parents and trashed=false",
-            fields="nextPageToken, files(id, name)",
-            pageToken=page_token
-        ).execute()
-        for file in response.get('files', []):
-            files_in_folder.append(file['name'])
-        page_token = response.get('nextPageToken', None)
-        if page_token is None:
-            break
+        pending = data[sent_from - offset:]
+        if pending:
+            content_range = f"bytes {sent_from}-{sent_from + len(pending) - 1}/{total}"
+        else:
+            content_range = f"bytes */{total}"
+        try:
+            response = metrics.api_call('drive', 'upload', session.put, upload_url, data=bytes(pending),
+                                        headers={'Content-Range': content_range})
+            status = response.status_code
+        except Exception as e:
+            response, status = None, None
+            logger.warning(f"Error de red enviando bloque a Drive: {e}")
+
+        if status in (200, 201):
+            return response, offset + len(data)
+        if status == 308:
+            range_header = response.headers.get('Range')
+            confirmed = int(range_header.split('-')[1]) + 1 if range_header else offset
+            if confirmed >= offset + len(data):
+                return response, confirmed
+            sent_from = confirmed
+        elif status is not None and status not in (429, 500, 502, 503, 504):
+            raise RuntimeError(f"Drive rechazó el bloque ({status}): {response.text}")
+
+        attempt += 1
+        if attempt > max_retries:
+            raise RuntimeError(f"No se pudo enviar el bloque a Drive tras {max_retries} reintentos.")
+        time.sleep(min(2 ** attempt, 32))
+        if status != 308:
+            # Preguntar a Drive cuántos bytes quedaron persistidos antes de reintentar;
+            # si la consulta también falla, se reintenta con espera dentro del mismo límite
+            while True:
+                try:
+                    probe = metrics.api_call('drive', 'upload_status', session.put, upload_url,
+                                             headers={'Content-Range': f"bytes */{total}"})
+                    if probe.status_code in (200, 201, 308):
+                        break
+                    if probe.status_code not in RETRYABLE_STATUS:
+                        raise RuntimeError(f"Drive rechazó la consulta de la subida ({probe.status_code}): {probe.text}")
+                    logger.warning(f"Drive respondió {probe.status_code} al consultar la subida.")
+                except requests.RequestException as e:
+                    logger.warning(f"Error de red consultando la subida en Drive: {e}")
+                attempt += 1
+                if attempt > max_retries:
+                    raise RuntimeError(f"No se pudo enviar el bloque a Drive tras {max_retries} reintentos.")
+                time.sleep(min(2 ** attempt, 32))
+            if probe.status_code in (200, 201):
+                return probe, offset + len(data)
+            range_header = probe.headers.get('Range')
+            sent_from = max(offset, int(range_header.split('-')[1]) + 1) if range_header else offset
+
+def stream_upload_to_drive(chunks, file_name, drive_folder_id, creds_env, total_size=None,
+                           chunk_size=8 * RESUMABLE_CHUNK_ALIGN, mime_type='video/mp4', app_properties=None,
+                           hasher=None):
+    """
+    Sube a Drive el contenido producido por el iterable 'chunks' mediante una
+    sesión reanudable, enviando bloques a medida que llegan sin escribir a disco.
+    'total_size' es opcional; si no se conoce, se declara al enviar el último bloque.
+    Con 'hasher' (actualizado con los mismos bloques), al cerrar la sesión se agrega
+    'sha256' a los appProperties: los metadatos de la sesión se fijan al iniciarla,
+    antes de conocer el hash, así que se completan con files.update.
+    Retorna el ID del archivo creado.
+    """
+    session = get_authorized_session(creds_env)
+    chunk_size = _align_chunk_size(chunk_size)
+
+    metadata = {'name': file_name, 'parents': [drive_folder_id]}
+    if app_properties:
+        metadata['appProperties'] = app_properties
+    headers = {'X-Upload-Content-Type': mime_type}
+    if total_size is not None:
+        headers['X-Upload-Content-Length'] = str(total_size)
+    init = metrics.api_call(
+        'drive', 'upload', session.post,
+        DRIVE_UPLOAD_URL,
+        params={'uploadType': 'resumable', 'fields': 'id'},
+        json=metadata,
+        headers=headers
+    )
+    if init.status_code != 200:
+        raise RuntimeError(f"No se pudo iniciar la subida de {file_name} ({init.status_code}): {init.text}")
+    upload_url = init.headers['Location']
+
+    start = time.perf_counter()
+    buffer = bytearray()
+    offset = 0
+    for chunk in chunks:
+        buffer.extend(chunk)
+        while len(buffer) > chunk_size:
+            _, offset = _put_upload_chunk(session, upload_url, buffer[:chunk_size], offset, total_size)
+            del buffer[:chunk_size]
+
+    # Último bloque: declarar el tamaño total definitivo
+    response, _ = _put_upload_chunk(session, upload_url, buffer, offset, offset + len(buffer))
+    file_id = response.json().get('id')
+    metrics.observe('upload_stream', time.perf_counter() - start, offset + len(buffer))
+    if hasher is not None:
+        try:
+            metrics.api_call('drive', 'update', get_drive_service(creds_env).files().update(
+                fileId=file_id,
+                body={'appProperties': {'sha256': hasher.hexdigest()}},
+                fields='id'
+            ).execute)
+        except Exception as e:
+            # El archivo ya está subido; el hash sigue en el registro local de deduplicación
+            logger.warning(f"No se pudo guardar el sha256 de {file_name} en Drive: {e}")
+    logger.info(f"Subido {file_name} a Google Drive en streaming ({offset + len(buffer)} bytes).")
+    return file_id
+
+def is_transient_error(error):
+    # 429/5xx, errores de red y los 403 por límite de cuota se pueden reintentar
+    if isinstance(error, HttpError):
+        if error.resp.status in RETRYABLE_STATUS:
+            return True
+        content = error.content.decode('utf-8', 'replace') if isinstance(error.content, bytes) else str(error.content)
+        return error.resp.status == 403 and any(reason in content for reason in RATE_LIMIT_REASONS)
+    return isinstance(error, (ConnectionError, socket.timeout))
 
-    logger.info(f"Archivos encontrados en la carpeta: {files_in_folder}")
-    return set(files_in_folder)
+def execute_batch(service, requests, callback=None, batch_size=None, max_retries=None):
+    """
+    Ejecuta operaciones de metadatos ({clave: HttpRequest} sin ejecutar) agrupadas en lotes
+    de hasta 'batch_size' con BatchHttpRequest: un solo viaje HTTP por lote.
+    - 'callback(clave, respuesta, error)' se llama una vez por operación con su resultado final.
+    - Las operaciones que fallan por errores transitorios (429/5xx o límite de cuota) se
+      reenvían en un nuevo lote con backoff exponencial, hasta 'max_retries' veces.
+    Retorna {clave: respuesta} de las operaciones exitosas.
+    """
+    batch_size = min(batch_size or DRIVE_BATCH_SIZE, 100)
+    max_retries = DRIVE_BATCH_MAX_RETRIES if max_retries is None else max_retries
+    # Los IDs de un lote deben ser strings; se mapean a las claves originales
+    keys = {str(i): key for i, key in enumerate(requests)}
+    results = {}
+    pending = list(keys)
+    attempt = 0
+    while pending:
+        retry = []
+        for start in range(0, len(pending), batch_size):
+            group = pending[start:start + batch_size]
+            outcomes = {}
+
+            def on_item(request_id, response, error):
+                outcomes[request_id] = (response, error)
+
+            batch = service.new_batch_http_request(callback=on_item)
+            for request_id in group:
+                batch.add(requests[keys[request_id]], request_id=request_id)
+            try:
+                metrics.api_call('drive', 'batch', batch.execute)
+            except (HttpError, ConnectionError, socket.timeout) as e:
+                # Falló el lote completo: todas sus operaciones comparten el error
+                if not is_transient_error(e):
+                    raise
+                outcomes = {request_id: (None, e) for request_id in group}
+
+            for request_id in group:
+                response, error = outcomes.get(request_id, (None, RuntimeError("Operación sin respuesta en el lote")))
+                if error is not None and is_transient_error(error) and attempt < max_retries:
+                    retry.append(request_id)
+                    continue
+                if error is None:
+                    results[keys[request_id]] = response
+                if callback:
+                    callback(keys[request_id], response, error)
+                elif error is not None:
+                    logger.warning(f"Falló la operación {keys[request_id]} del lote: {error}")
+
+        pending = retry
+        if pending:
+            attempt += 1
+            wait = min(2 ** attempt, 32) + random.random()
+            metrics.count('retries', value=len(pending), service='drive_batch')
+            logger.warning(f"{len(pending)} operaciones del lote fallaron por errores transitorios; "
+                           f"reintento {attempt}/{max_retries} en {wait:.1f}s.")
+            time.sleep(wait)
+    return results
+
+def _shortcut_body(file_name, target_id, drive_folder_id, app_properties=None):
+    body = {
+        'name': file_name,
+        'mimeType': 'application/vnd.google-apps.shortcut',
+        'shortcutDetails': {'targetId': target_id},
+        'parents': [drive_folder_id]
+    }
+    if app_properties:
+        body['appProperties'] = app_properties
+    return body
+
+def create_shortcuts(shortcuts, drive_folder_id, creds_env):
+    """
+    Crea en lote los accesos directos [(nombre, target_id, app_properties)] en la carpeta.
+    Retorna {nombre: ID del acceso directo} de los que se crearon; los fallos quedan en el log.
+    """
+    service = get_drive_service(creds_env)
+    requests = {
+        file_name: service.files().create(body=_shortcut_body(file_name, target_id, drive_folder_id, app_properties),
+                                          fields='id')
+        for file_name, target_id, app_properties in shortcuts
+    }
+
+    def on_created(file_name, response, error):
+        if error is not None:
+            logger.warning(f"No se pudo crear el acceso directo {file_name}: {error}")
+
+    created = execute_batch(service, requests, on_created)
+    logger.info(f"{len(created)} de {len(requests)} accesos directos creados en Drive en lote.")
+    return {file_name: response.get('id') for file_name, response in created.items()}
+
+def create_shortcut(file_name, target_id, drive_folder_id, creds_env, app_properties=None):
+    """
+    Crea en la carpeta un acceso directo llamado 'file_name' que apunta al archivo 'target_id'.
+    Retorna el ID del acceso directo.
+    """
+    body = _shortcut_body(file_name, target_id, drive_folder_id, app_properties)
+    shortcut = metrics.api_call('drive', 'shortcut', get_drive_service(creds_env).files().create(body=body, fields='id').execute)
+    logger.info(f"Acceso directo {file_name} creado en Drive apuntando a {target_id}.")
+    return shortcut.get('id')
+
+def get_folder_index(folder_id, creds_env, sync=True):
+    """
+    Retorna el índice local de la carpeta 'folder_id', sincronizándolo con Drive
+    (solo los cambios desde la última corrida) si 'sync' es True.
+    """
+    with _folder_indexes_lock:
+        index = _folder_indexes.get(folder_id)
+        if index is None:
+            index = DriveFolderIndex(cache_path(DRIVE_INDEX_FILE), folder_id)
+            _folder_indexes[folder_id] = index
+    if sync:
+        index.sync(get_drive_service(creds_env))
+    return index
+
+# MODIFICACIÓN: Nueva función para listar archivos en la carpeta de Drive
+def list_files_in_folder(folder_id, creds_env, use_index=None):
+    with metrics.stage('drive_listing'):
+        logger.info(f"Listando archivos en la carpeta de Drive con ID: {folder_id}")
+        if USE_DRIVE_INDEX if use_index is None else use_index:
+            try:
+                names = get_folder_index(folder_id, creds_env).names()
+                logger.info(f"Índice local: {len(names)} archivos en la carpeta.")
+                return names
+            except Exception as e:
+                logger.warning(f"No se pudo usar el índice local de Drive, se lista la carpeta completa: {e}")
+
+        drive_service = get_drive_service(creds_env)
+
+        files_in_folder = []
+        page_token = None
+        while True:
+            response = metrics.api_call('drive', 'list', drive_service.files().list(
+                q=f"'{folder_id}' in parents and trashed=false",
+                fields="nextPageToken, files(id, name)",
+                pageToken=page_token
+            ).execute)
+            for file in response.get('files', []):
+                files_in_folder.append(file['name'])
+            page_token = response.get('nextPageToken', None)
+            if page_token is None:
+                break
+
+        logger.info(f"Archivos encontrados en la carpeta: {files_in_folder}")
+        return set(files_in_folder)
 
 
 
@@ -105,52 +555,78 @@ def clean_and_convert_words(word_list):
             cleaned.append(w_stripped)
     return cleaned
 
-def get_key_words(full_text):
+def _last_words(text, count):
+    # Toma las últimas 'count' palabras leyendo una ventana creciente desde el final del texto
+    window = 256
+    while True:
+        words = text[-window:].split()
+        # Con más de 'count' palabras la primera (posiblemente cortada) queda fuera del resultado
+        if len(words) > count or window >= len(text):
+            return words[-count:]
+        window *= 2
+
+def get_key_words(full_text, scan_chars=None):
     """
     Esta función recibe el texto completo de un documento.
     - Si encuentra una línea con la palabra "KEYWORDS" (en mayúsculas, minúsculas o combinaciones),
       retornará todas las palabras que aparecen después de esa línea.
     - Si no encuentra "KEYWORDS", retorna las últimas 10 palabras del texto completo.
-    
+
+    El texto se recorre línea por línea desde el final y la búsqueda se detiene en
+    la última línea "KEYWORDS" o tras 'scan_chars' caracteres (KEYWORDS_SCAN_CHARS,
+    0 = sin límite), por lo que el costo no depende del largo del documento.
+
     En ambos casos:
     - Las palabras se retornan en mayúsculas
     - Sin signos de puntuación ni acentos
     """
-    text_upper = full_text.upper()
-    lines = text_upper.split('\n')
-    
-    keywords_line_index = None
-    for i, line in enumerate(lines):
-        if line.strip() == "KEYWORDS":
-            keywords_line_index = i
-            break
+    scan_chars = KEYWORDS_SCAN_CHARS if scan_chars is None else scan_chars
+    stop = max(0, len(full_text) - scan_chars) if scan_chars else 0
 
-    if keywords_line_index is not None:
-        # Tomar todas las palabras después de KEYWORDS
-        after_keywords_lines = lines[keywords_line_index+1:]
-        all_after_keywords_text = ' '.join(after_keywords_lines)
-        words = all_after_keywords_text.split()
-        return clean_and_convert_words(words)
-    else:
-        all_words = text_upper.split()
-        last_10 = all_words[-10:] if len(all_words) >= 10 else all_words
-        return clean_and_convert_words(last_10)
+    end = len(full_text)
+    while end > stop:
+        start = max(full_text.rfind('\n', stop, end) + 1, stop)
+        if full_text[start:end].strip().upper() == KEYWORDS_MARKER:
+            # Tomar todas las palabras después de KEYWORDS
+            return clean_and_convert_words(full_text[end:].split())
+        end = start - 1
+
+    return clean_and_convert_words(_last_words(full_text, 10))
+
+def extract_doc_text(doc):
+    """
+    Concatena el contenido de los textRun de los párrafos del documento
+    (acumulados en una lista y unidos una sola vez).
+    """
+    parts = []
+    for content in doc.get('body', {}).get('content', []):
+        for elem in content.get('paragraph', {}).get('elements', []):
+            text = elem.get('textRun', {}).get('content')
+            if text:
+                parts.append(text)
+    return ''.join(parts)
+
+def get_doc_words(doc_id, creds_env):
+    """
+    Descarga el texto de un documento de Google Docs y retorna sus palabras clave.
+    """
+    docs_service = get_service('docs', 'v1', creds_env, DOCS_SCOPES)
+    # Pedir solo el texto de los párrafos (sin estilos, listas ni objetos incrustados)
+    with metrics.stage('doc_request'):
+        doc = metrics.api_call('docs', 'get',
+                               docs_service.documents().get(documentId=doc_id, fields=DOC_TEXT_FIELDS).execute)
+    return get_key_words(extract_doc_text(doc))
 
 def get_latest_doc_words(drive_folder_id, creds_env):
     try:
-        creds_info = json.loads(creds_env)
-        creds = service_account.Credentials.from_service_account_info(
-            creds_info,
-            scopes=['https://www.googleapis.com/auth/drive', 'https://www.googleapis.com/auth/documents.readonly']
-        )
-        drive_service = build('drive', 'v3', credentials=creds)
-
-        results = drive_service.files().list(
+        drive_service = get_service('drive', 'v3', creds_env, DOCS_SCOPES)
+
+        results = metrics.api_call('drive', 'list', drive_service.files().list(
             q=f"'{drive_folder_id}' in parents and mimeType='application/vnd.google-apps.document' and trashed=false",
             orderBy='modifiedTime desc',
             pageSize=1,
             fields="files(id, name)"
-        ).execute()
+        ).execute)
 
         files = results.get('files', [])
         if not files:
@@ -158,27 +634,78 @@ def get_latest_doc_words(drive_folder_id, creds_env):
             return None, None
 
         latest_file = files[0]
-        doc_id = latest_file['id']
         doc_name = latest_file['name']
+        last_10_words = get_doc_words(latest_file['id'], creds_env)
 
-        docs_service = build('docs', 'v1', credentials=creds)
-        doc = docs_service.documents().get(documentId=doc_id).execute()
-
-        full_text = ""
-        for content in doc.get('body', {}).get('content', []):
-            if 'paragraph' in content:
-                elements = content['paragraph'].get('elements', [])
-                for elem in elements:
-                    if 'textRun' in elem:
-                        full_text += elem['textRun'].get('content', '')
-
-        last_10_words = get_key_words(full_text)
-        
         return doc_name, last_10_words
     except Exception as e:
         logger.error(f"Error al obtener palabras del documento: {e}")
         return None, None
 
+def list_docs_modified_since(drive_folder_id, creds_env, since=None, max_docs=None):
+    """
+    Lista los documentos de la carpeta modificados después de 'since' (modifiedTime RFC 3339),
+    del más antiguo al más reciente. Sin 'since' retorna solo el más reciente.
+    Si hay más de 'max_docs', se conservan los 'max_docs' más antiguos: el checkpoint
+    avanza un lote por corrida y los siguientes quedan para las próximas. Un lote no
+    se corta entre documentos con el mismo modifiedTime, ya que el checkpoint
+    ('modifiedTime >') dejaría afuera a los que no entraron.
+    """
+    drive_service = get_service('drive', 'v3', creds_env, DOCS_SCOPES)
+    query = f"'{drive_folder_id}' in parents and mimeType='application/vnd.google-apps.document' and trashed=false"
+    if since is None:
+        max_docs = 1
+        order_by = 'modifiedTime desc'
+    else:
+        query += f" and modifiedTime > '{since}'"
+        order_by = 'modifiedTime'
+    # Uno más que el máximo para saber dónde termina el lote
+    wanted = max_docs + 1 if max_docs else None
 
+    files = []
+    page_token = None
+    while True:
+        response = metrics.api_call('drive', 'list', drive_service.files().list(
+            q=query,
+            orderBy=order_by,
+            pageSize=min(wanted or 1000, 1000),
+            fields="nextPageToken, files(id, name, modifiedTime)",
+            pageToken=page_token
+        ).execute)
+        files.extend(response.get('files', []))
+        page_token = response.get('nextPageToken')
+        if page_token is None or (wanted and len(files) >= wanted):
+            break
+    if since is None:
+        return files[:1]
+    if max_docs and len(files) > max_docs:
+        boundary = files[max_docs]['modifiedTime']
+        cut = max_docs
+        while cut > 0 and files[cut - 1]['modifiedTime'] == boundary:
+            cut -= 1
+        if cut == 0:
+            logger.warning(f"Más de {max_docs} documentos con modifiedTime {boundary}; el lote puede omitir alguno.")
+            cut = max_docs
+        logger.info(f"{len(files) - cut}+ documentos modificados quedan para la próxima corrida.")
+        files = files[:cut]
+    return files
 
-
+def get_docs_words(files, creds_env, max_workers=None):
+    """
+    Extrae en paralelo las palabras clave de varios documentos.
+    Retorna una lista alineada con 'files' con las palabras de cada documento,
+    o None para los documentos que fallaron (el error queda registrado).
+    """
+    if not files:
+        return []
+    workers = max(1, min(max_workers or DOCS_WORKERS, len(files)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(get_doc_words, f['id'], creds_env) for f in files]
+        results = []
+        for file, future in zip(files, futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                logger.error(f"Error al obtener palabras del documento {file['name']}: {e}")
+                results.append(None)
+    return results
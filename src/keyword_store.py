@@ -0,0 +1,437 @@
+import json
+import logging
+import os
+import string
+import time
+import unicodedata
+from collections import Counter
+from dataclasses import dataclass, field
+
+from file_utils import atomic_open
+
+logger = logging.getLogger()
+
+# Compactación del historial de documentos: tamaño a partir del cual se reescribe
+# y antigüedad máxima (en días) de los documentos que se conservan (0 = todos)
+KEYWORDS_HISTORY_COMPACT_BYTES = int(os.environ.get("KEYWORDS_HISTORY_COMPACT_BYTES", str(1024 * 1024)))
+KEYWORDS_HISTORY_RETENTION_DAYS = float(os.environ.get("KEYWORDS_HISTORY_RETENTION_DAYS", "0"))
+
+# Cantidad de palabras agregadas al final de used_keywords.txt (sin ordenar) a partir de la cual se reordena
+USED_KEYWORDS_COMPACT_TAIL = int(os.environ.get("USED_KEYWORDS_COMPACT_TAIL", "1000"))
+
+# Límite de apariciones de una keyword y vida media (en días) del decaimiento de su frecuencia
+KEYWORD_FREQ_LIMIT = int(os.environ.get("KEYWORD_FREQ_LIMIT", "15"))
+KEYWORD_FREQ_HALF_LIFE_DAYS = float(os.environ.get("KEYWORD_FREQ_HALF_LIFE_DAYS", "0"))   # 0 = sin decaimiento
+
+_STRIP_CHARS = string.punctuation + '¡¿«»“”‘’…' + string.whitespace
+
+
+def normalize_keyword(word):
+    """
+    Forma canónica de una palabra clave para comparar: sin signos de puntuación en
+    los extremos, en minúsculas y sin tildes ('RÍO,' -> 'rio'). La ñ se conserva.
+    """
+    word = word.strip(_STRIP_CHARS).casefold().replace('ñ', '\0')
+    word = ''.join(c for c in unicodedata.normalize('NFKD', word) if not unicodedata.combining(c))
+    return unicodedata.normalize('NFC', word.replace('\0', 'ñ'))
+
+
+@dataclass
+class KeywordSelection:
+    """
+    Resultado de classify_keywords: cada palabra de entrada queda en un solo grupo.
+    """
+    new: list = field(default_factory=list)              # palabras a buscar en Pexels
+    used: list = field(default_factory=list)             # ya usadas (o repetidas en el mismo documento)
+    stopwords: list = field(default_factory=list)
+    over_frequency: list = field(default_factory=list)   # superan el límite de frecuencia
+
+    def log(self, limit=None):
+        logger.info(f"Se encontraron {len(self.new)} nuevas palabras clave: {self.new}")
+        logger.info(f"Estas palabras ya estaban usadas y se descartan: {self.used}")
+        logger.info(f"Estas palabras fueron descartadas por ser stopwords: {self.stopwords}")
+        if self.over_frequency:
+            logger.info(f"Estas palabras aparecieron más de {limit} veces y se descartan: {self.over_frequency}")
+
+
+def classify_keywords(words, used_keywords, stopwords, freq_index=None, limit=None):
+    """
+    Clasifica las palabras en una sola pasada (cada una se normaliza una vez):
+    stopword, ya usada, sobre el límite de frecuencia de 'freq_index' o nueva.
+    'used_keywords' es un UsedKeywordStore y 'stopwords' un conjunto en minúsculas.
+    """
+    limit = KEYWORD_FREQ_LIMIT if limit is None else limit
+    selection = KeywordSelection()
+    seen = set()
+    for word in words:
+        key = normalize_keyword(word)
+        if word.lower() in stopwords or key in stopwords:
+            selection.stopwords.append(word)
+        elif key in seen or used_keywords.contains_key(key):
+            selection.used.append(word)
+        elif freq_index is not None and freq_index.exceeds(word, limit):
+            selection.over_frequency.append(word)
+        else:
+            seen.add(key)
+            selection.new.append(word)
+    return selection
+
+
+class KeywordFrequencyIndex:
+    """
+    Frecuencia de cada keyword en todos los documentos procesados, mantenida de
+    forma incremental al agregar o reemplazar un documento (consultas O(1)).
+    Con 'half_life_days' > 0 cada aparición pierde la mitad de su peso por cada
+    vida media transcurrida desde que se registró su documento; con 0 la
+    frecuencia es el conteo exacto de apariciones.
+    """
+
+    def __init__(self, path, half_life_days=KEYWORD_FREQ_HALF_LIFE_DAYS):
+        self.path = path
+        self.half_life = half_life_days * 86400
+        self._counts = {}   # keyword -> [peso, instante en que se calculó el peso]
+        self._docs = {}     # documento -> instante en que se registró
+
+    def _decay(self, elapsed):
+        if not self.half_life:
+            return 1
+        return 0.5 ** (max(elapsed, 0) / self.half_life)
+
+    def _add(self, word, amount, now):
+        score, ts = self._counts.get(word, (0, now))
+        score = score * self._decay(now - ts) + amount
+        if score <= 1e-9:
+            self._counts.pop(word, None)
+        else:
+            self._counts[word] = [score, now]
+
+    def count(self, word, now=None):
+        entry = self._counts.get(word)
+        if entry is None:
+            return 0
+        score, ts = entry
+        return score * self._decay((time.time() if now is None else now) - ts)
+
+    def __contains__(self, doc_name):
+        return doc_name in self._docs
+
+    def exceeds(self, word, limit=KEYWORD_FREQ_LIMIT):
+        return self.count(word) > limit
+
+    def set_document(self, doc_name, words, previous_words=(), now=None):
+        """
+        Registra las palabras de 'doc_name'. Si el documento ya existía, 'previous_words'
+        son sus palabras anteriores y se descuentan antes de sumar las nuevas.
+        """
+        now = time.time() if now is None else now
+        if doc_name in self._docs and previous_words:
+            weight = self._decay(now - self._docs[doc_name])
+            for word, n in Counter(previous_words).items():
+                self._add(word, -n * weight, now)
+        for word, n in Counter(words).items():
+            self._add(word, n, now)
+        self._docs[doc_name] = now
+
+    def rebuild(self, documents, now=None):
+        """
+        Reconstruye el índice desde {documento: palabras} con todos los documentos.
+        Los documentos sin fecha registrada se cuentan como recientes.
+        """
+        now = time.time() if now is None else now
+        docs = {name: self._docs.get(name, now) for name in documents}
+        self._counts = {}
+        self._docs = {}
+        for name in sorted(docs, key=docs.get):
+            self.set_document(name, documents[name], now=docs[name])
+        logger.info(f"Índice de frecuencias reconstruido con {len(docs)} documentos.")
+
+    def load(self, documents=None, marker=None):
+        """
+        Carga el índice guardado. Si no existe, se generó con otra vida media o su
+        marca no coincide con 'marker' (KeywordHistory.marker(): el índice no registró
+        la última entrada del historial, p. ej. por una corrida interrumpida entre
+        agregarla y guardar el índice), se reconstruye con 'documents()', que debe
+        retornar {documento: palabras} (solo se llama en ese caso, para no leer el
+        historial completo en cada corrida).
+        """
+        data = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"No se pudo leer {self.path}, se reconstruye: {e}")
+        self._counts = {w: list(v) for w, v in data.get('counts', {}).items()}
+        self._docs = dict(data.get('docs', {}))
+        stale = (not data or data.get('half_life_days') != self.half_life / 86400
+                 or data.get('history') != marker)
+        if documents is not None and stale:
+            self.rebuild(documents())
+        return self
+
+    def save(self, marker=None):
+        """
+        Guarda el índice junto con 'marker', la marca de la última entrada del
+        historial que ya incluye.
+        """
+        data = {
+            'half_life_days': self.half_life / 86400,
+            'history': marker,
+            'docs': self._docs,
+            'counts': {w: self._counts[w] for w in sorted(self._counts)},
+        }
+        with atomic_open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=1)
+        logger.info("Índice de frecuencias de keywords guardado correctamente.")
+
+
+class KeywordHistory:
+    """
+    Historial de palabras clave por documento en formato JSONL de solo agregado:
+    cada corrida agrega una línea {"doc", "words", "ts"} en lugar de reescribir
+    el archivo, y la última línea válida es el documento más reciente.
+    Si un documento aparece varias veces, vale su última línea; compact() elimina
+    las líneas reemplazadas y los documentos más antiguos que la retención.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    @staticmethod
+    def _parse(line):
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            return None
+        if not isinstance(entry, dict) or 'doc' not in entry:
+            return None
+        return entry
+
+    def _iter_reversed_lines(self, block_size=8192):
+        # Lee el archivo desde el final por bloques, sin recorrer el historial completo
+        with open(self.path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            position = f.tell()
+            tail = b''
+            while position > 0:
+                read = min(block_size, position)
+                position -= read
+                f.seek(position)
+                lines = (f.read(read) + tail).split(b'\n')
+                tail = lines.pop(0)
+                for line in reversed(lines):
+                    if line.strip():
+                        yield line.decode('utf-8')
+            if tail.strip():
+                yield tail.decode('utf-8')
+
+    def entries(self):
+        if not self.exists():
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                entry = self._parse(line) if line.strip() else None
+                if entry is not None:
+                    yield entry
+
+    def latest(self):
+        """
+        Retorna la entrada más reciente {'doc', 'words', 'ts'} o None si el historial está vacío.
+        """
+        if not self.exists():
+            return None
+        for line in self._iter_reversed_lines():
+            entry = self._parse(line)
+            if entry is not None:
+                return entry
+        return None
+
+    def marker(self):
+        """
+        Marca de la entrada más reciente ([documento, ts]) o None si el historial está
+        vacío; permite verificar que un índice derivado está al día sin leer todo el archivo.
+        """
+        latest = self.latest()
+        return [latest['doc'], latest.get('ts')] if latest is not None else None
+
+    def entries_since(self, ts):
+        """
+        Entradas agregadas después de 'ts', de la más antigua a la más reciente
+        (lee solo el final del archivo).
+        """
+        if not self.exists():
+            return []
+        newer = []
+        for line in self._iter_reversed_lines():
+            entry = self._parse(line)
+            if entry is None:
+                continue
+            if (entry.get('ts') or 0) <= ts:
+                break
+            newer.append(entry)
+        newer.reverse()
+        return newer
+
+    def words_for(self, doc_name):
+        """
+        Palabras registradas por última vez para 'doc_name' (lista vacía si no existe).
+        """
+        if not self.exists():
+            return []
+        for line in self._iter_reversed_lines():
+            entry = self._parse(line)
+            if entry is not None and entry['doc'] == doc_name:
+                return entry.get('words', [])
+        return []
+
+    def documents(self):
+        """
+        Retorna {documento: palabras} con la última versión de cada documento,
+        ordenado por la fecha de su última aparición.
+        """
+        docs = {}
+        for entry in self.entries():
+            docs.pop(entry['doc'], None)
+            docs[entry['doc']] = entry.get('words', [])
+        return docs
+
+    def append(self, doc_name, words, ts=None):
+        """
+        Agrega una entrada al final. Si el documento más reciente ya tiene esas mismas
+        palabras no escribe nada. Retorna True si agregó la entrada.
+        """
+        latest = self.latest()
+        if latest is not None and latest['doc'] == doc_name and latest.get('words') == list(words):
+            return False
+        entry = {'doc': doc_name, 'words': list(words), 'ts': time.time() if ts is None else ts}
+        prefix = ''
+        if self.exists() and os.path.getsize(self.path) > 0:
+            with open(self.path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                # Si una corrida anterior se interrumpió a mitad de línea, empezar en una línea nueva
+                if f.read(1) != b'\n':
+                    prefix = '\n'
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(prefix + json.dumps(entry, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        return True
+
+    def compact(self, retention_days=KEYWORDS_HISTORY_RETENTION_DAYS, now=None):
+        """
+        Reescribe el historial con una sola línea por documento (la última) y sin los
+        documentos más antiguos que 'retention_days' (0 = se conservan todos),
+        manteniendo siempre el documento más reciente.
+        Retorna la cantidad de líneas eliminadas.
+        """
+        if not self.exists():
+            return 0
+        now = time.time() if now is None else now
+        latest = {}
+        total = 0
+        for entry in self.entries():
+            total += 1
+            latest.pop(entry['doc'], None)
+            latest[entry['doc']] = entry
+        kept = list(latest.values())
+        if retention_days:
+            cutoff = now - retention_days * 86400
+            kept = [e for e in kept[:-1] if (e.get('ts') or now) >= cutoff] + kept[-1:]
+        with atomic_open(self.path, 'w', encoding='utf-8') as f:
+            for entry in kept:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        removed = total - len(kept)
+        logger.info(f"Historial de keywords compactado: {removed} líneas eliminadas, {len(kept)} documentos.")
+        return removed
+
+    def maybe_compact(self, max_bytes=KEYWORDS_HISTORY_COMPACT_BYTES):
+        """
+        Compacta solo si el archivo superó 'max_bytes'. Retorna la cantidad de líneas eliminadas.
+        """
+        if not self.exists() or os.path.getsize(self.path) <= max_bytes:
+            return 0
+        return self.compact()
+
+    def migrate_from_dict(self, keywords_dict):
+        """
+        Crea el historial a partir de un keywords_dict.json (mismo orden de documentos).
+        """
+        with atomic_open(self.path, 'w', encoding='utf-8') as f:
+            for doc_name, words in keywords_dict.items():
+                f.write(json.dumps({'doc': doc_name, 'words': words, 'ts': None}, ensure_ascii=False) + '\n')
+        logger.info(f"Historial de keywords creado con {len(keywords_dict)} documentos de keywords_dict.json.")
+
+
+class UsedKeywordStore:
+    """
+    Conjunto de palabras clave ya usadas, guardadas normalizadas (normalize_keyword)
+    en un archivo de texto de una palabra por línea.
+    - El archivo se mantiene ordenado; las palabras nuevas de cada corrida solo se
+      agregan al final, y cuando esa cola sin ordenar supera 'compact_tail' líneas
+      se reescribe ordenado (también al migrar un archivo sin normalizar).
+    - La pertenencia se consulta en un set en memoria cargado con una sola lectura.
+    """
+
+    def __init__(self, path, compact_tail=USED_KEYWORDS_COMPACT_TAIL):
+        self.path = path
+        self.compact_tail = compact_tail
+        self._keys = set()
+        self._pending = []
+
+    def __contains__(self, word):
+        return self.contains_key(normalize_keyword(word))
+
+    def __len__(self):
+        return len(self._keys)
+
+    def contains_key(self, key):
+        # Consulta con una palabra ya normalizada
+        return key in self._keys
+
+    def add(self, word):
+        key = normalize_keyword(word)
+        if key and key not in self._keys:
+            self._keys.add(key)
+            self._pending.append(key)
+
+    def update(self, words):
+        for word in words:
+            self.add(word)
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return self
+        with open(self.path, 'r', encoding='utf-8') as f:
+            lines = [line for line in f.read().split('\n') if line]
+        self._keys = set(lines)
+        self._pending = []
+        # Longitud del prefijo ordenado: lo que sigue es la cola agregada por las últimas corridas
+        sorted_prefix = 1
+        while sorted_prefix < len(lines) and lines[sorted_prefix - 1] < lines[sorted_prefix]:
+            sorted_prefix += 1
+        normalized = {normalize_keyword(line) for line in lines} - {''}
+        if normalized != self._keys or len(lines) - sorted_prefix > self.compact_tail:
+            self._keys = normalized
+            self.compact()
+        return self
+
+    def save(self):
+        """
+        Agrega al final del archivo solo las palabras nuevas desde la última carga o guardado.
+        """
+        if not self._pending:
+            return 0
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(''.join(key + '\n' for key in self._pending))
+        written = len(self._pending)
+        self._pending = []
+        return written
+
+    def compact(self):
+        with atomic_open(self.path, 'w', encoding='utf-8') as f:
+            f.write(''.join(key + '\n' for key in sorted(self._keys)))
+        self._pending = []
+        logger.info(f"used_keywords reescrito ordenado con {len(self._keys)} palabras.")
@@ -1,29 +1,36 @@
 import os
 import json
-import random
-import requests
-import time
+import atexit
 import logging
 import traceback
-import nltk
-from nltk.corpus import stopwords
-from pypexels import PyPexels
-from google_drive import get_latest_doc_words, upload_files_to_drive, list_files_in_folder
-from email_notify import send_email
+from dedup_store import get_dedup_store
+from run_journal import open_run_journal, VIDEO_UPLOADED
+from keyword_store import (KeywordFrequencyIndex, KeywordHistory, UsedKeywordStore, classify_keywords,
+                           KEYWORD_FREQ_LIMIT)
+from stopwords_es import STOPWORDS_ES
+from file_utils import atomic_open, cache_path
+from metrics import metrics, write_run_metrics
+from video_downloads import (obtener_videos, download_pending, download_vids, link_deferred_shortcuts,
+                             STREAM_TO_DRIVE)
+
+# Los clientes pesados (requests, googleapiclient, smtplib) se importan dentro de las
+# funciones que los usan, para que importar este módulo sea rápido (ver bench_startup.py)
 
-# Configuración de logging
 logger = logging.getLogger()
-logger.setLevel(logging.INFO)
 
-formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+def setup_logging():
+    # Configuración de logging (solo al ejecutar el proceso, no al importar el módulo)
+    logger.setLevel(logging.INFO)
 
-file_handler = logging.FileHandler('youtube_data.log', mode='a')
-file_handler.setFormatter(formatter)
-logger.addHandler(file_handler)
+    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
 
-console_handler = logging.StreamHandler()
-console_handler.setFormatter(formatter)
-logger.addHandler(console_handler)
+    file_handler = logging.FileHandler('youtube_data.log', mode='a')
+    file_handler.setFormatter(formatter)
+    logger.addHandler(file_handler)
+
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(formatter)
+    logger.addHandler(console_handler)
 
 # Cargar variables de entorno
 DOCS_FOLDER_ID = os.environ.get("DOCS_FOLDER_ID")           # ID de la carpeta de Drive para documentos
@@ -32,99 +39,128 @@ RECIPIENT_EMAIL = os.environ.get("RECIPIENT_EMAIL")         # Email del destinat
 API_KEY = os.environ.get("PEXELS_API_KEY")                  # API key de Pexels
 GCP_CREDENTIALS_ENV = os.environ.get("GCP_CREDENTIALS")     # Credenciales JSON de la cuenta de servicio
 
-# Validar que GCP_CREDENTIALS exista y no esté vacío
-if not GCP_CREDENTIALS_ENV:
-    logger.error("La variable de entorno GCP_CREDENTIALS no está definida o está vacía.")
-    exit(1)
+def validate_credentials():
+    # Validar que GCP_CREDENTIALS exista y no esté vacío
+    if not GCP_CREDENTIALS_ENV:
+        logger.error("La variable de entorno GCP_CREDENTIALS no está definida o está vacía.")
+        exit(1)
 
-try:
-    # Comprobar que se puede cargar el JSON
-    creds_dict = json.loads(GCP_CREDENTIALS_ENV)
-    logger.info("Credenciales GCP cargadas correctamente desde la variable de entorno.")
-except json.JSONDecodeError as e:
-    logger.error(f"Error decodificando GCP_CREDENTIALS: {e}")
-    exit(1)
+    try:
+        # Comprobar que se puede cargar el JSON
+        json.loads(GCP_CREDENTIALS_ENV)
+        logger.info("Credenciales GCP cargadas correctamente desde la variable de entorno.")
+    except json.JSONDecodeError as e:
+        logger.error(f"Error decodificando GCP_CREDENTIALS: {e}")
+        exit(1)
 
 # Archivos locales para mantener el historial
-KEYWORDS_DICT_FILE = 'keywords_dict.json'
+KEYWORDS_DICT_FILE = 'keywords_dict.json'      # formato anterior, solo para migrar
+KEYWORDS_HISTORY_FILE = 'keywords_history.jsonl'
+KEYWORDS_FREQ_FILE = 'keywords_freq.json'
 USED_KEYWORDS_FILE = 'used_keywords.txt'
 
-# Descargar las stopwords si no están disponibles
-try:
-    STOPWORDS = set(stopwords.words('spanish'))
-except LookupError:
-    logger.info("Stopwords no encontradas, descargando...")
-    nltk.download('stopwords')
-    STOPWORDS = set(stopwords.words('spanish'))
+# Motor de ejecución de búsquedas/descargas/subidas: 'sync' (por defecto) o 'async'
+PIPELINE_ENGINE = os.environ.get("PIPELINE_ENGINE", "sync").lower()
+
+# Modo lote: procesar todos los documentos modificados desde la última corrida, no solo el más reciente
+DOCS_BATCH_MODE = os.environ.get("DOCS_BATCH_MODE", "").lower() in ("1", "true", "yes")
+DOCS_BATCH_MAX = int(os.environ.get("DOCS_BATCH_MAX", "20"))
+DOCS_CHECKPOINT_FILE = 'docs_checkpoint.json'
 
+# Stopwords en español incluidas en el paquete (sin NLTK ni descargas)
+STOPWORDS = STOPWORDS_ES
 
-def load_keywords_dict():
-    logger.info("Cargando diccionario de keywords.")
-    if os.path.exists(KEYWORDS_DICT_FILE):
+
+def load_keyword_history():
+    logger.info("Cargando historial de keywords.")
+    history = KeywordHistory(KEYWORDS_HISTORY_FILE)
+    if not history.exists() and os.path.exists(KEYWORDS_DICT_FILE):
+        # Migración única desde el formato anterior
         with open(KEYWORDS_DICT_FILE, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        logger.info("keywords_dict cargado correctamente.")
-        return data
-    logger.info("No existe keywords_dict.json, se retorna diccionario vacío.")
-    return {}
-
-def save_keywords_dict(keywords_dict, doc_name, last_10_words):
-    logger.info("Guardando keywords_dict actualizado.")
+            history.migrate_from_dict(json.load(f))
+    return history
+
+def save_keyword_history(history, freq_index, doc_name, last_10_words):
     logger.info(f"Se agregan/actualizan las últimas 10 palabras para el documento '{doc_name}': {last_10_words}")
-    with open(KEYWORDS_DICT_FILE, 'w', encoding='utf-8') as f:
-        json.dump(keywords_dict, f, ensure_ascii=False, indent=4)
-    logger.info("keywords_dict guardado correctamente.")
+    previous_words = history.words_for(doc_name) if doc_name in freq_index else []
+    if history.append(doc_name, last_10_words):
+        freq_index.set_document(doc_name, last_10_words, previous_words)
+        logger.info("Historial de keywords actualizado correctamente.")
+    else:
+        logger.info("El documento ya estaba registrado con las mismas palabras, no se modifica el historial.")
+    if history.maybe_compact():
+        freq_index.rebuild(history.documents())
+    freq_index.save(history.marker())
 
 def load_used_keywords():
     logger.info("Cargando palabras clave usadas.")
-    used = set()
-    if os.path.exists(USED_KEYWORDS_FILE):
-        with open(USED_KEYWORDS_FILE, 'r', encoding='utf-8') as f:
-            for line in f:
-                used.add(line.strip())
-        logger.info("used_keywords cargado correctamente.")
-    else:
-        logger.info("No existe used_keywords.txt, se retorna conjunto vacío.")
+    used = UsedKeywordStore(USED_KEYWORDS_FILE).load()
+    logger.info(f"used_keywords cargado correctamente ({len(used)} palabras).")
     return used
 
 def save_used_keywords(used):
     logger.info("Guardando palabras clave usadas actualizadas.")
-    with open(USED_KEYWORDS_FILE, 'w', encoding='utf-8') as f:
-        for w in used:
-            f.write(w+'\n')
-    logger.info("used_keywords guardado correctamente.")
+    written = used.save()
+    logger.info(f"used_keywords guardado correctamente ({written} palabras nuevas).")
 
-def filter_new_keywords(all_keywords, used_keywords_set):
+def filter_new_keywords(all_keywords, used_keywords, freq_index=None):
     logger.info("Filtrando nuevas palabras clave.")
-    filtered = [w for w in all_keywords if w.lower() not in STOPWORDS]
-    new = [w for w in filtered if w not in used_keywords_set]
-    logger.info(f"Se encontraron {len(new)} nuevas palabras clave: {new}")
-    old = [w for w in all_keywords if w in used_keywords_set]
-    logger.info(f"Estas palabras ya estaban usadas y se descartan: {old}")
-    discarded = [w for w in all_keywords if w.lower() in STOPWORDS]
-    logger.info(f"Estas palabras fueron descartadas por ser stopwords: {discarded}")
-    return new
-
-def query_frequency_exceeds_limit(keywords_dict, query, limit=15):
-    # Contar cuántas veces aparece 'query' en todos los valores del diccionario
-    count = sum(value.count(query) for value in keywords_dict.values())
-    return count > limit
-
-def obtener_videos(py_pexel, query, max_retries=3):
-    retries = 0
-    while retries < max_retries:
-        page = random.randint(1,4)
-        search_videos_page = py_pexel.videos_search(query=query, page=page, per_page=4)
-        entries = list(search_videos_page.entries)
-        if len(entries) == 0:
-            logger.warning(f"No se encontraron videos para '{query}' en la página {page}. Reintentando...")
-            retries += 1
-            time.sleep(2)
-        else:
-            logger.info(f"Se encontraron {len(entries)} videos para '{query}' en la página {page}.")
-            return search_videos_page
-    logger.error(f"No se encontraron videos para '{query}' después de {max_retries} intentos.")
-    return None
+    with metrics.stage('keyword_filter'):
+        selection = classify_keywords(all_keywords, used_keywords, STOPWORDS, freq_index, KEYWORD_FREQ_LIMIT)
+    selection.log(KEYWORD_FREQ_LIMIT)
+    return selection.new
+
+def load_docs_checkpoint():
+    path = cache_path(DOCS_CHECKPOINT_FILE)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f).get('modified_time')
+    except (OSError, ValueError) as e:
+        logger.warning(f"No se pudo leer el checkpoint de documentos: {e}")
+        return None
+
+def save_docs_checkpoint(modified_time):
+    with atomic_open(cache_path(DOCS_CHECKPOINT_FILE), 'w', encoding='utf-8') as f:
+        json.dump({'modified_time': modified_time}, f)
+    logger.info(f"Checkpoint de documentos actualizado a {modified_time}.")
+
+def fetch_docs_words():
+    """
+    Retorna ([(nombre_documento, palabras)], checkpoint).
+    - Modo normal: solo el documento modificado más recientemente (checkpoint None).
+    - Modo lote (DOCS_BATCH_MODE): los documentos modificados desde el último
+      checkpoint, extraídos en paralelo y ordenados del más antiguo al más reciente
+      (a lo sumo DOCS_BATCH_MAX por corrida; el resto queda para las siguientes).
+      El checkpoint es el modifiedTime del último documento leído sin errores antes
+      del primer fallo, para que un documento que falló se reintente en la próxima corrida.
+    """
+    from google_drive import get_latest_doc_words, list_docs_modified_since, get_docs_words
+
+    if not DOCS_BATCH_MODE:
+        doc_name, words = get_latest_doc_words(DOCS_FOLDER_ID, GCP_CREDENTIALS_ENV)
+        return ([(doc_name, words)] if doc_name is not None else []), None
+
+    since = load_docs_checkpoint()
+    files = list_docs_modified_since(DOCS_FOLDER_ID, GCP_CREDENTIALS_ENV, since, DOCS_BATCH_MAX)
+    logger.info(f"Modo lote: {len(files)} documentos modificados desde {since or 'el inicio (solo el más reciente)'}.")
+    results = get_docs_words(files, GCP_CREDENTIALS_ENV)
+    checkpoint = since
+    for file, words in zip(files, results):
+        if words is None:
+            # Con el mismo modifiedTime que el fallido, el checkpoint también lo dejaría afuera
+            if checkpoint == file['modifiedTime']:
+                checkpoint = max((f['modifiedTime'] for f in files if f['modifiedTime'] < checkpoint),
+                                 default=since)
+            break
+        checkpoint = file['modifiedTime']
+    docs = [(file['name'], words) for file, words in zip(files, results) if words is not None]
+    return docs, checkpoint
+
+def load_keyword_frequency(history):
+    # Índice de frecuencias guardado junto al historial (se reconstruye desde él si falta)
+    return KeywordFrequencyIndex(KEYWORDS_FREQ_FILE).load(history.documents, history.marker())
 
 # def download_vids(search_videos_page, videos_en_drive, query, prefijo='', verbose=True):
 #     logger.info("Iniciando descarga de videos.")
@@ -171,156 +207,170 @@ def obtener_videos(py_pexel, query, max_retries=3):
 #     logger.info("Descarga de videos finalizada.")
 #     return archvi, nueva_info
 
-def download_vids(search_videos_page, videos_en_drive, query, prefijo='', verbose=True):
-    logger.info("Iniciando descarga de videos.")
-    archvi = []
-    nueva_info = False
-    download_folder = './temp_videos'
-    if not os.path.exists(download_folder):
-        os.makedirs(download_folder, exist_ok=True)
-        logger.info(f"Carpeta {download_folder} creada.")
-
-    for i, video in enumerate(search_videos_page.entries):
-        # Obtener la mejor calidad disponible (asumiendo el primer archivo como el de mayor calidad)
-        video_files = video.video_files
-        if not video_files:
-            logger.warning(f"No se encontraron video_files para el video {video.id}")
-            continue
-
-        # Seleccionar el primer archivo de video como el más representativo
-        best_file = video_files[0]
-        resolution = f"{best_file['width']}x{best_file['height']}"
-        orientation = "VERTICAL" if best_file['height'] > best_file['width'] else "HORIZONTAL"
-
-        # Incluir el concepto, resolución y orientación en el nombre del archivo
-        nombre_archivo = f"{prefijo}{query}_{resolution}_{orientation}_{video.url.split('/')[-2]}.mp4"
-        archvi.append(nombre_archivo)
-
-        # Verificar si ya existe en Drive
-        if nombre_archivo in videos_en_drive:
-            logger.info(f"El video {nombre_archivo} ya existe en Drive, se omite descarga.")
-            continue
-
-        if verbose:
-            logger.info(f"Descargando {nombre_archivo}")
-
-        # Descargar el archivo
-        data_url = best_file['link']
-        r = requests.get(data_url)
-
-        rcod = r.status_code
-        if 200 <= rcod < 300:
-            file_path = os.path.join(download_folder, nombre_archivo)
-            with open(file_path, 'wb') as outfile:
-                outfile.write(r.content)
-            nueva_info = True
-            logger.info(f"Video {nombre_archivo} descargado correctamente en {file_path}.")
-        else:
-            logger.warning(f"No se pudo descargar {nombre_archivo}. Código: {rcod}")
-
-        time.sleep(5)
-
-    logger.info("Descarga de videos finalizada.")
-    return archvi, nueva_info
-
-
-logger.info("Iniciando proceso principal.")
-
-try:
-    doc_name, last_10_words = get_latest_doc_words(DOCS_FOLDER_ID, GCP_CREDENTIALS_ENV)
-    if doc_name is None:
-        logger.info("No se encontraron documentos, se termina el proceso.")
-        exit(0)
-    logger.info(f"Documento obtenido: {doc_name}, últimas palabras: {last_10_words}")
-
-    # Cargar keywords_dict y used_keywords
-    keywords_dict = load_keywords_dict()
-    used_keywords = load_used_keywords()
-
-    # Actualizar keywords_dict con el doc actual
-    keywords_dict[doc_name] = last_10_words
-    save_keywords_dict(keywords_dict, doc_name, last_10_words)
-
-    # Filtrar nuevas palabras
-    new_keywords = filter_new_keywords(last_10_words, used_keywords)
 
-    # Descartar keywords que aparezcan más de 15 veces
-    filtered_new_keywords = []
-    for q in new_keywords:
-        if query_frequency_exceeds_limit(keywords_dict, q):
-            logger.info(f"La keyword '{q}' ha aparecido más de 15 veces. Se descarta.")
+def main():
+    from pexels_client import PexelsClient
+    from google_drive import upload_files_to_drive, list_files_in_folder
+    from email_notify import send_email
+
+    setup_logging()
+    validate_credentials()
+    # Al terminar (con éxito, exit() o error) se escriben las métricas de la corrida
+    atexit.register(write_run_metrics, 'main')
+
+    logger.info("Iniciando proceso principal.")
+
+    try:
+        with metrics.stage('doc_fetch'):
+            docs, docs_checkpoint = fetch_docs_words()
+        if not docs:
+            logger.info("No se encontraron documentos, se termina el proceso.")
+            exit(0)
+        for name, words in docs:
+            logger.info(f"Documento obtenido: {name}, últimas palabras: {words}")
+        doc_name = ', '.join(name for name, _ in docs)
+        # Unión de las palabras de todos los documentos (classify_keywords descarta repetidas)
+        last_10_words = [w for _, words in docs for w in words]
+
+        # Cargar el historial de keywords, su índice de frecuencias y used_keywords
+        history = load_keyword_history()
+        freq_index = load_keyword_frequency(history)
+        used_keywords = load_used_keywords()
+
+        # Agregar los docs al historial y al índice de frecuencias
+        for name, words in docs:
+            save_keyword_history(history, freq_index, name, words)
+
+        # Seleccionar en una sola pasada las palabras nuevas, no usadas y bajo el límite de frecuencia
+        filtered_new_keywords = filter_new_keywords(last_10_words, used_keywords, freq_index)
+
+        # Retomar las palabras que una corrida anterior dejó a medias (bitácora en .cache)
+        journal = open_run_journal()
+        resumed = [q for q in journal.pending_keywords() if q not in filtered_new_keywords]
+        if resumed:
+            logger.info(f"Se retoman palabras clave de la corrida anterior: {resumed}")
+            filtered_new_keywords = resumed + filtered_new_keywords
+        journal.start(filtered_new_keywords)
+
+        upload_errors = None
+        if not filtered_new_keywords:
+            logger.info("No hay palabras nuevas (o se descartaron por frecuencia), no se descargan videos.")
+            nueva_info = False
+        elif PIPELINE_ENGINE == 'async':
+            from engine import run_keywords_async
+
+            py_pexel = PexelsClient(api_key=API_KEY)
+            videos_en_drive = list_files_in_folder(VIDEOS_FOLDER_ID, GCP_CREDENTIALS_ENV)
+            # Búsquedas, descargas y subidas concurrentes; las subidas ocurren dentro del motor
+            used_queries, nueva_info, upload_errors = run_keywords_async(py_pexel, videos_en_drive, filtered_new_keywords,
+                                                                         journal=journal)
+            used_keywords.update(used_queries)
+            save_used_keywords(used_keywords)
         else:
-            filtered_new_keywords.append(q)
+            nueva_info = False
+            stream_errors = []
+            py_pexel = PexelsClient(api_key=API_KEY)
+
+            # Obtener lista de videos en Drive para evitar duplicados
+            videos_en_drive = list_files_in_folder(VIDEOS_FOLDER_ID, GCP_CREDENTIALS_ENV)
+
+            for query in filtered_new_keywords:
+                try:
+                    pendientes = journal.planned(query)
+                    if pendientes is not None:
+                        # Ya se buscó en una corrida anterior: continuar con sus videos sin volver a buscar
+                        logger.info(f"Se retoma '{query}' con {len(pendientes)} videos pendientes.")
+                        info_descargada = download_pending(pendientes, query, journal=journal,
+                                                           upload_errors=stream_errors)
+                    else:
+                        logger.info(f"Buscando videos con la palabra clave: {query}")
+                        search_videos_page = obtener_videos(py_pexel, query)
+                        if search_videos_page is None:
+                            logger.info(f"No se encontraron videos para '{query}' tras reintentos.")
+                            journal.record_plan(query, None)
+                            continue
+                        archivi, info_descargada = download_vids(search_videos_page, videos_en_drive, query,
+                                                                 prefijo='', verbose=True, journal=journal,
+                                                                 upload_errors=stream_errors)
+                    if info_descargada:
+                        used_keywords.add(query)
+                        # Guardar al terminar cada palabra (solo se agregan las nuevas al archivo)
+                        save_used_keywords(used_keywords)
+                        nueva_info = True
+                except Exception as e:
+                    logger.error(f"Se obtuvo un error con la palabra clave: {query}, con el error {e}")
+                    continue
 
-    if not filtered_new_keywords:
-        logger.info("No hay palabras nuevas (o se descartaron por frecuencia), no se descargan videos.")
-        nueva_info = False
-    else:
-        nueva_info = False
-        py_pexel = PyPexels(api_key=API_KEY)
+            save_used_keywords(used_keywords)
+            # En modo streaming las subidas ocurren durante la descarga: sus fallos se reportan igual
+            upload_errors = stream_errors or None
 
-        # Obtener lista de videos en Drive para evitar duplicados
-        videos_en_drive = list_files_in_folder(VIDEOS_FOLDER_ID, GCP_CREDENTIALS_ENV)
+        folder_link = f"https://drive.google.com/drive/folders/{VIDEOS_FOLDER_ID}"
 
-        for query in filtered_new_keywords:
+        # Subir o enviar correo
+        if nueva_info:
+            logger.info("Se encontraron nuevos videos, intentando subir a Drive.")
             try:
-                logger.info(f"Buscando videos con la palabra clave: {query}")
-                search_videos_page = obtener_videos(py_pexel, query)
-                if search_videos_page is None:
-                    logger.info(f"No se encontraron videos para '{query}' tras reintentos.")
-                    continue
+                if upload_errors:
+                    raise RuntimeError(f"No se pudieron subir {len(upload_errors)} archivos a Drive: {upload_errors}")
+                elif STREAM_TO_DRIVE:
+                    logger.info("Modo streaming: los videos ya se subieron a Drive durante la descarga.")
+                elif upload_errors is not None:
+                    logger.info("Motor asíncrono: los videos ya se subieron a Drive durante la descarga.")
                 else:
-                    archivi, info_descargada = download_vids(search_videos_page, videos_en_drive, query, prefijo='', verbose=True)
-                    if info_descargada:
-                        used_keywords.add(query)
-                        nueva_info = True
-            except Exception as e::
-                logger.error(f"Se obtuvo un error con la palabra clave: {query}, con el error {e}")
-                continue
-
-        save_used_keywords(used_keywords)
-
-    folder_link = f"https://drive.google.com/drive/folders/{VIDEOS_FOLDER_ID}"
-
-    # Subir o enviar correo
-    if nueva_info:
-        logger.info("Se encontraron nuevos videos, intentando subir a Drive.")
-        try:
-            upload_files_to_drive('./temp_videos', VIDEOS_FOLDER_ID, GCP_CREDENTIALS_ENV)
-        except Exception as e:
-            logger.error(f"No se pudo subir a Drive: {e}")
-            traceback.print_exc()
-            email_subject = "Información lista en el repositorio (Error en Drive)"
-            email_body = (f"Hubo un problema subiendo los videos a Drive.\n\n"
-                          f"Documento procesado: {doc_name}\n"
-                          f"Palabras añadidas a keywords_dict: {last_10_words}\n"
-                          f"Revise el repositorio local y logs para más detalles.")
-            send_email(RECIPIENT_EMAIL, email_subject, email_body)
+                    store = get_dedup_store()
+
+                    def on_uploaded(nombre_archivo, file_id):
+                        store.record_upload(nombre_archivo, file_id)
+                        journal.mark_video(nombre_archivo, VIDEO_UPLOADED)
+
+                    upload_files_to_drive('./temp_videos', VIDEOS_FOLDER_ID, GCP_CREDENTIALS_ENV,
+                                          app_properties_for=store.app_properties,
+                                          on_uploaded=on_uploaded)
+                link_deferred_shortcuts()
+            except Exception as e:
+                logger.error(f"No se pudo subir a Drive: {e}")
+                traceback.print_exc()
+                email_subject = "Información lista en el repositorio (Error en Drive)"
+                email_body = (f"Hubo un problema subiendo los videos a Drive.\n\n"
+                              f"Documento procesado: {doc_name}\n"
+                              f"Palabras añadidas al historial de keywords: {last_10_words}\n"
+                              f"Revise el repositorio local y logs para más detalles.")
+                send_email(RECIPIENT_EMAIL, email_subject, email_body)
+            else:
+                logger.info("Videos subidos a Drive exitosamente.")
+                journal.finish()
+                email_subject = "Información lista en Drive"
+                email_body = (f"La información ha sido subida exitosamente a Google Drive.\n\n"
+                              f"Documento procesado: {doc_name}\n"
+                              f"Últimas palabras agregadas al historial de keywords: {last_10_words}\n"
+                              f"Puede revisar los archivos en: {folder_link}\n")
+                send_email(RECIPIENT_EMAIL, email_subject, email_body)
         else:
-            logger.info("Videos subidos a Drive exitosamente.")
-            email_subject = "Información lista en Drive"
-            email_body = (f"La información ha sido subida exitosamente a Google Drive.\n\n"
+            journal.finish()
+            logger.info("No hubo nueva info, notificando vía correo.")
+            email_subject = "Sin nueva información"
+            email_body = (f"No hubo nueva información esta vez.\n\n"
                           f"Documento procesado: {doc_name}\n"
-                          f"Últimas palabras agregadas a keywords_dict: {last_10_words}\n"
-                          f"Puede revisar los archivos en: {folder_link}\n")
+                          f"Últimas palabras procesadas: {last_10_words}\n"
+                          f"Carpeta de Drive: {folder_link}\n")
             send_email(RECIPIENT_EMAIL, email_subject, email_body)
-    else:
-        logger.info("No hubo nueva info, notificando vía correo.")
-        email_subject = "Sin nueva información"
-        email_body = (f"No hubo nueva información esta vez.\n\n"
-                      f"Documento procesado: {doc_name}\n"
-                      f"Últimas palabras procesadas: {last_10_words}\n"
-                      f"Carpeta de Drive: {folder_link}\n")
+
+        if docs_checkpoint:
+            save_docs_checkpoint(docs_checkpoint)
+
+    except Exception as e:
+        logger.error(f"Error en el proceso principal: {e}")
+        traceback.print_exc()
+        email_subject = "Error en el proceso"
+        email_body = (f"Ha ocurrido un error: {e}\n\n"
+                      f"Documento procesado (si aplica): {doc_name if 'doc_name' in locals() else 'No disponible'}\n"
+                      f"Revisar logs para más detalles.")
         send_email(RECIPIENT_EMAIL, email_subject, email_body)
+        exit(1)
+
+    logger.info("Proceso finalizado con éxito.")
+
 
-except Exception as e:
-    logger.error(f"Error en el proceso principal: {e}")
-    traceback.print_exc()
-    email_subject = "Error en el proceso"
-    email_body = (f"Ha ocurrido un error: {e}\n\n"
-                  f"Documento procesado (si aplica): {doc_name if 'doc_name' in locals() else 'No disponible'}\n"
-                  f"Revisar logs para más detalles.")
-    send_email(RECIPIENT_EMAIL, email_subject, email_body)
-    exit(1)
-
-logger.info("Proceso finalizado con éxito.")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from file_utils import atomic_open
+
+logger = logging.getLogger()
+
+# Carpeta donde cada corrida deja sus métricas (JSON y textfile de Prometheus)
+METRICS_DIR = os.environ.get("METRICS_DIR", "metrics")
+METRICS_PREFIX = "pexels_pipeline"
+
+
+class Metrics:
+    """
+    Registro en memoria de las métricas de una corrida, seguro entre hilos.
+    - Etapas: tiempo total, cantidad y máximo de cada etapa (búsqueda en Pexels,
+      descarga, subida, listado de Drive, zip...), más los bytes transferidos para
+      calcular el rendimiento en MB/s.
+    - Contadores: llamadas a APIs, reintentos, etc., con etiquetas.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._counters = {}
+        self.started_at = time.time()
+
+    def observe(self, stage, seconds, nbytes=0):
+        with self._lock:
+            entry = self._stages.setdefault(stage, {'count': 0, 'seconds': 0.0, 'max_seconds': 0.0, 'bytes': 0})
+            entry['count'] += 1
+            entry['seconds'] += seconds
+            entry['max_seconds'] = max(entry['max_seconds'], seconds)
+            entry['bytes'] += nbytes
+
+    @contextmanager
+    def stage(self, stage):
+        """
+        Mide el tiempo del bloque como una observación de 'stage' (también si falla).
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def count(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def api_call(self, service, method, call, *args, **kwargs):
+        """
+        Ejecuta una llamada a una API (p. ej. request.execute o request.next_chunk de
+        googleapiclient) y la cuenta en 'api_calls', también si falla o es un reintento.
+        """
+        self.count('api_calls', service=service, method=method)
+        return call(*args, **kwargs)
+
+    def snapshot(self):
+        with self._lock:
+            stages = {}
+            for name, entry in self._stages.items():
+                stages[name] = dict(entry)
+                if entry['bytes'] and entry['seconds'] > 0:
+                    stages[name]['mb_per_sec'] = entry['bytes'] / entry['seconds'] / (1024 * 1024)
+            counters = [{'name': name, 'labels': dict(labels), 'value': value}
+                        for (name, labels), value in sorted(self._counters.items())]
+        return {
+            'started_at': self.started_at,
+            'duration_seconds': time.time() - self.started_at,
+            'stages': stages,
+            'counters': counters,
+        }
+
+    def to_prometheus(self, job):
+        """
+        Formato de texto de Prometheus (para el textfile collector de node_exporter).
+        """
+        data = self.snapshot()
+
+        def fmt_labels(labels):
+            labels = dict(labels, job=job)
+            inner = ','.join(f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+                             for k, v in sorted(labels.items()))
+            return '{' + inner + '}'
+
+        lines = [
+            f"# TYPE {METRICS_PREFIX}_run_timestamp_seconds gauge",
+            f"{METRICS_PREFIX}_run_timestamp_seconds{fmt_labels({})} {data['started_at']:.3f}",
+            f"# TYPE {METRICS_PREFIX}_run_duration_seconds gauge",
+            f"{METRICS_PREFIX}_run_duration_seconds{fmt_labels({})} {data['duration_seconds']:.3f}",
+        ]
+        stage_metrics = (('stage_seconds_sum', 'seconds', 'counter'), ('stage_seconds_count', 'count', 'counter'),
+                         ('stage_seconds_max', 'max_seconds', 'gauge'), ('stage_bytes_total', 'bytes', 'counter'),
+                         ('stage_throughput_mb_per_sec', 'mb_per_sec', 'gauge'))
+        for metric, field, kind in stage_metrics:
+            rows = [(stage, entry[field]) for stage, entry in sorted(data['stages'].items()) if field in entry]
+            if not rows:
+                continue
+            lines.append(f"# TYPE {METRICS_PREFIX}_{metric} {kind}")
+            for stage, value in rows:
+                lines.append(f"{METRICS_PREFIX}_{metric}{fmt_labels({'stage': stage})} {value}")
+        typed = set()
+        for counter in data['counters']:
+            name = f"{METRICS_PREFIX}_{counter['name']}_total"
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            lines.append(f"{name}{fmt_labels(counter['labels'])} {counter['value']}")
+        return '\n'.join(lines) + '\n'
+
+    def write(self, job, directory=None):
+        """
+        Escribe '<job>.json' y '<job>.prom' en 'directory' (METRICS_DIR por defecto).
+        """
+        directory = directory or METRICS_DIR
+        os.makedirs(directory, exist_ok=True)
+        json_path = os.path.join(directory, f"{job}.json")
+        prom_path = os.path.join(directory, f"{job}.prom")
+        with atomic_open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(dict(self.snapshot(), job=job), f, ensure_ascii=False, indent=2)
+        with atomic_open(prom_path, 'w', encoding='utf-8') as f:
+            f.write(self.to_prometheus(job))
+        logger.info(f"Métricas de la corrida guardadas en {json_path} y {prom_path}.")
+
+
+# Registro compartido por todos los módulos del proceso
+metrics = Metrics()
+
+
+def write_run_metrics(job):
+    try:
+        metrics.write(job)
+    except OSError as e:
+        logger.warning(f"No se pudieron guardar las métricas de la corrida: {e}")
@@ -0,0 +1,120 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger()
+
+
+def _filters_key(filters):
+    return json.dumps(sorted((filters or {}).items()), ensure_ascii=False)
+
+def make_cache_key(query, page, per_page, filters=None):
+    """
+    Clave estable para una búsqueda: (query, page, per_page, filtros ordenados).
+    """
+    return json.dumps([query, int(page), int(per_page), _filters_key(filters)], ensure_ascii=False)
+
+
+class PexelsResponseCache:
+    """
+    Caché persistente (SQLite) de respuestas de búsqueda de Pexels.
+    - Cada entrada vence tras 'ttl' segundos; una entrada vencida con ETag
+      puede revalidarse con If-None-Match en lugar de descargarse de nuevo.
+    - El tamaño total está acotado por 'max_bytes'; al superarlo se eliminan
+      las entradas usadas hace más tiempo (LRU).
+    """
+
+    def __init__(self, db_path, ttl, max_bytes):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                query TEXT NOT NULL,
+                page INTEGER NOT NULL,
+                per_page INTEGER NOT NULL,
+                filters TEXT NOT NULL,
+                body TEXT NOT NULL,
+                etag TEXT,
+                fetched_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                size INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS responses_query ON responses (query, per_page, filters);
+            CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at);
+        """)
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+    def get(self, key):
+        """
+        Retorna {'body', 'etag', 'fresh'} o None si no hay entrada.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT body, etag, fetched_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+        body, etag, fetched_at = row
+        return {'body': json.loads(body), 'etag': etag, 'fresh': time.time() - fetched_at < self.ttl}
+
+    def put(self, query, page, per_page, filters, body, etag=None):
+        key = make_cache_key(query, page, per_page, filters)
+        data = json.dumps(body, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                """INSERT INTO responses (key, query, page, per_page, filters, body, etag, fetched_at, accessed_at, size)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT(key) DO UPDATE SET body = excluded.body, etag = excluded.etag,
+                       fetched_at = excluded.fetched_at, accessed_at = excluded.accessed_at, size = excluded.size""",
+                (key, query, int(page), int(per_page), _filters_key(filters), data, etag, now, now, len(data))
+            )
+            self._evict()
+            self._conn.commit()
+
+    def revalidated(self, key):
+        """
+        Marca una entrada como vigente otra vez (respuesta 304 Not Modified).
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("UPDATE responses SET fetched_at = ?, accessed_at = ? WHERE key = ?", (now, now, key))
+            self._conn.commit()
+
+    def cached_pages(self, query, per_page, filters=None):
+        """
+        Números de página vigentes en caché para la búsqueda.
+        """
+        min_fetched = time.time() - self.ttl
+        with self._lock:
+            rows = self._conn.execute(
+                """SELECT page FROM responses
+                   WHERE query = ? AND per_page = ? AND filters = ? AND fetched_at >= ?
+                   ORDER BY page""",
+                (query, int(per_page), _filters_key(filters), min_fetched)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        rows = self._conn.execute("SELECT key, size FROM responses ORDER BY accessed_at").fetchall()
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            evicted += 1
+        logger.info(f"Caché de Pexels: {evicted} entradas eliminadas por tamaño (LRU).")
@@ -0,0 +1,144 @@
+import logging
+import os
+import threading
+import time
+
+import requests
+
+from file_utils import cache_path
+from metrics import metrics
+from pexels_cache import PexelsResponseCache, make_cache_key
+from rate_limit import AdaptivePacer
+
+logger = logging.getLogger()
+
+PEXELS_API_URL = os.environ.get("PEXELS_API_URL", "https://api.pexels.com")
+PEXELS_TIMEOUT = float(os.environ.get("PEXELS_TIMEOUT", "30"))
+
+# Caché de respuestas de búsqueda: vigencia (segundos) y tamaño máximo (bytes)
+PEXELS_CACHE_TTL = float(os.environ.get("PEXELS_CACHE_TTL", str(7 * 24 * 3600)))
+PEXELS_CACHE_MAX_BYTES = int(os.environ.get("PEXELS_CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+PEXELS_CACHE_FILE = 'pexels_cache.sqlite'
+
+# Ritmo adaptativo según las cabeceras X-Ratelimit-*; el estado se comparte entre corridas
+PEXELS_HOURLY_LIMIT = int(os.environ.get("PEXELS_HOURLY_LIMIT", "200"))
+PEXELS_RATE_RESERVE = float(os.environ.get("PEXELS_RATE_RESERVE", "0.1"))
+PEXELS_MAX_WAIT = float(os.environ.get("PEXELS_MAX_WAIT", "60"))
+# Intervalo entre corridas (el workflow corre tres veces por semana): reparte la reserva de la cuota mensual
+PEXELS_RUN_INTERVAL = float(os.environ.get("PEXELS_RUN_INTERVAL", str(2 * 24 * 3600)))
+PEXELS_RATELIMIT_FILE = 'pexels_ratelimit.json'
+PEXELS_MAX_RETRIES = 3
+
+
+class PexelsError(Exception):
+    pass
+
+
+class PexelsVideo:
+    """
+    Video de Pexels: cada clave del JSON queda como atributo (id, url, video_files, ...),
+    igual que los modelos de pypexels.
+    """
+
+    def __init__(self, data):
+        for key, value in data.items():
+            setattr(self, key, value)
+
+
+class VideoSearchPage:
+    """
+    Página de resultados de búsqueda de videos.
+    """
+
+    def __init__(self, body, from_cache=False):
+        self.body = body
+        self.from_cache = from_cache
+        self.page = int(body.get('page', 1))
+        self.per_page = int(body.get('per_page', 15))
+        self.total_results = int(body.get('total_results', 0))
+
+    @property
+    def entries(self):
+        for entry in self.body.get('videos', []):
+            yield PexelsVideo(entry)
+
+
+class PexelsClient:
+    """
+    Cliente mínimo de la API de videos de Pexels con caché persistente de búsquedas.
+    - Una página vigente en caché se entrega sin llamar a la API.
+    - Una página vencida con ETag se revalida con If-None-Match (304 = se reutiliza).
+    """
+
+    def __init__(self, api_key, cache=None, use_cache=True, pacer=None):
+        self.api_key = api_key
+        if cache is None and use_cache:
+            cache = PexelsResponseCache(cache_path(PEXELS_CACHE_FILE), PEXELS_CACHE_TTL, PEXELS_CACHE_MAX_BYTES)
+        self.cache = cache
+        if pacer is None:
+            pacer = AdaptivePacer(cache_path(PEXELS_RATELIMIT_FILE), PEXELS_HOURLY_LIMIT,
+                                  PEXELS_RATE_RESERVE, PEXELS_MAX_WAIT, PEXELS_RUN_INTERVAL)
+        self.pacer = pacer
+        self._local = threading.local()
+
+    def _session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.headers['Authorization'] = self.api_key or ''
+            self._local.session = session
+        return session
+
+    def _get(self, path, params, headers=None):
+        for attempt in range(PEXELS_MAX_RETRIES + 1):
+            self.pacer.wait()
+            start = time.perf_counter()
+            response = self._session().get(f"{PEXELS_API_URL}{path}", params=params, headers=headers or {},
+                                           timeout=PEXELS_TIMEOUT)
+            metrics.observe('pexels_request', time.perf_counter() - start)
+            metrics.count('api_calls', service='pexels', status=response.status_code)
+            self.pacer.update(response.headers)
+            if response.status_code != 429 or attempt == PEXELS_MAX_RETRIES:
+                return response
+            retry_after = response.headers.get('Retry-After')
+            wait = float(retry_after) if retry_after and retry_after.isdigit() else 2 ** (attempt + 1)
+            if wait > PEXELS_MAX_WAIT:
+                return response
+            logger.warning(f"Pexels respondió 429, se reintenta en {wait:.0f}s.")
+            metrics.count('retries', service='pexels')
+            time.sleep(wait)
+
+    def videos_search(self, query, page=1, per_page=15, **filters):
+        key = make_cache_key(query, page, per_page, filters)
+        cached = self.cache.get(key) if self.cache else None
+        if cached and cached['fresh']:
+            metrics.count('pexels_cache', result='hit')
+            logger.info(f"Búsqueda '{query}' página {page} obtenida de la caché local.")
+            return VideoSearchPage(cached['body'], from_cache=True)
+
+        headers = {}
+        if cached and cached['etag']:
+            headers['If-None-Match'] = cached['etag']
+        params = dict(filters, query=query, page=page, per_page=per_page)
+        response = self._get('/videos/search', params, headers)
+
+        if response.status_code == 304 and cached:
+            metrics.count('pexels_cache', result='revalidated')
+            logger.info(f"Búsqueda '{query}' página {page} revalidada (304), se reutiliza la caché.")
+            self.cache.revalidated(key)
+            return VideoSearchPage(cached['body'], from_cache=True)
+        if response.status_code != 200:
+            raise PexelsError(f"La búsqueda de Pexels falló con código {response.status_code}")
+
+        body = response.json()
+        if self.cache:
+            self.cache.put(query, page, per_page, filters, body, etag=response.headers.get('ETag'))
+        return VideoSearchPage(body)
+
+    def cached_pages(self, query, per_page, **filters):
+        """
+        Páginas de la búsqueda disponibles y vigentes en la caché local.
+        """
+        if not self.cache:
+            return []
+        return self.cache.cached_pages(query, per_page, filters)
@@ -0,0 +1,364 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+from file_utils import atomic_open
+from metrics import metrics
+
+logger = logging.getLogger()
+
+
+class TokenBucket:
+    """
+    Limitador de tasa tipo token bucket.
+    - 'rate' es la cantidad de tokens que se recargan por segundo.
+    - 'capacity' es el máximo de tokens acumulables (ráfaga permitida).
+    Es seguro para usarse desde varios hilos.
+    """
+
+    def __init__(self, rate, capacity):
+        if rate <= 0:
+            raise ValueError("rate debe ser mayor que 0")
+        self.rate = float(rate)
+        self.capacity = max(1.0, float(capacity))
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def acquire(self, tokens=1):
+        """
+        Bloquea hasta que haya 'tokens' disponibles y los consume.
+        Retorna el tiempo (en segundos) que se esperó.
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def get_host_bucket(url, rate, capacity):
+    """
+    Retorna el TokenBucket compartido para el host de 'url', creándolo si no existe.
+    Todas las descargas hacia un mismo host comparten el mismo límite.
+    """
+    host = urlparse(url).netloc
+    with _buckets_lock:
+        bucket = _buckets.get(host)
+        if bucket is None:
+            bucket = TokenBucket(rate, capacity)
+            _buckets[host] = bucket
+        return bucket
+
+
+class AsyncTokenBucket:
+    """
+    Versión para asyncio del token bucket: espera con asyncio.sleep sin bloquear
+    el event loop. asyncio se importa al crearlo, ya que solo lo usa el motor asíncrono.
+    """
+
+    def __init__(self, rate, capacity):
+        import asyncio
+
+        if rate <= 0:
+            raise ValueError("rate debe ser mayor que 0")
+        self.rate = float(rate)
+        self.capacity = max(1.0, float(capacity))
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens=1):
+        import asyncio
+
+        waited = 0.0
+        # El lock serializa a los que esperan para que se atiendan en orden de llegada
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+                wait = (tokens - self._tokens) / self.rate
+                await asyncio.sleep(wait)
+                waited += wait
+
+
+class QuotaExhaustedError(Exception):
+    pass
+
+
+class RunBudgetExhaustedError(Exception):
+    pass
+
+
+class AdaptivePacer:
+    """
+    Regula el ritmo de peticiones a una API según sus cabeceras de límite
+    (X-Ratelimit-Limit / X-Ratelimit-Remaining / X-Ratelimit-Reset).
+    - Mientras quede cuota holgada no se limita nada.
+    - Cuando lo restante baja de 'reserve_ratio' del límite, reparte lo que queda
+      entre las corridas que faltan hasta el reinicio (una cada 'run_interval'
+      segundos): esta corrida puede hacer a lo sumo esa parte y luego se detiene
+      con RunBudgetExhaustedError. Así una cuota mensual no se agota en una corrida
+      ni obliga a esperar minutos entre peticiones.
+    - Con la cuota en 0 se espera el reinicio si llega dentro de 'max_wait';
+      si no, se lanza QuotaExhaustedError.
+    - Además lleva la cuenta de peticiones de la última hora ('hourly_limit').
+    El estado se guarda en 'state_path' para que corridas consecutivas
+    compartan el mismo presupuesto.
+    """
+
+    def __init__(self, state_path, hourly_limit, reserve_ratio=0.1, max_wait=60, run_interval=2 * 24 * 3600):
+        self.state_path = state_path
+        self.hourly_limit = hourly_limit
+        self.reserve_ratio = reserve_ratio
+        self.max_wait = max_wait
+        self.run_interval = run_interval
+        self._lock = threading.Lock()
+        self._state = {'limit': None, 'remaining': None, 'reset': None, 'recent': [], 'last_request': 0}
+        # Presupuesto de esta corrida (solo en memoria): se fija al entrar en la reserva
+        self._run_budget = None
+        self._run_used = 0
+        if os.path.exists(state_path):
+            try:
+                with open(state_path, 'r', encoding='utf-8') as f:
+                    self._state.update(json.load(f))
+            except (OSError, ValueError) as e:
+                logger.warning(f"No se pudo leer el estado de límites en {state_path}: {e}")
+
+    def _save(self):
+        with atomic_open(self.state_path, 'w') as f:
+            json.dump(self._state, f)
+
+    def _delay(self, now):
+        state = self._state
+        state['recent'] = [t for t in state['recent'] if now - t < 3600]
+        delay = 0.0
+
+        # Ventana de una hora
+        if self.hourly_limit and len(state['recent']) >= self.hourly_limit:
+            delay = max(delay, 3600 - (now - state['recent'][0]))
+
+        # Cuota agotada: solo queda esperar el reinicio
+        remaining, reset = state['remaining'], state['reset']
+        if remaining is not None and remaining <= 0 and reset and reset > now:
+            delay = max(delay, reset - now)
+        return max(0.0, delay)
+
+    def _run_budget_left(self, now):
+        """
+        Peticiones que le quedan a esta corrida dentro de la reserva, o None si
+        la cuota está holgada.
+        """
+        limit, remaining, reset = self._state['limit'], self._state['remaining'], self._state['reset']
+        if not (limit and remaining and reset and reset > now and remaining < limit * self.reserve_ratio):
+            self._run_budget = None
+            return None
+        if self._run_budget is None:
+            runs_left = max(1.0, (reset - now) / self.run_interval)
+            self._run_budget = max(1, int(remaining / runs_left))
+            self._run_used = 0
+            logger.info(f"Cuota de la API en reserva ({remaining} de {limit}): esta corrida puede hacer "
+                        f"{self._run_budget} peticiones.")
+        return self._run_budget - self._run_used
+
+    def wait(self):
+        """
+        Espera lo necesario antes de la próxima petición y la registra.
+        Retorna los segundos esperados.
+        """
+        with self._lock:
+            now = time.time()
+            delay = self._delay(now)
+            if delay > self.max_wait:
+                if self._state['remaining'] is not None and self._state['remaining'] <= 0:
+                    raise QuotaExhaustedError(
+                        f"Cuota de la API agotada hasta "
+                        f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self._state['reset']))}."
+                    )
+                raise QuotaExhaustedError(f"Se requiere esperar {delay:.0f}s por límite de la API.")
+            if delay > 0:
+                logger.info(f"Cerca del límite de la API, se espera {delay:.1f}s antes de la próxima petición.")
+                time.sleep(delay)
+                now = time.time()
+            budget_left = self._run_budget_left(now)
+            if budget_left is not None and budget_left <= 0:
+                raise RunBudgetExhaustedError(
+                    f"Se usaron las {self._run_budget} peticiones asignadas a esta corrida; "
+                    f"quedan {self._state['remaining']} para las próximas."
+                )
+            if budget_left is not None:
+                self._run_used += 1
+            self._state['recent'].append(now)
+            self._state['last_request'] = now
+            return delay
+
+    def update(self, headers):
+        """
+        Actualiza el estado con las cabeceras de límite de una respuesta y lo persiste.
+        """
+        with self._lock:
+            for key, header in (('limit', 'X-Ratelimit-Limit'), ('remaining', 'X-Ratelimit-Remaining'),
+                                ('reset', 'X-Ratelimit-Reset')):
+                value = headers.get(header)
+                if value is not None and str(value).isdigit():
+                    self._state[key] = int(value)
+            try:
+                self._save()
+            except OSError as e:
+                logger.warning(f"No se pudo guardar el estado de límites en {self.state_path}: {e}")
+
+    @property
+    def remaining(self):
+        return self._state['remaining']
+
+
+class TransferSlot:
+    """
+    Resultado de una transferencia dentro de AdaptiveConcurrencyLimit.slot():
+    bytes movidos y si hubo un error transitorio (429/5xx o de red).
+    """
+
+    def __init__(self):
+        self.nbytes = 0
+        self.error = False
+
+
+class AdaptiveConcurrencyLimit:
+    """
+    Límite de concurrencia AIMD (aumento aditivo, disminución multiplicativa)
+    para transferencias en paralelo.
+    - Tras cada ventana de 'limit' transferencias exitosas, sube el límite en 1
+      si el rendimiento (bytes/s) mejoró respecto de la ventana anterior.
+    - Ante un error transitorio (429/5xx o de red) o un pico de latencia
+      (segundos por MiB mayores a 'latency_spike' veces el promedio), lo
+      multiplica por 'decrease'. Solo se reduce una vez por las transferencias
+      que ya estaban en curso, para no encadenar reducciones por la misma causa.
+    Cada cambio del límite queda en el log. Es seguro para usarse desde varios hilos.
+    """
+
+    def __init__(self, name, initial, maximum, minimum=1, decrease=0.5, latency_spike=3.0, improvement=0.05):
+        self.name = name
+        self.minimum = max(1, int(minimum))
+        self.maximum = max(self.minimum, int(maximum))
+        self.limit = min(self.maximum, max(self.minimum, int(initial)))
+        self.decrease = decrease
+        self.latency_spike = latency_spike
+        self.improvement = improvement
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._baseline = None
+        self._samples = 0
+        self._last_decrease = 0.0
+        self._last_throughput = None
+        self._reset_window(time.monotonic())
+
+    def _reset_window(self, now):
+        self._window_start = now
+        self._window_count = 0
+        self._window_bytes = 0
+
+    def _set_limit(self, new_limit, reason, now):
+        old, self.limit = self.limit, new_limit
+        if new_limit < old:
+            # Tras reducir, el rendimiento se vuelve a medir desde cero con el nuevo límite
+            self._last_decrease = now
+            self._last_throughput = None
+        self._reset_window(now)
+        self._cond.notify_all()
+        logger.info(f"Concurrencia de {self.name}: {old} -> {new_limit} ({reason}).")
+        metrics.count('concurrency_adjustments', limit=self.name, direction='up' if new_limit > old else 'down')
+
+    @contextmanager
+    def slot(self):
+        """
+        Espera un lugar libre, entrega un TransferSlot para informar el resultado
+        y al salir ajusta el límite. Una excepción cuenta como error transitorio.
+        """
+        with self._cond:
+            while self._in_flight >= self.limit:
+                self._cond.wait()
+            self._in_flight += 1
+        slot = TransferSlot()
+        started = time.monotonic()
+        try:
+            yield slot
+        except Exception:
+            slot.error = True
+            raise
+        finally:
+            self._release(slot, started)
+
+    def _release(self, slot, started):
+        now = time.monotonic()
+        # Costo normalizado para comparar clips chicos y archivos 4K: segundos por MiB (mínimo 1 MiB)
+        cost = (now - started) / max(slot.nbytes / (1024 * 1024), 1.0)
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify()
+            spike = (self._samples >= 3 and cost > self.latency_spike * self._baseline)
+            if slot.error or spike:
+                if started >= self._last_decrease and self.limit > self.minimum:
+                    reason = "error transitorio" if slot.error else f"pico de latencia ({cost:.2f}s/MiB)"
+                    self._set_limit(max(self.minimum, int(self.limit * self.decrease)), reason, now)
+                return
+
+            self._baseline = cost if self._baseline is None else 0.8 * self._baseline + 0.2 * cost
+            self._samples += 1
+            if started < self._window_start:
+                # Empezó con el límite anterior: no cuenta para el rendimiento de esta ventana
+                return
+            self._window_count += 1
+            self._window_bytes += slot.nbytes
+            if self._window_count < self.limit:
+                return
+            elapsed = max(now - self._window_start, 1e-6)
+            throughput = (self._window_bytes or self._window_count) / elapsed
+            improved = self._last_throughput is None or throughput > self._last_throughput * (1 + self.improvement)
+            self._last_throughput = throughput
+            if improved and self.limit < self.maximum:
+                rate = f"{throughput / (1024 * 1024):.1f} MiB/s" if self._window_bytes else f"{throughput:.1f}/s"
+                self._set_limit(self.limit + 1, f"rendimiento en aumento, {rate}", now)
+            else:
+                self._reset_window(now)
+
+
+_concurrency_limits = {}
+_concurrency_limits_lock = threading.Lock()
+
+
+def get_concurrency_limit(name, initial, maximum, minimum=1, adaptive=True):
+    """
+    Retorna el AdaptiveConcurrencyLimit compartido 'name', creándolo si no existe.
+    La primera llamada define sus parámetros; el límite aprendido se conserva
+    durante todo el proceso. Con 'adaptive' en False el límite queda fijo en 'initial'.
+    """
+    with _concurrency_limits_lock:
+        limit = _concurrency_limits.get(name)
+        if limit is None:
+            if not adaptive:
+                minimum = maximum = initial
+            limit = AdaptiveConcurrencyLimit(name, initial, max(initial, maximum), minimum)
+            _concurrency_limits[name] = limit
+        return limit
@@ -0,0 +1,57 @@
+import os
+
+# Política de selección de la versión (rendition) a descargar de cada video
+VIDEO_TARGET_HEIGHT = int(os.environ.get("VIDEO_TARGET_HEIGHT", "1080"))    # lado corto deseado, en píxeles
+VIDEO_ORIENTATION = os.environ.get("VIDEO_ORIENTATION", "").upper()         # '', 'HORIZONTAL' o 'VERTICAL'
+VIDEO_MAX_BYTES = int(os.environ.get("VIDEO_MAX_BYTES", "0"))               # 0 = sin límite
+VIDEO_FPS_POLICY = os.environ.get("VIDEO_FPS_POLICY", "any").lower()        # 'any', 'max30' o 'max60'
+
+_FPS_CAPS = {'max30': 30.5, 'max60': 60.5}
+
+
+def rendition_orientation(video_file):
+    return "VERTICAL" if video_file['height'] > video_file['width'] else "HORIZONTAL"
+
+
+def _weight_key(candidates):
+    # Tamaño en bytes si Pexels lo informa para todas las versiones; si no, píxeles como aproximación
+    if all(f.get('size') for f in candidates):
+        return lambda f: f['size']
+    return lambda f: f['width'] * f['height']
+
+
+def select_rendition(video_files, target_height=None, orientation=None, max_bytes=None, fps_policy=None):
+    """
+    Elige entre todas las versiones de un video la más liviana que cumpla el objetivo:
+    - Solo versiones mp4 con ancho, alto y link (si hay alguna mp4).
+    - 'orientation': 'HORIZONTAL' o 'VERTICAL' (vacío = cualquiera).
+    - 'fps_policy': 'max30' / 'max60' descartan versiones con más cuadros por segundo.
+    - 'max_bytes': descarta versiones cuyo tamaño informado lo supere (0 = sin límite).
+    - 'target_height': lado corto deseado; se elige la más liviana que lo alcance y,
+      si ninguna lo alcanza, la de mayor resolución disponible.
+    Retorna el diccionario de la versión elegida o None si ninguna cumple los filtros.
+    """
+    target_height = VIDEO_TARGET_HEIGHT if target_height is None else target_height
+    orientation = (VIDEO_ORIENTATION if orientation is None else orientation).upper()
+    max_bytes = VIDEO_MAX_BYTES if max_bytes is None else max_bytes
+    fps_policy = (VIDEO_FPS_POLICY if fps_policy is None else fps_policy).lower()
+
+    candidates = [f for f in video_files or [] if f.get('width') and f.get('height') and f.get('link')]
+    mp4 = [f for f in candidates if f.get('file_type') == 'video/mp4']
+    if mp4:
+        candidates = mp4
+    if orientation:
+        candidates = [f for f in candidates if rendition_orientation(f) == orientation]
+    fps_cap = _FPS_CAPS.get(fps_policy)
+    if fps_cap:
+        candidates = [f for f in candidates if not f.get('fps') or f['fps'] <= fps_cap]
+    if max_bytes:
+        candidates = [f for f in candidates if not f.get('size') or f['size'] <= max_bytes]
+    if not candidates:
+        return None
+
+    weight = _weight_key(candidates)
+    meets_target = [f for f in candidates if min(f['width'], f['height']) >= target_height]
+    if meets_target:
+        return min(meets_target, key=weight)
+    return max(candidates, key=lambda f: (min(f['width'], f['height']), -weight(f)))
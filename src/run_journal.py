@@ -0,0 +1,118 @@
+import json
+import logging
+import os
+import threading
+import time
+
+from file_utils import atomic_open, cache_path
+
+logger = logging.getLogger()
+
+RUN_JOURNAL_FILE = 'run_journal.json'
+
+# Estados de un video: los dos últimos indican que ya está en Drive
+VIDEO_PLANNED = 'planned'
+VIDEO_DOWNLOADED = 'downloaded'
+VIDEO_DEFERRED = 'deferred'     # repetido en la corrida; se enlaza cuando se suba el original
+VIDEO_UPLOADED = 'uploaded'
+VIDEO_LINKED = 'linked'         # acceso directo a un video que ya estaba en Drive
+_VIDEO_DONE = {VIDEO_UPLOADED, VIDEO_LINKED}
+
+# Estados de una palabra clave
+KEYWORD_PENDING = 'pending'
+KEYWORD_SEARCHED = 'searched'
+KEYWORD_EMPTY = 'empty'         # sin resultados en Pexels
+
+
+class RunJournal:
+    """
+    Bitácora de la corrida en curso: estado de cada palabra clave (pendiente,
+    buscada, sin resultados) y de cada video planificado (descargado, subido...).
+    Cada cambio se escribe de forma atómica, de modo que si el proceso falla a
+    mitad de camino la siguiente corrida retoma desde el último paso completado:
+    no vuelve a buscar las palabras ya buscadas ni a descargar o subir los
+    videos que ya terminaron. Al terminar la corrida con éxito se borra.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._data = {'started_at': time.time(), 'keywords': {}}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self._data = json.load(f)
+                logger.info(f"Se retoma la corrida anterior desde {path}.")
+            except (OSError, ValueError) as e:
+                logger.warning(f"No se pudo leer la bitácora {path}, se empieza de cero: {e}")
+
+    def _save(self):
+        self._data['updated_at'] = time.time()
+        with atomic_open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(self._data, f, ensure_ascii=False)
+
+    def _keyword(self, query):
+        return self._data['keywords'].setdefault(query, {'state': KEYWORD_PENDING, 'videos': {}})
+
+    def pending_keywords(self):
+        """
+        Palabras clave de una corrida anterior que no terminaron: sin buscar o con
+        algún video que todavía no está en Drive.
+        """
+        with self._lock:
+            return [q for q, entry in self._data['keywords'].items()
+                    if entry['state'] == KEYWORD_PENDING
+                    or (entry['state'] == KEYWORD_SEARCHED
+                        and any(v['state'] not in _VIDEO_DONE for v in entry['videos'].values()))]
+
+    def start(self, queries):
+        with self._lock:
+            for query in queries:
+                self._keyword(query)
+            self._save()
+
+    def planned(self, query):
+        """
+        Retorna los pendientes (url, ruta_local, nombre_archivo, pexels_id) ya planificados
+        para 'query' que aún no están en Drive, o None si la palabra no se buscó todavía.
+        """
+        with self._lock:
+            entry = self._data['keywords'].get(query)
+            if entry is None or entry['state'] == KEYWORD_PENDING:
+                return None
+            return [tuple(v['task']) for v in entry['videos'].values() if v['state'] not in _VIDEO_DONE]
+
+    def record_plan(self, query, pendientes):
+        with self._lock:
+            entry = self._keyword(query)
+            entry['state'] = KEYWORD_SEARCHED if pendientes is not None else KEYWORD_EMPTY
+            for task in pendientes or []:
+                entry['videos'].setdefault(task[2], {'task': list(task), 'state': VIDEO_PLANNED})
+            self._save()
+
+    def video_state(self, query, nombre_archivo):
+        with self._lock:
+            video = self._data['keywords'].get(query, {}).get('videos', {}).get(nombre_archivo)
+            return video['state'] if video else None
+
+    def mark_video(self, nombre_archivo, state, query=None):
+        """
+        Actualiza el estado de un video (en 'query' o en todas las palabras que lo planificaron).
+        """
+        with self._lock:
+            entries = [self._data['keywords'].get(query, {})] if query else self._data['keywords'].values()
+            for entry in entries:
+                video = entry.get('videos', {}).get(nombre_archivo)
+                if video is not None:
+                    video['state'] = state
+            self._save()
+
+    def finish(self):
+        with self._lock:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+        logger.info("Corrida completada, se elimina la bitácora.")
+
+
+def open_run_journal():
+    return RunJournal(cache_path(RUN_JOURNAL_FILE))
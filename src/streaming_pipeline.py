@@ -0,0 +1,86 @@
+import logging
+import queue
+import threading
+
+from google_drive import stream_upload_to_drive
+
+logger = logging.getLogger()
+
+# Marca de fin de stream en la cola
+_END = object()
+
+
+def _produce_chunks(response, chunk_queue, stop_event, chunk_size, hasher=None):
+    """
+    Lee la respuesta HTTP por bloques y los deja en la cola acotada.
+    Si la cola está llena, espera (backpressure) hasta que el subidor la vacíe
+    o hasta que se cancele la transferencia.
+    """
+    def put(item):
+        while not stop_event.is_set():
+            try:
+                chunk_queue.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    try:
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            if not chunk:
+                continue
+            if hasher is not None:
+                hasher.update(chunk)
+            if not put(chunk):
+                return
+        put(_END)
+    except Exception as e:
+        put(e)
+
+
+def _consume_chunks(chunk_queue):
+    while True:
+        item = chunk_queue.get()
+        if item is _END:
+            return
+        if isinstance(item, Exception):
+            raise item
+        yield item
+
+
+def transfer_response_to_drive(response, file_name, drive_folder_id, creds_env,
+                               chunk_size, upload_chunk_size, queue_chunks=8, app_properties=None, hasher=None):
+    """
+    Envía el cuerpo de 'response' (abierta con stream=True) directamente a Drive.
+    La descarga corre en un hilo productor y la subida en el hilo actual; ambos se
+    comunican mediante una cola de a lo sumo 'queue_chunks' bloques, por lo que la
+    memoria usada queda acotada y la descarga y la subida se solapan.
+    Si se pasa 'hasher', se actualiza con cada bloque descargado y el hash queda
+    en los appProperties ('sha256') del archivo subido.
+    Retorna el ID del archivo creado en Drive.
+    """
+    chunk_queue = queue.Queue(maxsize=queue_chunks)
+    stop_event = threading.Event()
+    producer = threading.Thread(
+        target=_produce_chunks,
+        args=(response, chunk_queue, stop_event, chunk_size, hasher),
+        daemon=True
+    )
+    producer.start()
+
+    content_length = response.headers.get('Content-Length')
+    total_size = int(content_length) if content_length and content_length.isdigit() else None
+    try:
+        return stream_upload_to_drive(
+            _consume_chunks(chunk_queue),
+            file_name,
+            drive_folder_id,
+            creds_env,
+            total_size=total_size,
+            chunk_size=upload_chunk_size,
+            app_properties=app_properties,
+            hasher=hasher
+        )
+    finally:
+        stop_event.set()
+        producer.join()
@@ -0,0 +1,367 @@
+import os
+import time
+import random
+import hashlib
+import logging
+import threading
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from renditions import select_rendition, rendition_orientation
+from dedup_store import get_dedup_store
+from run_journal import VIDEO_DOWNLOADED, VIDEO_DEFERRED, VIDEO_UPLOADED, VIDEO_LINKED
+from rate_limit import get_host_bucket, get_concurrency_limit, TransferSlot
+from file_utils import stream_response_to_file, DEFAULT_CHUNK_SIZE
+from metrics import metrics
+
+# Búsqueda, descarga y deduplicación de videos, compartidas por main.py y el motor
+# asíncrono (engine.py). El estado de la corrida (videos reclamados y accesos directos
+# pendientes) vive solo aquí, así ambos motores usan la misma instancia.
+
+logger = logging.getLogger()
+
+VIDEOS_FOLDER_ID = os.environ.get("VIDEOS_FOLDER_ID")
+GCP_CREDENTIALS_ENV = os.environ.get("GCP_CREDENTIALS")
+
+# Descargas concurrentes: número de workers y límite de peticiones por host
+DOWNLOAD_WORKERS = int(os.environ.get("DOWNLOAD_WORKERS", "4"))
+DOWNLOAD_RATE_PER_SEC = float(os.environ.get("DOWNLOAD_RATE_PER_SEC", "1"))
+DOWNLOAD_RATE_BURST = float(os.environ.get("DOWNLOAD_RATE_BURST", "4"))
+DOWNLOAD_CHUNK_SIZE = int(os.environ.get("DOWNLOAD_CHUNK_SIZE", str(DEFAULT_CHUNK_SIZE)))
+DOWNLOAD_TIMEOUT = float(os.environ.get("DOWNLOAD_TIMEOUT", "60"))
+# Concurrencia adaptativa (AIMD): parte de DOWNLOAD_WORKERS y se ajusta hasta DOWNLOAD_MAX_WORKERS
+ADAPTIVE_CONCURRENCY = os.environ.get("ADAPTIVE_CONCURRENCY", "1").lower() in ("1", "true", "yes")
+DOWNLOAD_MAX_WORKERS = int(os.environ.get("DOWNLOAD_MAX_WORKERS", "16"))
+
+# Modo pipeline: cada descarga se sube directamente a Drive sin pasar por ./temp_videos
+STREAM_TO_DRIVE = os.environ.get("STREAM_TO_DRIVE", "").lower() in ("1", "true", "yes")
+STREAM_UPLOAD_CHUNK_SIZE = int(os.environ.get("STREAM_UPLOAD_CHUNK_SIZE", str(8 * 1024 * 1024)))
+STREAM_QUEUE_CHUNKS = int(os.environ.get("STREAM_QUEUE_CHUNKS", "8"))
+
+# Deduplicación de videos por ID de Pexels y hash de contenido (accesos directos en vez de copias)
+USE_DEDUP = os.environ.get("USE_DEDUP", "1").lower() in ("1", "true", "yes")
+
+class StreamUploadError(Exception):
+    # La descarga empezó bien pero falló la subida a Drive del modo streaming
+    pass
+
+def obtener_videos(py_pexel, query, max_retries=3):
+    retries = 0
+    tried = set()
+    while retries < max_retries:
+        # En los reintentos se usan primero páginas vigentes en caché que aún no se probaron
+        cached = [p for p in py_pexel.cached_pages(query, per_page=4) if p not in tried] if retries else []
+        if cached:
+            page = cached[0]
+        else:
+            page = random.choice([p for p in range(1, 5) if p not in tried] or [1, 2, 3, 4])
+        tried.add(page)
+        with metrics.stage('pexels_search'):
+            search_videos_page = py_pexel.videos_search(query=query, page=page, per_page=4)
+        entries = list(search_videos_page.entries)
+        if len(entries) == 0:
+            logger.warning(f"No se encontraron videos para '{query}' en la página {page}. Reintentando...")
+            retries += 1
+        else:
+            logger.info(f"Se encontraron {len(entries)} videos para '{query}' en la página {page}.")
+            return search_videos_page
+    logger.error(f"No se encontraron videos para '{query}' después de {max_retries} intentos.")
+    return None
+
+_thread_local = threading.local()
+
+def _get_http_session():
+    # requests.Session no se comparte entre hilos; cada worker reutiliza la suya
+    session = getattr(_thread_local, 'session', None)
+    if session is None:
+        import requests
+        session = requests.Session()
+        _thread_local.session = session
+    return session
+
+# Videos reclamados en esta corrida (pexels_id -> nombre) y accesos directos pendientes de su subida
+_run_assets = {}
+_deferred_shortcuts = []
+_run_assets_lock = threading.Lock()
+
+def _find_uploaded(pexels_id=None, sha256=None):
+    """
+    Busca el video en el registro local de deduplicación y comprueba contra el índice
+    local de la carpeta que el archivo siga en Drive. Los registros cuyo archivo se
+    borró o se movió a la papelera se olvidan y se sigue buscando.
+    Los registros posteriores a la última sincronización del índice (subidas de esta
+    corrida) no se pueden comprobar y se usan tal cual.
+    """
+    from google_drive import get_folder_index, USE_DRIVE_INDEX
+
+    store = get_dedup_store()
+    index = None
+    synced_at = None
+    if USE_DRIVE_INDEX:
+        try:
+            index = get_folder_index(VIDEOS_FOLDER_ID, GCP_CREDENTIALS_ENV, sync=False)
+            synced_at = index.synced_at()
+        except Exception as e:
+            logger.warning(f"No se pudo consultar el índice local de Drive: {e}")
+    while True:
+        asset = store.find_uploaded(pexels_id=pexels_id, sha256=sha256)
+        if asset is None or synced_at is None or asset['updated_at'] > synced_at or index.has_file(asset['id']):
+            return asset
+        logger.info(f"El archivo {asset['name']} ya no está en Drive, se olvida del registro de deduplicación.")
+        store.forget_upload(asset['id'])
+
+def _find_existing_asset(pexels_id=None, sha256=None):
+    """
+    Busca un video ya subido con ese ID de Pexels o hash: primero en el registro local
+    de deduplicación y luego en los appProperties del índice local de la carpeta.
+    """
+    from google_drive import get_folder_index, USE_DRIVE_INDEX
+
+    asset = _find_uploaded(pexels_id=pexels_id, sha256=sha256)
+    if asset is None and USE_DRIVE_INDEX:
+        try:
+            index = get_folder_index(VIDEOS_FOLDER_ID, GCP_CREDENTIALS_ENV, sync=False)
+            asset = index.find_asset(pexels_id=pexels_id, sha256=sha256)
+        except Exception as e:
+            logger.warning(f"No se pudo consultar el índice local de Drive: {e}")
+    return asset
+
+def _link_to_asset(nombre_archivo, asset, pexels_id=None):
+    from google_drive import create_shortcut
+
+    app_properties = {'pexels_id': str(pexels_id)} if pexels_id is not None else None
+    create_shortcut(nombre_archivo, asset['id'], VIDEOS_FOLDER_ID, GCP_CREDENTIALS_ENV, app_properties)
+    logger.info(f"El video {nombre_archivo} ya existe en Drive como {asset['name']}, se creó un acceso directo.")
+
+def _claim_or_link(nombre_archivo, pexels_id):
+    """
+    Si el video ya se obtuvo (en Drive o en esta misma corrida) y no hay que descargarlo,
+    retorna VIDEO_LINKED o VIDEO_DEFERRED; si no, None.
+    """
+    if pexels_id is None:
+        return None
+    asset = _find_existing_asset(pexels_id=pexels_id)
+    if asset is not None and asset['name'] != nombre_archivo:
+        _link_to_asset(nombre_archivo, asset, pexels_id)
+        return VIDEO_LINKED
+    with _run_assets_lock:
+        owner = _run_assets.setdefault(str(pexels_id), nombre_archivo)
+        if owner != nombre_archivo:
+            # Otra palabra clave ya lo está descargando: enlazarlo cuando termine de subirse
+            _deferred_shortcuts.append((nombre_archivo, str(pexels_id)))
+            logger.info(f"El video {nombre_archivo} se descarga en esta corrida como {owner}, se enlazará al subirlo.")
+            return VIDEO_DEFERRED
+    return None
+
+def link_deferred_shortcuts():
+    """
+    Crea los accesos directos de los videos repetidos entre palabras clave de esta corrida,
+    una vez que el original ya se subió a Drive.
+    """
+    from google_drive import create_shortcuts
+
+    with _run_assets_lock:
+        pending = list(_deferred_shortcuts)
+        _deferred_shortcuts.clear()
+    shortcuts = []
+    for nombre_archivo, pexels_id in pending:
+        asset = _find_uploaded(pexels_id=pexels_id)
+        if asset is None:
+            logger.warning(f"No se encontró en Drive el original de {nombre_archivo}, no se crea el acceso directo.")
+            continue
+        shortcuts.append((nombre_archivo, asset['id'], {'pexels_id': str(pexels_id)}))
+    if not shortcuts:
+        return
+    # Todos los accesos directos en lotes de hasta 100 operaciones por petición
+    try:
+        create_shortcuts(shortcuts, VIDEOS_FOLDER_ID, GCP_CREDENTIALS_ENV)
+    except Exception as e:
+        logger.warning(f"No se pudieron crear los accesos directos: {e}")
+
+def download_video_file(data_url, file_path, nombre_archivo, pexels_id=None, stream_to_drive=False, rate_limited=True,
+                         limit=None):
+    """
+    Descarga un video (o lo transfiere directo a Drive en modo streaming).
+    Retorna el estado resultante (VIDEO_DOWNLOADED, VIDEO_UPLOADED, VIDEO_LINKED o
+    VIDEO_DEFERRED) o False si no se pudo descargar.
+    Con 'limit' (AdaptiveConcurrencyLimit) la transferencia espera un lugar libre
+    e informa sus bytes y errores para ajustar la concurrencia.
+    """
+    claimed = _claim_or_link(nombre_archivo, pexels_id) if USE_DEDUP else None
+    if claimed:
+        return claimed
+
+    # Respetar el límite de peticiones por host antes de descargar
+    # (el motor asíncrono aplica su propio limitador y pasa rate_limited=False)
+    bucket = get_host_bucket(data_url, DOWNLOAD_RATE_PER_SEC, DOWNLOAD_RATE_BURST)
+    waited = bucket.acquire() if rate_limited else 0
+    if waited > 0:
+        logger.info(f"Límite de tasa alcanzado, se esperó {waited:.2f}s antes de descargar {nombre_archivo}.")
+
+    # Descargar en bloques directamente a disco para no retener el video completo en memoria
+    # (el hash SHA-256 se calcula sobre los mismos bloques, sin releer el archivo)
+    hasher = hashlib.sha256()
+    app_properties = {'pexels_id': str(pexels_id)} if pexels_id is not None else None
+    start = time.perf_counter()
+    with (limit.slot() if limit is not None else nullcontext(TransferSlot())) as slot, \
+            _get_http_session().get(data_url, stream=True, timeout=DOWNLOAD_TIMEOUT) as r:
+        rcod = r.status_code
+        slot.error = rcod == 429 or rcod >= 500
+        if 200 <= rcod < 300 and stream_to_drive:
+            from streaming_pipeline import transfer_response_to_drive
+
+            # Los bloques descargados alimentan la sesión de subida reanudable de Drive
+            try:
+                file_id = transfer_response_to_drive(
+                    r, nombre_archivo, VIDEOS_FOLDER_ID, GCP_CREDENTIALS_ENV,
+                    chunk_size=DOWNLOAD_CHUNK_SIZE,
+                    upload_chunk_size=STREAM_UPLOAD_CHUNK_SIZE,
+                    queue_chunks=STREAM_QUEUE_CHUNKS,
+                    app_properties=app_properties,
+                    hasher=hasher
+                )
+            except Exception as e:
+                slot.error = True
+                raise StreamUploadError(f"No se pudo transferir {nombre_archivo} a Drive: {e}") from e
+            slot.nbytes = int(r.headers.get('Content-Length') or 0)
+            logger.info(f"Video {nombre_archivo} transferido de Pexels a Drive con ID: {file_id}.")
+            metrics.observe('transfer', time.perf_counter() - start)
+            store = get_dedup_store()
+            store.record_download(nombre_archivo, pexels_id, hasher.hexdigest())
+            store.record_upload(nombre_archivo, file_id)
+            return VIDEO_UPLOADED
+        if 200 <= rcod < 300:
+            written = stream_response_to_file(r, file_path, chunk_size=DOWNLOAD_CHUNK_SIZE, hasher=hasher)
+            metrics.observe('download', time.perf_counter() - start, written)
+            slot.nbytes = written
+            logger.info(f"Video {nombre_archivo} descargado correctamente en {file_path} ({written} bytes).")
+            sha256 = hasher.hexdigest()
+            asset = _find_existing_asset(sha256=sha256) if USE_DEDUP else None
+            if asset is not None and asset['name'] != nombre_archivo:
+                # Mismo contenido con otro ID u otra versión: no se sube una copia
+                os.remove(file_path)
+                _link_to_asset(nombre_archivo, asset, pexels_id)
+                return VIDEO_LINKED
+            get_dedup_store().record_download(nombre_archivo, pexels_id, sha256)
+            return VIDEO_DOWNLOADED
+    metrics.count('download_errors', status=rcod)
+    logger.warning(f"No se pudo descargar {nombre_archivo}. Código: {rcod}")
+    return False
+
+def _video_file_name(prefijo, query, video_file, slug):
+    if not video_file.get('width') or not video_file.get('height'):
+        return None
+    resolution = f"{video_file['width']}x{video_file['height']}"
+    return f"{prefijo}{query}_{resolution}_{rendition_orientation(video_file)}_{slug}.mp4"
+
+def plan_downloads(search_videos_page, videos_en_drive, query, prefijo='', verbose=True, stream_to_drive=False):
+    """
+    Arma el nombre de archivo de cada video de la página y decide cuáles hay que descargar.
+    Retorna (archvi, pendientes) donde 'pendientes' es una lista de
+    (url, ruta_local, nombre_archivo, pexels_id).
+    """
+    archvi = []
+    download_folder = './temp_videos'
+    if not stream_to_drive and not os.path.exists(download_folder):
+        os.makedirs(download_folder, exist_ok=True)
+        logger.info(f"Carpeta {download_folder} creada.")
+
+    pendientes = []
+    for i, video in enumerate(search_videos_page.entries):
+        video_files = video.video_files
+        if not video_files:
+            logger.warning(f"No se encontraron video_files para el video {video.id}")
+            continue
+
+        slug = video.url.split('/')[-2]
+        # Antes se descargaba siempre video_files[0]: los videos subidos con ese nombre
+        # siguen contando como existentes aunque ahora se elija otra versión
+        legacy_name = _video_file_name(prefijo, query, video_files[0], slug)
+        if legacy_name in videos_en_drive:
+            archvi.append(legacy_name)
+            logger.info(f"El video {legacy_name} ya existe en Drive, se omite descarga.")
+            continue
+
+        # Elegir la versión más liviana que cumpla la resolución, orientación, tamaño y fps objetivo
+        best_file = select_rendition(video_files)
+        if best_file is None:
+            logger.info(f"Ninguna versión del video {video.id} cumple los criterios de selección, se omite.")
+            continue
+
+        # Incluir el concepto, resolución y orientación en el nombre del archivo
+        nombre_archivo = _video_file_name(prefijo, query, best_file, slug)
+        archvi.append(nombre_archivo)
+
+        # Verificar si ya existe en Drive
+        if nombre_archivo in videos_en_drive:
+            logger.info(f"El video {nombre_archivo} ya existe en Drive, se omite descarga.")
+            continue
+
+        if verbose:
+            logger.info(f"Descargando {nombre_archivo}")
+
+        file_path = os.path.join(download_folder, nombre_archivo)
+        pendientes.append((best_file['link'], file_path, nombre_archivo, video.id))
+
+    return archvi, pendientes
+
+def download_pending(pendientes, query=None, max_workers=None, stream_to_drive=None, journal=None,
+                     upload_errors=None):
+    """
+    Descarga en paralelo los videos pendientes (url, ruta_local, nombre_archivo, pexels_id).
+    Con 'journal', omite los que una corrida anterior ya dejó descargados en disco y
+    registra el estado de cada video al terminar.
+    En modo streaming, los videos cuya subida falló se agregan a 'upload_errors'.
+    Retorna True si algún video quedó descargado, subido o enlazado.
+    """
+    if stream_to_drive is None:
+        stream_to_drive = STREAM_TO_DRIVE
+    nueva_info = False
+    por_descargar = []
+    for p in pendientes:
+        if (journal is not None and journal.video_state(query, p[2]) == VIDEO_DOWNLOADED
+                and os.path.exists(p[1])):
+            logger.info(f"El video {p[2]} ya se descargó en una corrida anterior, se omite descarga.")
+            nueva_info = True
+        else:
+            por_descargar.append(p)
+    if por_descargar and not stream_to_drive:
+        os.makedirs(os.path.dirname(por_descargar[0][1]), exist_ok=True)
+
+    # Descargar en paralelo: el límite adaptativo (compartido entre palabras clave)
+    # decide cuántas transferencias corren a la vez dentro del pool
+    workers = max_workers or DOWNLOAD_WORKERS
+    limit = get_concurrency_limit('descargas', workers, DOWNLOAD_MAX_WORKERS, adaptive=ADAPTIVE_CONCURRENCY)
+    if por_descargar:
+        with ThreadPoolExecutor(max_workers=min(limit.maximum, len(por_descargar))) as executor:
+            futures = {executor.submit(download_video_file, *p, stream_to_drive=stream_to_drive, limit=limit): p[2]
+                       for p in por_descargar}
+            for future in as_completed(futures):
+                try:
+                    state = future.result()
+                except StreamUploadError as e:
+                    logger.error(str(e))
+                    if upload_errors is not None:
+                        upload_errors.append(futures[future])
+                    continue
+                except Exception as e:
+                    logger.warning(f"No se pudo descargar {futures[future]}: {e}")
+                    continue
+                if state:
+                    nueva_info = True
+                    if journal is not None:
+                        journal.mark_video(futures[future], state, query)
+    return nueva_info
+
+def download_vids(search_videos_page, videos_en_drive, query, prefijo='', verbose=True, max_workers=None,
+                  stream_to_drive=None, journal=None, upload_errors=None):
+    logger.info("Iniciando descarga de videos.")
+    if stream_to_drive is None:
+        stream_to_drive = STREAM_TO_DRIVE
+    archvi, pendientes = plan_downloads(search_videos_page, videos_en_drive, query, prefijo, verbose, stream_to_drive)
+    if journal is not None:
+        journal.record_plan(query, pendientes)
+
+    nueva_info = download_pending(pendientes, query, max_workers, stream_to_drive, journal, upload_errors)
+
+    logger.info("Descarga de videos finalizada.")
+    return archvi, nueva_info
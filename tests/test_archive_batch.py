@@ -0,0 +1,28 @@
+import pytest
+
+import file_utils
+import generate_video_archives as archives
+from keyword_store import KeywordHistory
+
+
+@pytest.fixture
+def batch_mode(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_utils, 'CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(archives, 'DOCS_BATCH_MODE', True)
+    history = KeywordHistory(str(tmp_path / 'keywords_history.jsonl'))
+    for ts, doc in enumerate(['guion_00', 'guion_01', 'guion_02', 'guion_01'], start=1):
+        history.append(doc, [f"{doc}_v{ts}"], ts=ts)
+    return history
+
+
+def test_first_run_archives_only_the_latest_document(batch_mode):
+    assert [e['doc'] for e in archives.documents_to_archive(batch_mode)] == ['guion_01']
+
+
+def test_batch_archives_every_document_since_the_checkpoint(batch_mode):
+    archives.save_archive_checkpoint(1)
+    entries = archives.documents_to_archive(batch_mode)
+    # guion_01 se volvió a procesar: vale su última entrada, en el orden de esa entrada
+    assert [(e['doc'], e['words']) for e in entries] == [('guion_02', ['guion_02_v3']), ('guion_01', ['guion_01_v4'])]
+    archives.save_archive_checkpoint(entries[-1]['ts'])
+    assert archives.documents_to_archive(batch_mode) == []
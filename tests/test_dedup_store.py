@@ -0,0 +1,43 @@
+import google_drive
+import video_downloads
+from dedup_store import DedupStore
+from drive_index import DriveFolderIndex
+
+
+def make_index(tmp_path, files, synced_at=0.0):
+    index = DriveFolderIndex(str(tmp_path / 'index.sqlite'), 'videos')
+    with index._lock:
+        index._set_meta(index._synced_key, repr(synced_at))
+        for file in files:
+            index._upsert(file)
+        index._conn.commit()
+    return index
+
+
+def use_stores(monkeypatch, store, index):
+    monkeypatch.setattr(video_downloads, 'get_dedup_store', lambda: store)
+    monkeypatch.setattr(google_drive, 'USE_DRIVE_INDEX', True)
+    monkeypatch.setattr(google_drive, 'get_folder_index', lambda *args, **kwargs: index)
+
+
+def test_stale_record_falls_back_to_index(tmp_path, monkeypatch):
+    store = DedupStore(str(tmp_path / 'dedup.sqlite'))
+    store.record_download('a.mp4', 7, 'h1')
+    store.record_upload('a.mp4', 'borrado')
+    store._conn.execute("UPDATE assets SET updated_at = 0")
+    index = make_index(tmp_path, [{'id': 'copia', 'name': 'b.mp4', 'appProperties': {'pexels_id': '7'}}], synced_at=1.0)
+    use_stores(monkeypatch, store, index)
+
+    assert video_downloads._find_existing_asset(pexels_id=7) == {'id': 'copia', 'name': 'b.mp4'}
+    # El registro se olvidó: la próxima búsqueda no vuelve a devolver el archivo borrado
+    assert store.find_uploaded(pexels_id=7) is None
+
+
+def test_records_newer_than_sync_are_trusted(tmp_path, monkeypatch):
+    store = DedupStore(str(tmp_path / 'dedup.sqlite'))
+    store.record_download('a.mp4', 7, 'h1')
+    store.record_upload('a.mp4', 'nuevo')
+    index = make_index(tmp_path, [])
+    use_stores(monkeypatch, store, index)
+
+    assert video_downloads._find_existing_asset(pexels_id=7)['id'] == 'nuevo'
@@ -0,0 +1,79 @@
+import re
+
+import pytest
+
+import file_utils
+import google_drive
+import main
+
+
+class FakeDocsFolder:
+    """
+    files().list mínimo sobre una lista de documentos: filtro 'modifiedTime >',
+    orden por modifiedTime y paginación.
+    """
+
+    def __init__(self, modified_times):
+        self.docs = [{'id': f"doc{i:02d}", 'name': f"guion_{i:02d}", 'modifiedTime': t}
+                     for i, t in enumerate(modified_times)]
+
+    def files(self):
+        return self
+
+    def list(self, q, orderBy, pageSize, fields, pageToken=None):
+        since = re.search(r"modifiedTime > '([^']+)'", q)
+        docs = [d for d in self.docs if not since or d['modifiedTime'] > since.group(1)]
+        docs.sort(key=lambda d: d['modifiedTime'], reverse=orderBy.endswith('desc'))
+        start = int(pageToken or 0)
+        response = {'files': docs[start:start + pageSize]}
+        if start + pageSize < len(docs):
+            response['nextPageToken'] = str(start + pageSize)
+        self.response = response
+        return self
+
+    def execute(self):
+        return self.response
+
+
+def timestamp(minute):
+    return f"2026-10-01T10:{minute:02d}:00.000Z"
+
+
+@pytest.fixture
+def batch_mode(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_utils, 'CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(main, 'DOCS_BATCH_MODE', True)
+    monkeypatch.setattr(main, 'DOCS_BATCH_MAX', 3)
+    monkeypatch.setattr(google_drive, 'get_doc_words', lambda doc_id, creds_env: [doc_id])
+    main.save_docs_checkpoint('2026-01-01T00:00:00.000Z')
+
+    def use_folder(folder):
+        monkeypatch.setattr(google_drive, 'get_service', lambda *args, **kwargs: folder)
+    return use_folder
+
+
+def run_until_caught_up(max_runs=20):
+    processed = []
+    for _ in range(max_runs):
+        docs, checkpoint = main.fetch_docs_words()
+        if not docs:
+            return processed
+        processed.extend(name for name, _ in docs)
+        main.save_docs_checkpoint(checkpoint)
+    raise AssertionError("El checkpoint no terminó de avanzar")
+
+
+def test_backlog_larger_than_batch_is_processed_over_several_runs(batch_mode):
+    folder = FakeDocsFolder([timestamp(m) for m in range(10)])
+    batch_mode(folder)
+    processed = run_until_caught_up()
+    assert processed == [d['name'] for d in folder.docs]
+
+
+def test_batch_is_not_cut_between_documents_with_the_same_modified_time(batch_mode):
+    # El tercero y el cuarto comparten modifiedTime: el primer lote termina antes de ellos
+    folder = FakeDocsFolder([timestamp(0), timestamp(1), timestamp(2), timestamp(2), timestamp(3)])
+    batch_mode(folder)
+    first, _ = main.fetch_docs_words()
+    assert [name for name, _ in first] == ['guion_00', 'guion_01']
+    assert sorted(run_until_caught_up()) == [d['name'] for d in folder.docs]
@@ -0,0 +1,72 @@
+import time
+
+import pytest
+
+import rate_limit
+from rate_limit import AdaptivePacer, QuotaExhaustedError, RunBudgetExhaustedError
+
+DAY = 24 * 3600
+
+
+def monthly_pacer(tmp_path, remaining, reset_in, limit=20000, max_wait=60):
+    pacer = AdaptivePacer(str(tmp_path / 'ratelimit.json'), hourly_limit=0, reserve_ratio=0.1,
+                          max_wait=max_wait, run_interval=2 * DAY)
+    pacer.update({'X-Ratelimit-Limit': str(limit), 'X-Ratelimit-Remaining': str(remaining),
+                  'X-Ratelimit-Reset': str(int(time.time() + reset_in))})
+    return pacer
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    calls = []
+    monkeypatch.setattr(rate_limit.time, 'sleep', calls.append)
+    return calls
+
+
+def test_reserve_of_monthly_quota_is_split_across_runs(tmp_path, sleeps):
+    # 1999 de 20000 con el reinicio a 15 días: 7,5 corridas restantes -> 266 peticiones por corrida
+    pacer = monthly_pacer(tmp_path, remaining=1999, reset_in=15 * DAY)
+    for _ in range(266):
+        assert pacer.wait() == 0
+    with pytest.raises(RunBudgetExhaustedError):
+        pacer.wait()
+    assert sleeps == []
+
+
+def test_next_run_gets_a_new_share(tmp_path, sleeps):
+    monthly_pacer(tmp_path, remaining=1999, reset_in=15 * DAY)
+    # Una corrida posterior (pacer nuevo sobre el mismo estado) recalcula su parte
+    pacer = monthly_pacer(tmp_path, remaining=1733, reset_in=13 * DAY)
+    for _ in range(266):
+        pacer.wait()
+    with pytest.raises(RunBudgetExhaustedError):
+        pacer.wait()
+
+
+def test_ample_quota_is_not_limited(tmp_path, sleeps):
+    pacer = monthly_pacer(tmp_path, remaining=15000, reset_in=15 * DAY)
+    for _ in range(1000):
+        assert pacer.wait() == 0
+    assert sleeps == []
+
+
+def test_last_run_before_reset_can_use_the_whole_reserve(tmp_path, sleeps):
+    pacer = monthly_pacer(tmp_path, remaining=50, reset_in=DAY)
+    for _ in range(50):
+        pacer.wait()
+    with pytest.raises(RunBudgetExhaustedError):
+        pacer.wait()
+
+
+def test_exhausted_quota_raises_when_reset_is_far(tmp_path, sleeps):
+    pacer = monthly_pacer(tmp_path, remaining=0, reset_in=15 * DAY)
+    with pytest.raises(QuotaExhaustedError):
+        pacer.wait()
+    assert sleeps == []
+
+
+def test_exhausted_quota_waits_for_a_close_reset(tmp_path, sleeps):
+    pacer = monthly_pacer(tmp_path, remaining=0, reset_in=30)
+    waited = pacer.wait()
+    assert 0 < waited <= 30
+    assert sleeps == [waited]